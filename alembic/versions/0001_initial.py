@@ -0,0 +1,49 @@
+"""Исходная таблица teas
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 10:00:00
+
+Схема, которую до сих пор создавал populate_db.py через create_all.
+На уже существующей базе не выполняйте, а отметьте: `alembic stamp 0001`.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "teas",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(length=200), nullable=False),
+        sa.Column("category", sa.String(length=100), nullable=False),
+        sa.Column("origin", sa.String(length=150), nullable=True),
+        sa.Column("description", sa.Text(), nullable=True),
+        sa.Column("price", sa.Numeric(10, 2), nullable=False),
+        sa.Column("weight", sa.Numeric(10, 2), nullable=True),
+        sa.Column("photo_url", sa.String(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index("ix_teas_id", "teas", ["id"])
+    op.create_index("ix_teas_name", "teas", ["name"], unique=True)
+    op.create_index("ix_teas_category", "teas", ["category"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_teas_category", table_name="teas")
+    op.drop_index("ix_teas_name", table_name="teas")
+    op.drop_index("ix_teas_id", table_name="teas")
+    op.drop_table("teas")
@@ -0,0 +1,53 @@
+"""Цена за грамм и индексы фасетных фильтров
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 10:30:00
+
+price_per_gram — stored generated column: Postgres пересчитывает её при каждой
+записи price/weight. Все индексы частичные (WHERE is_active) — каталог читает
+только активные товары.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVE_INDEXES = {
+    "ix_teas_active_category_price": ["category", "price"],
+    "ix_teas_active_category_ppg": ["category", "price_per_gram"],
+    "ix_teas_active_price": ["price"],
+    "ix_teas_active_ppg": ["price_per_gram"],
+    "ix_teas_active_origin_price": ["origin", "price"],
+    "ix_teas_active_weight": ["weight"],
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "teas",
+        sa.Column(
+            "price_per_gram",
+            sa.Numeric(12, 4),
+            sa.Computed("price / NULLIF(weight, 0)", persisted=True),
+            nullable=True,
+        ),
+    )
+    for name, columns in ACTIVE_INDEXES.items():
+        op.create_index(name, "teas", columns, postgresql_where=sa.text("is_active"))
+    op.execute("ANALYZE teas")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name in ACTIVE_INDEXES:
+        op.drop_index(name, table_name="teas")
+    op.drop_column("teas", "price_per_gram")
@@ -0,0 +1,44 @@
+"""Счётчики фасетов tea_facets
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 12:00:00
+
+Число активных товаров по категориям и происхождению. Дальше счётчики
+меняются инкрементально в app/crud.py, здесь — только начальное заполнение.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "tea_facets",
+        sa.Column("kind", sa.String(length=20), primary_key=True),
+        sa.Column("value", sa.String(length=150), primary_key=True),
+        sa.Column("count", sa.Integer(), nullable=False),
+    )
+    op.execute(
+        "INSERT INTO tea_facets (kind, value, count) "
+        "SELECT 'category', category, count(*) FROM teas WHERE is_active GROUP BY category"
+    )
+    op.execute(
+        "INSERT INTO tea_facets (kind, value, count) "
+        "SELECT 'origin', origin, count(*) FROM teas "
+        "WHERE is_active AND origin IS NOT NULL GROUP BY origin"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("tea_facets")
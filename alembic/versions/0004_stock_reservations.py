@@ -0,0 +1,51 @@
+"""Остатки товаров и резервы под заказы
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 14:00:00
+
+teas.stock — свободный остаток (NULL — не ведётся). stock_reservations —
+резервы оформляемых заказов; частичный индекс по expires_at нужен только
+для живых (held) резервов, которые чистит release_expired_reservations.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("teas", sa.Column("stock", sa.Integer(), nullable=True))
+    op.create_check_constraint("ck_teas_stock_non_negative", "teas", "stock >= 0")
+    op.create_table(
+        "stock_reservations",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("order_number", sa.String(length=16), nullable=False),
+        sa.Column("tea_id", sa.Integer(), sa.ForeignKey("teas.id"), nullable=False),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index("ix_stock_reservations_order_number", "stock_reservations", ["order_number"])
+    op.create_index(
+        "ix_stock_reservations_held_expires", "stock_reservations", ["expires_at"],
+        postgresql_where=sa.text("status = 'held'"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_stock_reservations_held_expires", table_name="stock_reservations")
+    op.drop_index("ix_stock_reservations_order_number", table_name="stock_reservations")
+    op.drop_table("stock_reservations")
+    op.drop_constraint("ck_teas_stock_non_negative", "teas", type_="check")
+    op.drop_column("teas", "stock")
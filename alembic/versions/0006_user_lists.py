@@ -0,0 +1,35 @@
+"""Избранное и недавно просмотренные
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 18:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "user_lists",
+        sa.Column("user_id", sa.BigInteger(), primary_key=True),
+        sa.Column("favorites", postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.Column("recent", postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("user_lists")
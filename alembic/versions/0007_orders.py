@@ -0,0 +1,65 @@
+"""Заказы, строки заказов и сохранённые контакты
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 20:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "checkout_profiles",
+        sa.Column("user_id", sa.BigInteger(), primary_key=True),
+        sa.Column("fio", sa.String(length=500), nullable=False),
+        sa.Column("address", sa.String(length=500), nullable=False),
+        sa.Column("phone", sa.String(length=500), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_table(
+        "orders",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("order_number", sa.String(length=16), nullable=False, unique=True),
+        sa.Column("user_id", sa.BigInteger(), nullable=False),
+        sa.Column("fio", sa.String(length=500), nullable=False),
+        sa.Column("address", sa.String(length=500), nullable=False),
+        sa.Column("phone", sa.String(length=500), nullable=False),
+        sa.Column("comment", sa.Text(), nullable=True),
+        sa.Column("promo_code", sa.String(length=50), nullable=True),
+        sa.Column("subtotal", sa.Numeric(10, 2), nullable=False),
+        sa.Column("discount", sa.Numeric(10, 2), nullable=False),
+        sa.Column("total", sa.Numeric(10, 2), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index("ix_orders_user_id", "orders", ["user_id"])
+    op.create_table(
+        "order_items",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("order_id", sa.Integer(), sa.ForeignKey("orders.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("tea_id", sa.Integer(), sa.ForeignKey("teas.id"), nullable=False),
+        sa.Column("name", sa.String(length=200), nullable=False),
+        sa.Column("price", sa.Numeric(10, 2), nullable=False),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+    )
+    op.create_index("ix_order_items_order_id", "order_items", ["order_id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_order_items_order_id", table_name="order_items")
+    op.drop_table("order_items")
+    op.drop_index("ix_orders_user_id", table_name="orders")
+    op.drop_table("orders")
+    op.drop_table("checkout_profiles")
@@ -0,0 +1,59 @@
+"""События воронки продаж и дневные сводки
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 22:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008"
+down_revision: Union[str, None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "funnel_events",
+        sa.Column("id", sa.BigInteger(), primary_key=True),
+        sa.Column("occurred_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("user_id", sa.BigInteger(), nullable=False),
+        sa.Column("event", sa.String(length=32), nullable=False),
+        sa.Column("tea_id", sa.Integer(), nullable=True),
+    )
+    op.create_index("ix_funnel_events_occurred_at", "funnel_events", ["occurred_at"])
+    op.create_table(
+        "funnel_daily",
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("event", sa.String(length=32), primary_key=True),
+        sa.Column("events", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("users", sa.BigInteger(), nullable=False, server_default="0"),
+    )
+    op.create_table(
+        "funnel_daily_users",
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("event", sa.String(length=32), primary_key=True),
+        sa.Column("user_id", sa.BigInteger(), primary_key=True),
+    )
+    op.create_table(
+        "tea_views_daily",
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("tea_id", sa.Integer(), primary_key=True),
+        sa.Column("views", sa.BigInteger(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("tea_views_daily")
+    op.drop_table("funnel_daily_users")
+    op.drop_table("funnel_daily")
+    op.drop_index("ix_funnel_events_occurred_at", table_name="funnel_events")
+    op.drop_table("funnel_events")
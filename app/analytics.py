@@ -0,0 +1,88 @@
+# app/analytics.py
+"""
+События воронки продаж: каталог → карточка → в корзину → оформление → заказ.
+
+Обработчик бота только кладёт событие в кольцевой буфер в памяти (emit — без
+БД и без await), фоновая задача раз в несколько секунд пишет накопленное
+в Postgres пачками (crud.save_funnel_events: многострочный INSERT сырых событий
+и инкремент дневных сводок в той же транзакции). Если БД недоступна или события
+идут быстрее записи, буфер не растёт бесконечно: старые события вытесняются
+и считаются в dropped.
+"""
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Шаги воронки по порядку
+CATALOG = "catalog"
+CARD = "card"
+CART_ADD = "cart_add"
+CHECKOUT = "checkout"
+ORDER = "order"
+FUNNEL_STEPS = (CATALOG, CARD, CART_ADD, CHECKOUT, ORDER)
+
+MAX_BUFFERED_EVENTS = 50_000   # событий в памяти; при переполнении вытесняются старые
+FLUSH_BATCH = 1000             # событий в одной транзакции записи
+# Сколько дней хранить сырые события и отметки уникальных пользователей (сводки — всегда);
+# на столько же дней назад отчёт воронки может посчитать уникальных за период
+FUNNEL_EVENTS_KEEP_DAYS = int(os.getenv("FUNNEL_EVENTS_KEEP_DAYS", "90"))
+
+
+class AnalyticsEvent(NamedTuple):
+    occurred_at: float        # time.time()
+    user_id: int
+    event: str
+    tea_id: Optional[int] = None
+
+
+class EventBuffer:
+    def __init__(self, capacity: int = MAX_BUFFERED_EVENTS, batch_size: int = FLUSH_BATCH):
+        self.batch_size = batch_size
+        self.emitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed_flushes = 0
+        self._events = deque(maxlen=capacity)
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def emit(self, event: str, user_id: int, tea_id: Optional[int] = None) -> None:
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        self._events.append(AnalyticsEvent(time.time(), user_id, event, tea_id))
+        self.emitted += 1
+
+    async def flush(self, save: Callable[[List[AnalyticsEvent]], Awaitable]) -> int:
+        """
+        Пишет накопленное пачками по batch_size через save(batch). При ошибке или отмене
+        пачка возвращается в начало буфера (сколько влезет) и исключение пробрасывается.
+        """
+        written = 0
+        while self._events:
+            batch = [self._events.popleft() for _ in range(min(self.batch_size, len(self._events)))]
+            try:
+                await save(batch)
+            except BaseException:
+                # И при отмене (таймаут задачи, остановка): пачка уже снята с буфера
+                self.failed_flushes += 1
+                room = self._events.maxlen - len(self._events)
+                self.dropped += max(len(batch) - room, 0)
+                self._events.extendleft(reversed(batch[len(batch) - room:] if room < len(batch) else batch))
+                raise
+            written += len(batch)
+        self.written += written
+        return written
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._events),
+            "emitted": self.emitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes,
+        }
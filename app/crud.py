@@ -1,43 +1,149 @@
 # app/crud.py
 
-from typing import List, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import distinct, or_
-from .models import Tea
-from .schemas import TeaCreate, TeaUpdate
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import delete, distinct, func, insert, or_, select, text, true, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from .analytics import CARD, AnalyticsEvent
+from .models import (
+    CheckoutProfile,
+    FunnelDaily,
+    FunnelDailyUser,
+    FunnelEvent,
+    MaintenanceRun,
+    Order,
+    OrderItem,
+    Promocode,
+    StockReservation,
+    Tea,
+    TeaFacet,
+    TeaViewsDaily,
+    UserList,
+)
+from .promo import normalize_code
+from .read_models import (
+    CheckoutContacts,
+    OrderSummary,
+    PromoRule,
+    TeaCard,
+    TeaCartItem,
+    TeaListItem,
+)
+from .schemas import PromocodeCreate, PromocodeUpdate, TeaCreate, TeaUpdate
 
 
-def get_tea(db: Session, tea_id: int) -> Optional[Tea]:
+async def get_tea(db: AsyncSession, tea_id: int) -> Optional[Tea]:
     """
     Возвращает один активный чай по его ID, или None, если не найден.
     """
-    return db.query(Tea).filter(Tea.id == tea_id, Tea.is_active == True).first()
+    result = await db.execute(select(Tea).where(Tea.id == tea_id, Tea.is_active == True))
+    return result.scalars().first()
 
 
-def get_tea_by_name(db: Session, name: str) -> Optional[Tea]:
+async def get_tea_by_name(db: AsyncSession, name: str) -> Optional[Tea]:
     """
     Возвращает активный чай по точному совпадению имени или None.
     """
-    return db.query(Tea).filter(Tea.name == name, Tea.is_active == True).first()
+    result = await db.execute(select(Tea).where(Tea.name == name, Tea.is_active == True))
+    return result.scalars().first()
 
 
-def get_teas(
-    db: Session,
+# Активность — литералом `true`, а не bind-параметром: только так планировщик
+# может сопоставить запрос с частичными индексами `WHERE is_active`.
+_ACTIVE = Tea.is_active == true()
+
+# Допустимые сортировки списка: ключ API → ORDER BY (id — для стабильной пагинации).
+# Товары без веса (price_per_gram IS NULL) при любой сортировке по цене за грамм — в конце.
+TEA_SORTS = {
+    "id": (Tea.id,),
+    "name": (Tea.name,),
+    "price": (Tea.price, Tea.id),
+    "-price": (Tea.price.desc(), Tea.id),
+    "price_per_gram": (Tea.price_per_gram, Tea.id),
+    "-price_per_gram": (Tea.price_per_gram.desc().nulls_last(), Tea.id),
+    "weight": (Tea.weight, Tea.id),
+    "-weight": (Tea.weight.desc().nulls_last(), Tea.id),
+}
+
+
+def _tea_filters(
+    category: Optional[str] = None,
+    origin: Optional[str] = None,
+    min_price=None,
+    max_price=None,
+    min_price_per_gram=None,
+    max_price_per_gram=None,
+    min_weight=None,
+    max_weight=None,
+) -> list:
+    """Условия WHERE для фасетного фильтра; пустые параметры не ограничивают выборку."""
+    conditions = [_ACTIVE]
+    if category:
+        conditions.append(Tea.category == category)
+    if origin:
+        conditions.append(Tea.origin == origin)
+    if min_price is not None:
+        conditions.append(Tea.price >= min_price)
+    if max_price is not None:
+        conditions.append(Tea.price <= max_price)
+    if min_price_per_gram is not None:
+        conditions.append(Tea.price_per_gram >= min_price_per_gram)
+    if max_price_per_gram is not None:
+        conditions.append(Tea.price_per_gram <= max_price_per_gram)
+    if min_weight is not None:
+        conditions.append(Tea.weight >= min_weight)
+    if max_weight is not None:
+        conditions.append(Tea.weight <= max_weight)
+    return conditions
+
+
+def teas_query(sort: str = "id", **filters):
+    """
+    SELECT активных чаёв с фильтрами и сортировкой. Отдельно от get_teas —
+    чтобы scripts/explain_indexes.py проверял план ровно того запроса, что выполняет API.
+    """
+    if sort not in TEA_SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    return select(Tea).where(*_tea_filters(**filters)).order_by(*TEA_SORTS[sort])
+
+
+async def get_teas(
+    db: AsyncSession,
     skip: int = 0,
     limit: int = 100,
-    category: Optional[str] = None
+    category: Optional[str] = None,
+    origin: Optional[str] = None,
+    min_price=None,
+    max_price=None,
+    min_price_per_gram=None,
+    max_price_per_gram=None,
+    min_weight=None,
+    max_weight=None,
+    sort: str = "id",
 ) -> List[Tea]:
     """
     Возвращает список активных чаёв.
-    Если category задана, фильтрует по ней.
+    Фильтры (категория, происхождение, диапазоны цены, цены за грамм и веса)
+    комбинируются через AND; sort — один из ключей TEA_SORTS.
     """
-    query = db.query(Tea).filter(Tea.is_active == True)
-    if category:
-        query = query.filter(Tea.category == category)
-    return query.offset(skip).limit(limit).all()
+    query = teas_query(
+        sort,
+        category=category,
+        origin=origin,
+        min_price=min_price,
+        max_price=max_price,
+        min_price_per_gram=min_price_per_gram,
+        max_price_per_gram=max_price_per_gram,
+        min_weight=min_weight,
+        max_weight=max_weight,
+    )
+    result = await db.execute(query.offset(skip).limit(limit))
+    return list(result.scalars().all())
 
 
-def create_tea(db: Session, tea: TeaCreate) -> Tea:
+async def create_tea(db: AsyncSession, tea: TeaCreate) -> Tea:
     """
     Создаёт новый чай по данным из TeaCreate.
     """
@@ -49,21 +155,35 @@ def create_tea(db: Session, tea: TeaCreate) -> Tea:
         price=tea.price,
         weight=tea.weight,
         photo_url=tea.photo_url,
+        stock=tea.stock,
         is_active=tea.is_active,
     )
     db.add(new_tea)
-    db.commit()
-    db.refresh(new_tea)
+    await _apply_facet_deltas(db, _facet_deltas(None, _facet_state(new_tea)))
+    await db.commit()
+    await db.refresh(new_tea)
     return new_tea
 
 
-def update_tea(db: Session, tea_id: int, tea: TeaUpdate) -> Optional[Tea]:
+async def _get_tea_for_update(db: AsyncSession, tea_id: int) -> Optional[Tea]:
+    """
+    Как get_tea, но с блокировкой строки до конца транзакции: параллельные правки
+    одного товара не посчитают счётчики фасетов от одного и того же «до».
+    """
+    result = await db.execute(
+        select(Tea).where(Tea.id == tea_id, Tea.is_active == True).with_for_update()
+    )
+    return result.scalars().first()
+
+
+async def update_tea(db: AsyncSession, tea_id: int, tea: TeaUpdate) -> Optional[Tea]:
     """
     Обновляет данные существующего чая (из TeaUpdate). Возвращает обновлённый объект или None, если не найден.
     """
-    db_item = get_tea(db, tea_id)
+    db_item = await _get_tea_for_update(db, tea_id)
     if not db_item:
         return None
+    before = _facet_state(db_item)
 
     if tea.name is not None:
         db_item.name = tea.name
@@ -79,58 +199,710 @@ def update_tea(db: Session, tea_id: int, tea: TeaUpdate) -> Optional[Tea]:
         db_item.weight = tea.weight
     if tea.photo_url is not None:
         db_item.photo_url = tea.photo_url
+    if tea.stock is not None:
+        db_item.stock = tea.stock
     if tea.is_active is not None:
         db_item.is_active = tea.is_active
 
-    db.commit()
-    db.refresh(db_item)
+    await _apply_facet_deltas(db, _facet_deltas(before, _facet_state(db_item)))
+    await db.commit()
+    await db.refresh(db_item)
     return db_item
 
 
-def delete_tea(db: Session, tea_id: int) -> bool:
+async def delete_tea(db: AsyncSession, tea_id: int) -> bool:
     """
     «Мягкое» удаление: просто отмечаем is_active=False.
     Возвращает True, если объект нашёлся и был деактивирован, иначе False.
     """
-    db_item = get_tea(db, tea_id)
+    db_item = await _get_tea_for_update(db, tea_id)
     if not db_item:
         return False
+    before = _facet_state(db_item)
     db_item.is_active = False
-    db.commit()
+    await _apply_facet_deltas(db, _facet_deltas(before, _facet_state(db_item)))
+    await db.commit()
+    return True
+
+
+# ========== Счётчики фасетов (tea_facets) ==========
+
+FACET_KINDS = ("category", "origin")
+
+# Полный пересчёт — для миграции, populate_db.py и ручного восстановления.
+# В обычной работе счётчики меняются только дельтами (_apply_facet_deltas).
+REBUILD_FACETS_SQL = """
+DELETE FROM tea_facets;
+INSERT INTO tea_facets (kind, value, count)
+SELECT 'category', category, count(*) FROM teas WHERE is_active GROUP BY category;
+INSERT INTO tea_facets (kind, value, count)
+SELECT 'origin', origin, count(*) FROM teas WHERE is_active AND origin IS NOT NULL GROUP BY origin;
+"""
+
+
+def _facet_state(tea_obj) -> Optional[tuple]:
+    """Чем товар влияет на счётчики: (category, origin) для активного, None — для неактивного."""
+    if not tea_obj.is_active:
+        return None
+    return tea_obj.category, tea_obj.origin
+
+
+def _facet_deltas(before: Optional[tuple], after: Optional[tuple]) -> Dict[tuple, int]:
+    """Изменения счётчиков {(kind, value): ±n} при переходе товара из before в after."""
+    deltas = {}
+    for state, sign in ((before, -1), (after, 1)):
+        if state is None:
+            continue
+        for kind, value in zip(FACET_KINDS, state):
+            if value is not None:
+                deltas[(kind, value)] = deltas.get((kind, value), 0) + sign
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+async def _apply_facet_deltas(db: AsyncSession, deltas: Dict[tuple, int]) -> None:
+    """
+    UPSERT дельт в tea_facets в текущей транзакции. Ключи — в фиксированном порядке,
+    чтобы параллельные транзакции блокировали строки одинаково и не ловили deadlock.
+    """
+    if not deltas:
+        return
+    keys = sorted(deltas)
+    stmt = pg_insert(TeaFacet).values(
+        [{"kind": kind, "value": value, "count": deltas[(kind, value)]} for kind, value in keys]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TeaFacet.kind, TeaFacet.value],
+        set_={"count": TeaFacet.count + stmt.excluded.count},
+    )
+    await db.execute(stmt)
+    await db.execute(
+        delete(TeaFacet).where(
+            tuple_(TeaFacet.kind, TeaFacet.value).in_(keys), TeaFacet.count <= 0
+        )
+    )
+
+
+async def rebuild_facets(db: AsyncSession) -> None:
+    """Пересчитывает tea_facets с нуля по таблице teas."""
+    for statement in filter(None, (part.strip() for part in REBUILD_FACETS_SQL.split(";"))):
+        await db.execute(text(statement))
+    await db.commit()
+
+
+FACETS_REBUILD_LOCK = 7_310_001   # ключ pg_try_advisory_xact_lock для пересчёта фасетов
+
+
+async def rebuild_facets_exclusive(db: AsyncSession, min_interval: timedelta) -> bool:
+    """
+    rebuild_facets одним воркером API за окно расписания (его запускают все воркеры,
+    каждый со своим jitter). Пропускает, если пересчёт прямо сейчас идёт в другом
+    процессе (advisory-блокировка) или уже выполнен меньше min_interval назад
+    (отметка в maintenance_runs). False — пропущено. Блокировка транзакционная:
+    отметка и пересчёт коммитятся вместе в rebuild_facets, тогда же она и снимается.
+    """
+    acquired = (await db.execute(select(func.pg_try_advisory_xact_lock(FACETS_REBUILD_LOCK)))).scalar()
+    if not acquired:
+        await db.rollback()
+        return False
+    now = datetime.now(timezone.utc)
+    last = (await db.execute(
+        select(MaintenanceRun.finished_at).where(MaintenanceRun.name == "rebuild_facets")
+    )).scalar()
+    if last is not None and now - last < min_interval:
+        await db.rollback()
+        return False
+    stmt = pg_insert(MaintenanceRun).values(name="rebuild_facets", finished_at=now)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[MaintenanceRun.name], set_={"finished_at": stmt.excluded.finished_at},
+    ))
+    await rebuild_facets(db)
+    return True
+
+
+async def get_facets(db: AsyncSession) -> Dict[str, Dict[str, int]]:
+    """
+    Счётчики активных товаров: {"category": {"Улуны": 42, ...}, "origin": {...}}.
+    Значения внутри фасета — по убыванию числа товаров.
+    """
+    result = await db.execute(
+        select(TeaFacet.kind, TeaFacet.value, TeaFacet.count)
+        .where(TeaFacet.count > 0)
+        .order_by(TeaFacet.kind, TeaFacet.count.desc(), TeaFacet.value)
+    )
+    facets = {kind: {} for kind in FACET_KINDS}
+    for kind, value, count in result:
+        facets.setdefault(kind, {})[value] = count
+    return facets
+
+
+# ========== Остатки и резервы ==========
+
+def _stock_update(tea_id: int, delta: int):
+    """
+    UPDATE остатка одного товара. updated_at не трогаем: движение склада — не правка
+    каталога, иначе каждый заказ сбрасывал бы кеши бота (версия каталога по updated_at).
+    """
+    return (
+        update(Tea)
+        .where(Tea.id == tea_id)
+        .values(stock=Tea.stock + delta, updated_at=Tea.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def reserve_stock(
+    db: AsyncSession,
+    order_number: str,
+    quantities: Dict[int, int],
+    ttl_seconds: int,
+) -> Tuple[Dict[int, int], Dict[int, int]]:
+    """
+    Резервирует товары заказа одной транзакцией: всё или ничего.
+
+    Каждая позиция — условный UPDATE ... WHERE stock >= q RETURNING: проверка
+    и списание атомарны, а ждут друг друга только заказы на одну и ту же строку,
+    и только до коммита. Строки берём по возрастанию id, чтобы два заказа
+    с общими товарами не заблокировали друг друга крест-накрест.
+
+    Возвращает (reserved, shortages): reserved — {tea_id: количество} реально
+    зарезервированных позиций (товары без учёта остатка, stock IS NULL, проходят
+    без резерва); shortages — {tea_id: доступно} по позициям, которых не хватило.
+    Если shortages не пуст, ничего не зарезервировано.
+    """
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+    reserved = {}
+    shortages = {}
+    for tea_id in sorted(quantities):
+        quantity = quantities[tea_id]
+        result = await db.execute(
+            _stock_update(tea_id, -quantity)
+            .where(Tea.is_active == True, or_(Tea.stock.is_(None), Tea.stock >= quantity))
+            .returning(Tea.stock)
+        )
+        row = result.first()
+        if row is None:
+            shortages[tea_id] = 0
+        elif row.stock is not None:
+            reserved[tea_id] = quantity
+
+    if shortages:
+        await db.rollback()
+        # Сколько на самом деле осталось — для сообщения покупателю
+        result = await db.execute(select(Tea.id, Tea.stock, Tea.is_active).where(Tea.id.in_(list(shortages))))
+        for tea_id, stock, is_active in result:
+            shortages[tea_id] = (stock or 0) if is_active else 0
+        await db.rollback()
+        return {}, shortages
+
+    if reserved:
+        await db.execute(insert(StockReservation), [
+            {
+                "order_number": order_number,
+                "tea_id": tea_id,
+                "quantity": quantity,
+                "status": "held",
+                "expires_at": expires_at,
+            }
+            for tea_id, quantity in reserved.items()
+        ])
+    await db.commit()
+    return reserved, {}
+
+
+async def confirm_reservation(db: AsyncSession, order_number: str, expected: Dict[int, int]) -> bool:
+    """
+    Переводит резервы заказа из held в confirmed — только если живы все ожидаемые
+    (expected — reserved из reserve_stock). Если часть успела истечь и вернуться
+    на склад, ничего не подтверждается и возвращается False: резервируйте заново.
+    """
+    result = await db.execute(
+        update(StockReservation)
+        .where(StockReservation.order_number == order_number, StockReservation.status == "held")
+        .values(status="confirmed")
+        .returning(StockReservation.tea_id, StockReservation.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    confirmed = {}
+    for tea_id, quantity in result:
+        confirmed[tea_id] = confirmed.get(tea_id, 0) + quantity
+    if confirmed != expected:
+        await db.rollback()
+        return False
+    await db.commit()
     return True
 
 
+async def _return_to_stock(db: AsyncSession, rows) -> None:
+    totals = {}
+    for tea_id, quantity in rows:
+        totals[tea_id] = totals.get(tea_id, 0) + quantity
+    for tea_id in sorted(totals):
+        await db.execute(_stock_update(tea_id, totals[tea_id]))
+
+
+async def release_reservation(db: AsyncSession, order_number: str, include_confirmed: bool = False) -> int:
+    """
+    Отмена оформления: незакрытые резервы заказа возвращаются на склад.
+    include_confirmed — вернуть и подтверждённые (заказ так и не дошёл до администратора).
+    """
+    statuses = ("held", "confirmed") if include_confirmed else ("held",)
+    result = await db.execute(
+        update(StockReservation)
+        .where(StockReservation.order_number == order_number, StockReservation.status.in_(statuses))
+        .values(status="released")
+        .returning(StockReservation.tea_id, StockReservation.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+    await _return_to_stock(db, rows)
+    await db.commit()
+    return len(rows)
+
+
+async def release_expired_reservations(db: AsyncSession, batch_size: int = 500) -> int:
+    """
+    Возвращает на склад истёкшие резервы брошенных заказов (пачкой до batch_size).
+
+    FOR UPDATE SKIP LOCKED: резервы, которые прямо сейчас подтверждает или снимает
+    другая транзакция, пропускаются, а не ждут — несколько процессов могут
+    чистить резервы параллельно, не мешая оформлению заказов.
+    """
+    expired = (
+        select(StockReservation.id)
+        .where(StockReservation.status == "held", StockReservation.expires_at < func.now())
+        .order_by(StockReservation.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    result = await db.execute(
+        update(StockReservation)
+        .where(StockReservation.id.in_(expired))
+        .values(status="released")
+        .returning(StockReservation.tea_id, StockReservation.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+    await _return_to_stock(db, rows)
+    await db.commit()
+    return len(rows)
+
+
+# ========== Промокоды ==========
+
+async def get_promocode(db: AsyncSession, code: str) -> Optional[Promocode]:
+    """Промокод по нормализованному коду (включая неактивные) или None."""
+    result = await db.execute(select(Promocode).where(Promocode.code == normalize_code(code)))
+    return result.scalars().first()
+
+
+async def get_promocodes(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[Promocode]:
+    result = await db.execute(select(Promocode).order_by(Promocode.id).offset(skip).limit(limit))
+    return list(result.scalars().all())
+
+
+async def create_promocode(db: AsyncSession, promo: PromocodeCreate) -> Promocode:
+    """Создаёт промокод; код сохраняется нормализованным."""
+    db_item = Promocode(**promo.model_dump(exclude={"code"}), code=normalize_code(promo.code))
+    db.add(db_item)
+    await db.commit()
+    await db.refresh(db_item)
+    return db_item
+
+
+async def update_promocode(db: AsyncSession, code: str, promo: PromocodeUpdate) -> Optional[Promocode]:
+    """Меняет переданные поля промокода. None, если такого кода нет."""
+    db_item = await get_promocode(db, code)
+    if not db_item:
+        return None
+    for field, value in promo.model_dump(exclude_unset=True).items():
+        if value is None and field in ("kind", "value", "is_active"):
+            continue  # обязательные поля null не принимают; None у прочих — снять ограничение
+        setattr(db_item, field, value)
+    await db.commit()
+    await db.refresh(db_item)
+    return db_item
+
+
+async def get_active_promo_rules(db: AsyncSession) -> List[PromoRule]:
+    """Правила всех активных промокодов — бот держит их в памяти целиком."""
+    result = await db.execute(
+        select(
+            Promocode.code, Promocode.kind, Promocode.value, Promocode.category,
+            Promocode.min_total, Promocode.max_uses, Promocode.used_count, Promocode.expires_at,
+        ).where(Promocode.is_active == True)
+    )
+    return [
+        PromoRule(
+            code=row.code,
+            kind=row.kind,
+            value=float(row.value),
+            category=row.category,
+            min_total=_optional_float(row.min_total),
+            max_uses=row.max_uses,
+            used_count=row.used_count,
+            expires_at=row.expires_at,
+        )
+        for row in result
+    ]
+
+
+async def get_promocodes_version(db: AsyncSession) -> tuple:
+    """Версия набора промокодов для кеша бота: (число строк, max(updated_at))."""
+    result = await db.execute(select(func.count(Promocode.id), func.max(Promocode.updated_at)))
+    return tuple(result.one())
+
+
+async def redeem_promocode(db: AsyncSession, code: str) -> bool:
+    """
+    Списывает одно использование промокода. Проверка лимита, срока и активности
+    и инкремент — один условный UPDATE, поэтому два параллельных заказа не
+    потратят последнее использование дважды. False — код уже не действует.
+    """
+    result = await db.execute(
+        update(Promocode)
+        .where(
+            Promocode.code == normalize_code(code),
+            Promocode.is_active == True,
+            or_(Promocode.max_uses.is_(None), Promocode.used_count < Promocode.max_uses),
+            or_(Promocode.expires_at.is_(None), Promocode.expires_at > func.now()),
+        )
+        .values(used_count=Promocode.used_count + 1)
+        .returning(Promocode.id)
+        .execution_options(synchronize_session=False)
+    )
+    redeemed = result.first() is not None
+    await db.commit()
+    return redeemed
+
+
+async def unredeem_promocode(db: AsyncSession, code: str) -> None:
+    """Возвращает использование, если заказ с промокодом так и не был оформлен."""
+    await db.execute(
+        update(Promocode)
+        .where(Promocode.code == normalize_code(code), Promocode.used_count > 0)
+        .values(used_count=Promocode.used_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+# ========== Избранное и недавно просмотренные ==========
+
+async def get_user_lists(db: AsyncSession, user_id: int) -> Optional[Tuple[List[int], List[int]]]:
+    """(favorites, recent) пользователя или None, если он ещё ничего не сохранял."""
+    result = await db.execute(
+        select(UserList.favorites, UserList.recent).where(UserList.user_id == user_id)
+    )
+    row = result.first()
+    return (list(row.favorites), list(row.recent)) if row is not None else None
+
+
+async def save_user_lists(db: AsyncSession, rows: List[dict]) -> None:
+    """
+    Сохраняет списки многих пользователей одним многострочным UPSERT.
+    rows — [{"user_id", "favorites", "recent"}]; порядок по user_id — против deadlock.
+    """
+    if not rows:
+        return
+    stmt = pg_insert(UserList).values(sorted(rows, key=lambda row: row["user_id"]))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserList.user_id],
+        set_={
+            "favorites": stmt.excluded.favorites,
+            "recent": stmt.excluded.recent,
+            "updated_at": func.now(),
+        },
+    )
+    await db.execute(stmt)
+    await db.commit()
+
+
+# ========== Заказы и сохранённые контакты ==========
+
+async def get_checkout_contacts(db: AsyncSession, user_id: int) -> Optional[CheckoutContacts]:
+    result = await db.execute(
+        select(CheckoutProfile.fio, CheckoutProfile.address, CheckoutProfile.phone)
+        .where(CheckoutProfile.user_id == user_id)
+    )
+    row = result.first()
+    return CheckoutContacts._make(row) if row is not None else None
+
+
+async def create_order(db: AsyncSession, order: dict, items: List[dict]) -> None:
+    """
+    Сохраняет заказ, его строки и контакты покупателя одной транзакцией.
+    order — поля Order (без id), items — [{"tea_id", "name", "price", "quantity"}].
+    """
+    result = await db.execute(insert(Order).values(**order).returning(Order.id))
+    order_id = result.scalar_one()
+    if items:
+        await db.execute(insert(OrderItem), [{**item, "order_id": order_id} for item in items])
+    stmt = pg_insert(CheckoutProfile).values(
+        user_id=order["user_id"], fio=order["fio"], address=order["address"], phone=order["phone"],
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[CheckoutProfile.user_id],
+        set_={
+            "fio": stmt.excluded.fio,
+            "address": stmt.excluded.address,
+            "phone": stmt.excluded.phone,
+            "updated_at": func.now(),
+        },
+    ))
+    await db.commit()
+
+
+async def get_recent_orders(db: AsyncSession, user_id: int, limit: int = 5) -> List[OrderSummary]:
+    """Последние заказы пользователя (новые первыми) с числом позиций."""
+    result = await db.execute(
+        select(Order.order_number, Order.total, Order.created_at, func.count(OrderItem.id))
+        .join(OrderItem, OrderItem.order_id == Order.id, isouter=True)
+        .where(Order.user_id == user_id)
+        .group_by(Order.id)
+        .order_by(Order.created_at.desc())
+        .limit(limit)
+    )
+    return [OrderSummary(row[0], float(row[1]), row[2], row[3]) for row in result]
+
+
+async def get_order_quantities(db: AsyncSession, user_id: int, order_number: str) -> Dict[int, int]:
+    """
+    Состав заказа {tea_id: количество} — для «Повторить заказ». Только заказы
+    этого пользователя: чужой номер вернёт пустой dict.
+    """
+    result = await db.execute(
+        select(OrderItem.tea_id, OrderItem.quantity)
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(Order.order_number == order_number, Order.user_id == user_id)
+        .order_by(OrderItem.id)
+    )
+    quantities = {}
+    for tea_id, quantity in result:
+        quantities[tea_id] = quantities.get(tea_id, 0) + quantity
+    return quantities
+
+
+# ========== Воронка продаж ==========
+
+async def save_funnel_events(db: AsyncSession, events: List[AnalyticsEvent]) -> None:
+    """
+    Пачка событий одной транзакцией: сырые события — одним многострочным INSERT,
+    дневные сводки (funnel_daily, tea_views_daily) — инкрементом через UPSERT.
+    Уникальные пользователи: новая строка в funnel_daily_users (ON CONFLICT DO NOTHING)
+    увеличивает users на 1 — без подсчёта по сырым событиям. Ключи сводок
+    сортируются: параллельные пачки из разных процессов не ловят deadlock.
+    """
+    if not events:
+        return
+    rows = []
+    counts = Counter()
+    day_users = set()
+    views = Counter()
+    for event in events:
+        occurred_at = datetime.fromtimestamp(event.occurred_at, timezone.utc)
+        day = occurred_at.date()
+        rows.append({
+            "occurred_at": occurred_at, "user_id": event.user_id, "event": event.event, "tea_id": event.tea_id,
+        })
+        counts[(day, event.event)] += 1
+        day_users.add((day, event.event, event.user_id))
+        if event.event == CARD and event.tea_id is not None:
+            views[(day, event.tea_id)] += 1
+
+    await db.execute(insert(FunnelEvent).values(rows))
+
+    result = await db.execute(
+        pg_insert(FunnelDailyUser)
+        .values([{"day": day, "event": name, "user_id": user_id} for day, name, user_id in sorted(day_users)])
+        .on_conflict_do_nothing()
+        .returning(FunnelDailyUser.day, FunnelDailyUser.event)
+    )
+    new_users = Counter(tuple(row) for row in result)
+
+    stmt = pg_insert(FunnelDaily).values([
+        {"day": day, "event": name, "events": count, "users": new_users[(day, name)]}
+        for (day, name), count in sorted(counts.items())
+    ])
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[FunnelDaily.day, FunnelDaily.event],
+        set_={
+            "events": FunnelDaily.events + stmt.excluded.events,
+            "users": FunnelDaily.users + stmt.excluded.users,
+        },
+    ))
+
+    if views:
+        stmt = pg_insert(TeaViewsDaily).values([
+            {"day": day, "tea_id": tea_id, "views": count} for (day, tea_id), count in sorted(views.items())
+        ])
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[TeaViewsDaily.day, TeaViewsDaily.tea_id],
+            set_={"views": TeaViewsDaily.views + stmt.excluded.views},
+        ))
+    await db.commit()
+
+
+async def get_funnel(db: AsyncSession, since: date) -> Dict[str, Tuple[int, int]]:
+    """
+    {шаг: (событий, пользователей)} с даты since. События — по дневным сводкам,
+    пользователи — уникальные за весь период (вернувшийся на другой день считается
+    один раз) по отметкам funnel_daily_users, которые хранятся FUNNEL_EVENTS_KEEP_DAYS.
+    """
+    events = await db.execute(
+        select(FunnelDaily.event, func.sum(FunnelDaily.events))
+        .where(FunnelDaily.day >= since)
+        .group_by(FunnelDaily.event)
+    )
+    users = await db.execute(
+        select(FunnelDailyUser.event, func.count(distinct(FunnelDailyUser.user_id)))
+        .where(FunnelDailyUser.day >= since)
+        .group_by(FunnelDailyUser.event)
+    )
+    unique = dict(users.all())
+    return {event: (int(count), int(unique.get(event, 0))) for event, count in events}
+
+
+async def get_top_viewed(db: AsyncSession, since: date, limit: int = 10) -> List[Tuple[int, Optional[str], int]]:
+    """Самые просматриваемые товары с даты since: (tea_id, название или None, просмотров)."""
+    views = func.sum(TeaViewsDaily.views).label("views")
+    result = await db.execute(
+        select(TeaViewsDaily.tea_id, Tea.name, views)
+        .join(Tea, Tea.id == TeaViewsDaily.tea_id, isouter=True)
+        .where(TeaViewsDaily.day >= since)
+        .group_by(TeaViewsDaily.tea_id, Tea.name)
+        .order_by(views.desc(), TeaViewsDaily.tea_id)
+        .limit(limit)
+    )
+    return [(tea_id, name, int(count)) for tea_id, name, count in result]
+
+
+async def prune_funnel_events(db: AsyncSession, keep_days: int) -> int:
+    """
+    Удаляет сырые события и отметки уникальных старше keep_days. Сводки
+    (funnel_daily, tea_views_daily) остаются — отчёты по ним не меняются.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=keep_days)
+    result = await db.execute(delete(FunnelEvent).where(FunnelEvent.occurred_at < cutoff))
+    await db.execute(delete(FunnelDailyUser).where(FunnelDailyUser.day < cutoff.date()))
+    await db.commit()
+    return result.rowcount
+
+
 # ========== Новые функции для бота ==========
 
-def get_all_categories(db: Session) -> List[str]:
+async def get_all_categories(db: AsyncSession) -> List[str]:
     """
-    Возвращает список уникальных категорий (строки) из таблицы teas, где is_active=True.
+    Возвращает список категорий, в которых есть активные товары (из счётчиков tea_facets).
     """
-    # db.query(Tea.category).filter(Tea.is_active==True).distinct().all() вернёт список кортежей [(категория1,), (категория2,), ...]
-    rows = db.query(distinct(Tea.category)).filter(Tea.is_active == True).all()
-    # Распакуем кортежи в простой список строк:
-    return [row[0] for row in rows]
+    result = await db.execute(
+        select(TeaFacet.value).where(TeaFacet.kind == "category", TeaFacet.count > 0)
+    )
+    return list(result.scalars().all())
 
 
-def get_teas_by_category(db: Session, category: str) -> List[Tea]:
+async def get_teas_by_category(db: AsyncSession, category: str) -> List[Tea]:
     """
     Возвращает все активные чаи, у которых поле category совпадает с переданной строкой.
     """
-    return db.query(Tea).filter(Tea.category == category, Tea.is_active == True).all()
+    result = await db.execute(
+        select(Tea).where(Tea.category == category, Tea.is_active == True)
+    )
+    return list(result.scalars().all())
 
 
-def search_teas(db: Session, query_text: str) -> List[Tea]:
+async def search_teas(db: AsyncSession, query_text: str) -> List[Tea]:
     """
     Ищет чаи по части названия или описания (иконка ilike, регистронезависимый поиск).
     """
-    return (
-        db.query(Tea)
-        .filter(
+    result = await db.execute(
+        select(Tea).where(
             Tea.is_active == True,
             or_(
                 Tea.name.ilike(f"%{query_text}%"),
                 Tea.description.ilike(f"%{query_text}%")
             )
         )
-        .all()
     )
+    return list(result.scalars().all())
+
+
+async def get_catalog_version(db: AsyncSession) -> tuple:
+    """
+    Версия каталога для инвалидации кешей бота: (число строк, max(updated_at)).
+    Меняется при любом создании, изменении или мягком удалении товара.
+    """
+    result = await db.execute(select(func.count(Tea.id), func.max(Tea.updated_at)))
+    return tuple(result.one())
+
+
+# ========== Проекции под представления бота (read-модели) ==========
+
+def _optional_float(value) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+async def get_tea_list_items(db: AsyncSession, category: str, sort: str = "id") -> List[TeaListItem]:
+    """
+    Список товаров категории для inline-клавиатуры: только id, name и цена за грамм.
+    sort — ключ TEA_SORTS (для бота: по умолчанию или по цене за грамм).
+    """
+    result = await db.execute(
+        select(Tea.id, Tea.name, Tea.price_per_gram)
+        .where(Tea.category == category, _ACTIVE)
+        .order_by(*TEA_SORTS[sort])
+    )
+    return [TeaListItem(row.id, row.name, _optional_float(row.price_per_gram)) for row in result]
+
+
+_CARD_COLUMNS = (
+    Tea.id, Tea.name, Tea.category, Tea.origin, Tea.description,
+    Tea.price, Tea.weight, Tea.photo_url,
+)
+
+
+def _to_card(row) -> TeaCard:
+    return TeaCard(
+        id=row.id,
+        name=row.name,
+        category=row.category,
+        origin=row.origin,
+        description=row.description,
+        price=float(row.price),
+        weight=_optional_float(row.weight),
+        photo_url=row.photo_url,
+    )
+
+
+async def get_tea_card(db: AsyncSession, tea_id: int) -> Optional[TeaCard]:
+    """
+    Карточка активного товара или None.
+    """
+    result = await db.execute(
+        select(*_CARD_COLUMNS).where(Tea.id == tea_id, Tea.is_active == True)
+    )
+    row = result.first()
+    return _to_card(row) if row is not None else None
+
+
+async def get_all_tea_cards(db: AsyncSession) -> List[TeaCard]:
+    """
+    Карточки всех активных товаров одним запросом — для in-memory индекса бота.
+    """
+    result = await db.execute(
+        select(*_CARD_COLUMNS).where(Tea.is_active == True).order_by(Tea.id)
+    )
+    return [_to_card(row) for row in result]
+
+
+async def get_cart_items(db: AsyncSession, tea_ids: List[int]) -> List[TeaCartItem]:
+    """
+    Данные для строк корзины по списку id одним запросом (порядок не гарантирован).
+    Неактивные товары тоже возвращаются — корзина решает сама, что с ними делать.
+    """
+    result = await db.execute(
+        select(Tea.id, Tea.name, Tea.price, Tea.weight, Tea.category).where(Tea.id.in_(tea_ids))
+    )
+    return [
+        TeaCartItem(row.id, row.name, float(row.price), _optional_float(row.weight), row.category)
+        for row in result
+    ]
@@ -1,7 +1,11 @@
 # app/database.py
+import asyncio
 import os
+import time
 from urllib.parse import quote_plus
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 POSTGRES_USER = os.getenv("POSTGRES_USER", "admin")
@@ -14,8 +18,120 @@ SQLALCHEMY_DATABASE_URL = (
     f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}"
     f"@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
 )
+DATABASE_URL = SQLALCHEMY_DATABASE_URL  # имя, под которым строку берёт alembic/env.py
+ASYNC_DATABASE_URL = (
+    f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}"
+    f"@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+)
+
+# Параметры пула задаются на процесс: у api и bot свои переменные окружения
+# (см. docker-compose.yml), при запуске через run.py пул общий.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))     # ожидание свободного соединения, сек
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))    # пересоздавать соединения старше N сек
 
+# Синхронный движок — для populate_db.py и Alembic
 engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Асинхронный движок — для API и бота
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
+
+
+# ========== Статистика пула ==========
+
+_pool_counters = {
+    "connects": 0,           # сколько физических соединений открыто за всё время
+    "peak_checked_out": 0,   # максимум одновременно выданных соединений
+    "checkouts": 0,          # сколько раз ждали соединение через acquire_connection
+    "wait_total": 0.0,       # суммарное ожидание соединения, сек
+    "wait_max": 0.0,         # максимальное ожидание соединения, сек
+    "timeouts": 0,           # сколько раз пул не выдал соединение за DB_POOL_TIMEOUT
+}
+
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    _pool_counters["connects"] += 1
+
+
+@event.listens_for(async_engine.sync_engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    checked_out = async_engine.sync_engine.pool.checkedout()
+    if checked_out > _pool_counters["peak_checked_out"]:
+        _pool_counters["peak_checked_out"] = checked_out
+
+
+async def acquire_connection(db: AsyncSession) -> None:
+    """
+    Сразу берёт соединение из пула для сессии и учитывает время ожидания.
+    При исчерпании пула пробрасывает PoolTimeout (sqlalchemy.exc.TimeoutError).
+    """
+    started = time.perf_counter()
+    try:
+        await db.connection()
+    except PoolTimeout:
+        _pool_counters["timeouts"] += 1
+        raise
+    waited = time.perf_counter() - started
+    _pool_counters["checkouts"] += 1
+    _pool_counters["wait_total"] += waited
+    if waited > _pool_counters["wait_max"]:
+        _pool_counters["wait_max"] = waited
+
+
+def pool_stats() -> dict:
+    """Текущее состояние асинхронного пула и накопленные счётчики насыщения."""
+    pool = async_engine.sync_engine.pool
+    checked_out = pool.checkedout()
+    capacity = DB_POOL_SIZE + DB_MAX_OVERFLOW
+    checkouts = _pool_counters["checkouts"]
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "checked_out": checked_out,
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "saturation": round(checked_out / capacity, 3) if capacity else 0.0,
+        "peak_checked_out": _pool_counters["peak_checked_out"],
+        "connects": _pool_counters["connects"],
+        "checkouts": checkouts,
+        "wait_avg_ms": round(_pool_counters["wait_total"] / checkouts * 1000, 2) if checkouts else 0.0,
+        "wait_max_ms": round(_pool_counters["wait_max"] * 1000, 2),
+        "timeouts": _pool_counters["timeouts"],
+    }
+
+
+async def warm_pool(connections: int = DB_POOL_SIZE) -> int:
+    """
+    Заранее открывает до connections соединений пула (не больше DB_POOL_SIZE —
+    переполнение пул после возврата закрывает). Соединения открываются параллельно
+    и удерживаются, пока не откроются все: иначе пул выдавал бы одно и то же.
+    Возвращает число открытых; если не открылось ни одного — пробрасывает ошибку.
+    """
+    async def open_one():
+        return await async_engine.connect()
+
+    results = await asyncio.gather(*(open_one() for _ in range(min(connections, DB_POOL_SIZE))),
+                                   return_exceptions=True)
+    opened = [conn for conn in results if not isinstance(conn, BaseException)]
+    for conn in opened:
+        await conn.close()   # возвращается в пул открытым
+    errors = [error for error in results if isinstance(error, BaseException)]
+    if errors and not opened:
+        raise errors[0]
+    return len(opened)
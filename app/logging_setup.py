@@ -0,0 +1,229 @@
+# app/logging_setup.py
+"""
+Логирование без блокировки цикла событий.
+
+  * вызов logger.* только подставляет аргументы в сообщение и кладёт запись в очередь
+    (QueueHandler); форматирование (в том числе traceback) и запись в поток делает
+    отдельный поток QueueListener;
+  * очередь ограничена: если вывод не успевает (забитый stderr, медленный
+    драйвер логов Docker), новые записи отбрасываются и считаются, а не копятся;
+  * одинаковые предупреждения и ошибки (логгер + уровень + шаблон) ограничиваются
+    по частоте: первые LOG_RATE_BURST за окно LOG_RATE_WINDOW проходят, дальше — каждое
+    LOG_SAMPLE_EVERY-е, с числом пропущенных в поле suppressed. Лавина
+    logger.exception при падении БД не забивает вывод и не тормозит обработчики;
+  * формат — JSON по строке на запись (LOG_FORMAT=json, по умолчанию) или текст.
+
+    setup_logging()                 # бот, run.py
+    setup_logging(); route_uvicorn_logs()   # API (app/main.py) под `uvicorn app.main:app`
+    setup_logging(tag="worker 3")   # процессы-шарды: метка в каждой записи
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")        # json | text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_RATE_BURST = int(os.getenv("LOG_RATE_BURST", "20"))
+LOG_RATE_WINDOW = float(os.getenv("LOG_RATE_WINDOW", "10"))
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+# Уровень, с которого действует ограничение: INFO (доступ к API, старт/стоп) пишется целиком
+LOG_RATE_MIN_LEVEL = logging.getLevelName(os.getenv("LOG_RATE_MIN_LEVEL", "WARNING").upper())
+MAX_RATE_KEYS = 2000   # сколько разных сообщений помнит ограничитель
+
+# Стандартные атрибуты LogRecord — всё остальное пришло через extra= и попадает в JSON
+# (color_message — копия сообщения с ANSI-цветами от uvicorn)
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "suppressed", "color_message",
+}
+
+_listener: Optional[QueueListener] = None
+_handler: Optional["NonBlockingQueueHandler"] = None
+_pid: Optional[int] = None   # процесс, где запущен слушатель: после fork поток не наследуется
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, tag: Optional[str] = None):
+        super().__init__()
+        self.tag = tag
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if self.tag:
+            entry["tag"] = self.tag
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self, tag: Optional[str] = None):
+        prefix = f"[{tag}] " if tag else ""
+        super().__init__(f"{prefix}%(levelname)s:%(name)s:%(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        return f"{text} (похожих пропущено: {suppressed})" if suppressed else text
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Ограничение частоты одинаковых сообщений: ключ — логгер, уровень и шаблон
+    (record.msg до подстановки аргументов), так что «Ошибка БД: %s» с разными
+    ошибками — одно сообщение. Число пропущенных пишется в suppressed следующей
+    выданной записи этого ключа.
+    """
+
+    def __init__(self, burst: int = LOG_RATE_BURST, window: float = LOG_RATE_WINDOW,
+                 sample_every: int = LOG_SAMPLE_EVERY, min_level: int = LOG_RATE_MIN_LEVEL,
+                 max_keys: int = MAX_RATE_KEYS):
+        super().__init__()
+        self.min_level = min_level
+        self.burst = burst
+        self.window = window
+        self.sample_every = max(sample_every, 1)
+        self.max_keys = max_keys
+        self.suppressed_total = 0
+        self._state = OrderedDict()   # ключ → [начало окна, записей в окне, пропущено с последней выданной]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.min_level:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        state = self._state.get(key)
+        if state is None:
+            state = self._state[key] = [now, 0, 0]
+            if len(self._state) > self.max_keys:
+                self._state.popitem(last=False)
+        else:
+            self._state.move_to_end(key)
+            if now - state[0] >= self.window:
+                state[0], state[1] = now, 0
+        state[1] += 1
+        over = state[1] - self.burst
+        if over > 0 and over % self.sample_every:
+            state[2] += 1
+            self.suppressed_total += 1
+            return False
+        if state[2]:
+            record.suppressed = state[2]
+            state[2] = 0
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler для очереди внутри процесса. В вызывающем потоке только подставляются
+    аргументы в сообщение: обработчики продолжают менять переданные объекты (корзины,
+    словари, строки ORM), и лог должен показать их состояние на момент вызова.
+    Traceback форматирует поток слушателя (стандартный prepare() делает это прямо
+    в цикле событий). Полная очередь — запись отбрасывается и считается в dropped.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(tag: Optional[str] = None, level: str = LOG_LEVEL, fmt: str = LOG_FORMAT,
+                  stream=None, force: bool = False) -> QueueListener:
+    """
+    Настраивает корневой логгер: фильтр частоты → очередь → поток-слушатель → stream
+    (по умолчанию stderr). Повторный вызов ничего не меняет (force=True — перенастроить),
+    поэтому модули, которые можно запускать и напрямую, и из run.py, вызывают его сами.
+    """
+    global _listener, _handler, _pid
+    if _listener is not None:
+        if not force and _pid == os.getpid():
+            return _listener
+        stop_logging()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter(tag) if fmt == "json" else TextFormatter(tag))
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    _handler = NonBlockingQueueHandler(log_queue)
+    _handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    _pid = os.getpid()
+    return _listener
+
+
+def route_uvicorn_logs() -> None:
+    """
+    Логгеры uvicorn со своими синхронными обработчиками (его log_config по умолчанию) —
+    в корневой логгер: та же очередь и тот же формат. Для `uvicorn app.main:app`,
+    где конфиг логирования задаёт uvicorn, а не мы.
+    """
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        for handler in uvicorn_logger.handlers[:]:
+            uvicorn_logger.removeHandler(handler)
+        uvicorn_logger.propagate = True
+
+
+def stop_logging() -> None:
+    """Дописывает очередь и останавливает поток-слушатель (вызывается и при выходе)."""
+    global _listener, _handler
+    if _listener is None:
+        return
+    if _pid == os.getpid():
+        _listener.stop()
+    logging.getLogger().removeHandler(_handler)
+    _listener = None
+    _handler = None
+
+
+def logging_stats() -> dict:
+    if _handler is None:
+        return {}
+    rate_filter = next((f for f in _handler.filters if isinstance(f, RateLimitFilter)), None)
+    return {
+        "queued": _handler.queue.qsize(),
+        "dropped_queue_full": _handler.dropped,
+        "suppressed": rate_filter.suppressed_total if rate_filter else 0,
+    }
+
+
+atexit.register(stop_logging)
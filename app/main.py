@@ -1,16 +1,113 @@
 # app/main.py
 
-from fastapi import FastAPI
-from app.routers import teas
+import logging
+import os
+import secrets
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import Optional
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from app import crud
+from app.analytics import FUNNEL_EVENTS_KEEP_DAYS
+from app.database import AsyncSessionLocal, async_engine, pool_stats
+from app.logging_setup import route_uvicorn_logs, setup_logging
+from app.profiler import MAX_SECONDS as MAX_PROFILE_SECONDS, ProfilerBusy, profile
+from app.routers import analytics, promocodes, teas
+from app.scheduler import Scheduler
+
+# API запускается и как `uvicorn app.main:app` (Dockerfile.api, launcher.py) — настраиваем
+# логирование при импорте; из run.py это повторный вызов, он ничего не меняет
+setup_logging()
+route_uvicorn_logs()
+logger = logging.getLogger(__name__)
+
+# Ночной пересчёт счётчиков фасетов — страховка от правок каталога мимо API
+FACETS_REBUILD_CRON = os.getenv("FACETS_REBUILD_CRON", "30 4 * * *")
+# Пересчёт недавнее этого — другой воркер уже сделал его в текущем окне (больше jitter, меньше периода cron)
+FACETS_REBUILD_MIN_INTERVAL = timedelta(minutes=30)
+# Токен служебных эндпоинтов (/debug/*, /api/analytics/*); не задан — они отключены
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+
+scheduler = Scheduler()
+
+
+async def rebuild_facets_job():
+    async with AsyncSessionLocal() as db:
+        if await crud.rebuild_facets_exclusive(db, FACETS_REBUILD_MIN_INTERVAL):
+            logger.info("Счётчики фасетов пересчитаны.")
+
+
+async def prune_funnel_job():
+    async with AsyncSessionLocal() as db:
+        deleted = await crud.prune_funnel_events(db, FUNNEL_EVENTS_KEEP_DAYS)
+    if deleted:
+        logger.info("Удалено старых событий воронки: %s", deleted)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # jitter — чтобы воркеры uvicorn не стартовали пересчёт в одну секунду
+    scheduler.add_cron("rebuild_facets", rebuild_facets_job, FACETS_REBUILD_CRON, jitter=300, timeout=300)
+    scheduler.add_cron("prune_funnel", prune_funnel_job, "50 4 * * *", jitter=300, timeout=300)
+    scheduler.start()
+    yield
+    await scheduler.stop()
+    # Корректно закрываем соединения пула при остановке воркера
+    await async_engine.dispose()
+
 
 app = FastAPI(
     title="Tea Store API",
     description="CRUD API for Tea Catalog",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.include_router(teas.router)
+app.include_router(promocodes.router)
 
 @app.get("/")
 async def root():
     return {"message": "Tea Store API is running"}
+
+
+@app.get("/stats/pool")
+async def read_pool_stats():
+    """Состояние пула соединений этого процесса (насыщение, ожидания, таймауты)."""
+    return pool_stats()
+
+
+@app.get("/stats/scheduler")
+async def read_scheduler_stats():
+    """Фоновые задачи этого процесса: запуски, ошибки, пропуски, длительность."""
+    return scheduler.stats()
+
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_API_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+# Отчёты о продажах — только с токеном администратора
+app.include_router(analytics.router, dependencies=[Depends(require_admin_token)])
+
+
+@app.get("/debug/profile", dependencies=[Depends(require_admin_token)])
+async def read_profile(
+    seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS),
+    format: str = Query("collapsed", pattern="^(collapsed|summary)$"),
+):
+    """
+    Профиль цикла событий этого воркера uvicorn за seconds секунд (заголовок X-Admin-Token).
+    collapsed — стеки для flamegraph.pl / speedscope, summary — горячие функции текстом.
+    """
+    try:
+        result = await profile(seconds)
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="Profiling already in progress")
+    body = result.summary(limit=20) + "\n" if format == "summary" else result.collapsed()
+    return PlainTextResponse(body, headers={"X-Profile-Samples": str(result.samples)})
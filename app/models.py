@@ -1,20 +1,39 @@
 # app/models.py
 
 from sqlalchemy import (
+    BigInteger,
     Column,
     Integer,
     String,
     Text,
     Numeric,
     Boolean,
+    Date,
     DateTime,
+    CheckConstraint,
+    Computed,
+    ForeignKey,
+    Index,
     func,
+    text,
 )
+from sqlalchemy.dialects.postgresql import ARRAY
 from .database import Base
 
 
 class Tea(Base):
     __tablename__ = "teas"
+    # Частичные индексы: каталог читает только активные товары (WHERE is_active),
+    # поэтому снятые с продажи не раздувают индексы фильтров и сортировок.
+    __table_args__ = (
+        Index("ix_teas_active_category_price", "category", "price", postgresql_where=text("is_active")),
+        Index("ix_teas_active_category_ppg", "category", "price_per_gram", postgresql_where=text("is_active")),
+        Index("ix_teas_active_price", "price", postgresql_where=text("is_active")),
+        Index("ix_teas_active_ppg", "price_per_gram", postgresql_where=text("is_active")),
+        Index("ix_teas_active_origin_price", "origin", "price", postgresql_where=text("is_active")),
+        Index("ix_teas_active_weight", "weight", postgresql_where=text("is_active")),
+        CheckConstraint("stock >= 0", name="ck_teas_stock_non_negative"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(200), nullable=False, index=True, unique=True)
@@ -23,7 +42,16 @@ class Tea(Base):
     description = Column(Text, nullable=True)
     price = Column(Numeric(10, 2), nullable=False)
     weight = Column(Numeric(10, 2), nullable=True)
+    # Цена за грамм считается самой БД при записи (stored generated column) —
+    # по ней можно фильтровать и сортировать через индекс. Без веса — NULL.
+    price_per_gram = Column(
+        Numeric(12, 4),
+        Computed("price / NULLIF(weight, 0)", persisted=True),
+        nullable=True,
+    )
     photo_url = Column(String, nullable=True)
+    # Свободный остаток (за вычетом резервов). NULL — остаток не ведётся, продаётся без ограничений.
+    stock = Column(Integer, nullable=True)
     is_active = Column(Boolean, default=True, nullable=False)
 
     created_at = Column(
@@ -35,3 +63,190 @@ class Tea(Base):
         onupdate=func.now(),
         nullable=False,
     )
+
+
+class TeaFacet(Base):
+    """
+    Счётчики активных товаров по значениям фасетов: («category», «Улуны») → 42.
+    Поддерживаются инкрементально в crud.create_tea/update_tea/delete_tea
+    в той же транзакции, что и сам товар, — без агрегации по всей таблице teas.
+    """
+    __tablename__ = "tea_facets"
+
+    kind = Column(String(20), primary_key=True)     # "category" | "origin"
+    value = Column(String(150), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class StockReservation(Base):
+    """
+    Резерв товара под оформляемый заказ. Пока резерв «held», его количество уже
+    вычтено из Tea.stock; по истечении expires_at брошенный резерв возвращается
+    на склад (crud.release_expired_reservations), при оформлении — «confirmed».
+    """
+    __tablename__ = "stock_reservations"
+    __table_args__ = (
+        Index("ix_stock_reservations_held_expires", "expires_at", postgresql_where=text("status = 'held'")),
+    )
+
+    id = Column(Integer, primary_key=True)
+    order_number = Column(String(16), nullable=False, index=True)
+    tea_id = Column(Integer, ForeignKey("teas.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    status = Column(String(16), nullable=False, default="held")   # held | confirmed | released
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+
+class Promocode(Base):
+    """
+    Промокод и его правила. code хранится нормализованным (app.promo.normalize_code).
+    Скидка — процент (kind="percent") или фиксированная сумма (kind="fixed");
+    category ограничивает её позициями одной категории.
+    """
+    __tablename__ = "promocodes"
+
+    id = Column(Integer, primary_key=True)
+    code = Column(String(50), nullable=False, unique=True)
+    kind = Column(String(10), nullable=False)                 # percent | fixed
+    value = Column(Numeric(10, 2), nullable=False)
+    category = Column(String(100), nullable=True)              # None — на всю корзину
+    min_total = Column(Numeric(10, 2), nullable=True)          # минимальная сумма корзины
+    max_uses = Column(Integer, nullable=True)                  # None — без ограничения
+    used_count = Column(Integer, nullable=False, default=0, server_default="0")
+    expires_at = Column(DateTime(timezone=True), nullable=True)
+    is_active = Column(Boolean, default=True, nullable=False)
+
+    created_at = Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+
+
+class UserList(Base):
+    """
+    Избранное и недавно просмотренные товары пользователя бота — одной строкой
+    на пользователя (массивы id). Пишется пачками из памяти бота (bot/user_lists.py).
+    """
+    __tablename__ = "user_lists"
+
+    user_id = Column(BigInteger, primary_key=True)   # Telegram user id
+    favorites = Column(ARRAY(Integer), nullable=False, default=list)
+    recent = Column(ARRAY(Integer), nullable=False, default=list)
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+
+
+class CheckoutProfile(Base):
+    """
+    Контакты последнего подтверждённого заказа пользователя бота — чтобы следующее
+    оформление было одним экраном подтверждения вместо пяти вопросов.
+    """
+    __tablename__ = "checkout_profiles"
+
+    user_id = Column(BigInteger, primary_key=True)   # Telegram user id
+    fio = Column(String(500), nullable=False)
+    address = Column(String(500), nullable=False)
+    phone = Column(String(500), nullable=False)
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+
+
+class Order(Base):
+    """Оформленный заказ. Контакты и суммы — как были на момент заказа."""
+    __tablename__ = "orders"
+
+    id = Column(Integer, primary_key=True)
+    order_number = Column(String(16), nullable=False, unique=True)
+    user_id = Column(BigInteger, nullable=False, index=True)
+    fio = Column(String(500), nullable=False)
+    address = Column(String(500), nullable=False)
+    phone = Column(String(500), nullable=False)
+    comment = Column(Text, nullable=True)
+    promo_code = Column(String(50), nullable=True)
+    subtotal = Column(Numeric(10, 2), nullable=False)
+    discount = Column(Numeric(10, 2), nullable=False, default=0)
+    total = Column(Numeric(10, 2), nullable=False)
+    created_at = Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+
+class OrderItem(Base):
+    """Строка заказа: название и цена копируются — товар потом может измениться."""
+    __tablename__ = "order_items"
+
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False, index=True)
+    tea_id = Column(Integer, ForeignKey("teas.id"), nullable=False)
+    name = Column(String(200), nullable=False)
+    price = Column(Numeric(10, 2), nullable=False)
+    quantity = Column(Integer, nullable=False)
+
+
+class FunnelEvent(Base):
+    """
+    Сырое событие воронки продаж (каталог → карточка → корзина → оформление → заказ).
+    Пишется пачками из буфера бота; отчёты читают не его, а дневные сводки ниже.
+    """
+    __tablename__ = "funnel_events"
+
+    id = Column(BigInteger, primary_key=True)
+    occurred_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    user_id = Column(BigInteger, nullable=False)
+    event = Column(String(32), nullable=False)
+    tea_id = Column(Integer, nullable=True)   # без FK: события переживают удаление товара
+
+
+class FunnelDaily(Base):
+    """Сводка воронки за день (UTC): событий и уникальных пользователей на шаг."""
+    __tablename__ = "funnel_daily"
+
+    day = Column(Date, primary_key=True)
+    event = Column(String(32), primary_key=True)
+    events = Column(BigInteger, nullable=False, default=0)
+    users = Column(BigInteger, nullable=False, default=0)
+
+
+class FunnelDailyUser(Base):
+    """Кто уже учтён в funnel_daily.users за день — чтобы считать уникальных без скана событий."""
+    __tablename__ = "funnel_daily_users"
+
+    day = Column(Date, primary_key=True)
+    event = Column(String(32), primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+
+
+class TeaViewsDaily(Base):
+    """Просмотры карточек товара за день (UTC) — для «самых просматриваемых»."""
+    __tablename__ = "tea_views_daily"
+
+    day = Column(Date, primary_key=True)
+    tea_id = Column(Integer, primary_key=True)
+    views = Column(BigInteger, nullable=False, default=0)
+
+
+class MaintenanceRun(Base):
+    """
+    Когда последний раз выполнилась общая фоновая задача (пересчёт фасетов и т.п.):
+    задачу планируют все воркеры API, а выполнить за окно расписания её должен один.
+    """
+    __tablename__ = "maintenance_runs"
+
+    name = Column(String(64), primary_key=True)
+    finished_at = Column(DateTime(timezone=True), nullable=False)
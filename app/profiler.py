@@ -0,0 +1,129 @@
+# app/profiler.py
+"""
+Сэмплирующий профайлер цикла событий — включается по запросу на работающем
+процессе (бот: !profile, API: /debug/profile), без перезапуска под профайлером.
+
+Отдельный поток раз в interval снимает стек потока цикла событий через
+sys._current_frames(): обработчики не инструментируются, накладные расходы —
+один снимок стека за интервал. Результат — collapsed stacks («a;b;c N» на строку),
+формат flamegraph.pl, speedscope и inferno; плюс короткая сводка по самым
+горячим функциям. Простой цикла (ожидание в select/epoll) виден отдельно.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, NamedTuple, Optional, Tuple
+
+DEFAULT_INTERVAL = 0.005   # сек между снимками стека
+MAX_SECONDS = 60           # самое длинное окно профилирования
+MAX_DEPTH = 128            # кадров стека в одном снимке (глубже — обрезается у корня)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Последний Python-кадр, когда цикл ждёт событий: select у asyncio, запуск цикла у uvloop (цикл на C)
+_IDLE_FRAMES = ("select (selectors.py:", "run (runners.py:", "run (uvloop/")
+_busy = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    """Профилирование уже идёт — одновременно в процессе только одно."""
+
+
+class Profile(NamedTuple):
+    seconds: float
+    interval: float
+    samples: int
+    stacks: Counter        # кортеж кадров (от корня) → число снимков
+
+    @property
+    def idle_share(self) -> float:
+        idle = sum(count for stack, count in self.stacks.items() if _is_idle(stack))
+        return idle / self.samples if self.samples else 0.0
+
+    def collapsed(self) -> str:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit: int = 10, include_idle: bool = False) -> List[Tuple[str, float, float]]:
+        """(функция, доля собственного времени, доля с вложенными) — по снимкам, где цикл был занят."""
+        own = Counter()
+        inclusive = Counter()
+        for stack, count in self.stacks.items():
+            if not include_idle and _is_idle(stack):
+                continue
+            own[stack[-1]] += count
+            for frame in set(stack):
+                inclusive[frame] += count
+        if not self.samples:
+            return []
+        return [(frame, count / self.samples, inclusive[frame] / self.samples)
+                for frame, count in own.most_common(limit)]
+
+    def summary(self, limit: int = 10) -> str:
+        lines = [
+            f"Снимков: {self.samples} за {self.seconds:.1f} с (шаг {self.interval * 1000:g} мс), "
+            f"цикл простаивал {self.idle_share:.0%}.",
+            "Горячие функции (собственное / с вложенными):",
+        ]
+        lines += [f"{own:6.1%} {inclusive:6.1%}  {frame}" for frame, own, inclusive in self.top_functions(limit)]
+        return "\n".join(lines)
+
+
+def _is_idle(stack: Tuple[str, ...]) -> bool:
+    return stack[-1].startswith(_IDLE_FRAMES)
+
+
+def _short_path(path: str) -> str:
+    marker = "site-packages" + os.sep
+    if marker in path:
+        return path.split(marker, 1)[1]
+    if path.startswith(_ROOT + os.sep):
+        return os.path.relpath(path, _ROOT)
+    return os.path.basename(path)
+
+
+def _frame_label(code, labels: dict) -> str:
+    label = labels.get(code)
+    if label is None:
+        label = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+        labels[code] = label
+    return label
+
+
+def _sample(thread_id: int, seconds: float, interval: float) -> Tuple[Counter, int]:
+    stacks = Counter()
+    labels = {}   # code → подпись: форматируем каждую функцию один раз
+    samples = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            break   # поток цикла завершился
+        stack = []
+        while frame is not None and len(stack) < MAX_DEPTH:
+            stack.append(_frame_label(frame.f_code, labels))
+            frame = frame.f_back
+        del frame
+        stacks[tuple(reversed(stack))] += 1
+        samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+
+async def profile(seconds: float, interval: float = DEFAULT_INTERVAL, thread_id: Optional[int] = None) -> Profile:
+    """
+    Профилирует поток текущего цикла событий (или thread_id) seconds секунд.
+    Цикл в это время работает как обычно; ждущая корутина в профиль не попадает.
+    """
+    if not 0 < seconds <= MAX_SECONDS:
+        raise ValueError(f"Окно профилирования — от 0 до {MAX_SECONDS} с")
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy("Профилирование уже идёт")
+    try:
+        thread_id = thread_id if thread_id is not None else threading.get_ident()
+        started = time.perf_counter()
+        stacks, samples = await asyncio.to_thread(_sample, thread_id, seconds, interval)
+        return Profile(time.perf_counter() - started, interval, samples, stacks)
+    finally:
+        _busy.release()
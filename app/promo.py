@@ -0,0 +1,59 @@
+# app/promo.py
+"""
+Правила промокодов: нормализация кода и расчёт скидки по корзине.
+
+Только чистые функции без БД: бот считает скидку в памяти по кешу правил,
+а окончательное списание использования — атомарный crud.redeem_promocode.
+"""
+from datetime import datetime, timezone
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+from .read_models import PromoRule
+
+PROMO_KINDS = ("percent", "fixed")
+
+
+class PromoError(ValueError):
+    """Промокод не применим — текст ошибки можно показать покупателю."""
+
+
+class PromoQuote(NamedTuple):
+    code: str
+    subtotal: float   # сумма корзины без скидки
+    discount: float
+    total: float      # к оплате
+
+
+def normalize_code(code: Optional[str]) -> str:
+    """«  summer 10 » → «SUMMER10»: регистр и пробелы при вводе не важны."""
+    return "".join((code or "").split()).upper()
+
+
+def quote(rule: PromoRule, lines: Iterable[Tuple[Optional[str], float]], now: Optional[datetime] = None) -> PromoQuote:
+    """
+    Скидка по правилу для корзины. lines — пары (категория, сумма позиции).
+    Бросает PromoError, если код истёк, исчерпан или не подходит к корзине.
+    """
+    lines = list(lines)
+    now = now or datetime.now(timezone.utc)
+    subtotal = sum(amount for _, amount in lines)
+
+    if rule.expires_at is not None and rule.expires_at <= now:
+        raise PromoError("Срок действия промокода истёк.")
+    if rule.max_uses is not None and rule.used_count >= rule.max_uses:
+        raise PromoError("Промокод уже использован максимальное число раз.")
+    if rule.min_total is not None and subtotal < rule.min_total:
+        raise PromoError(f"Промокод действует на заказ от {rule.min_total:.0f}₽.")
+
+    if rule.category:
+        eligible = sum(amount for category, amount in lines if category == rule.category)
+        if not eligible:
+            raise PromoError(f"Промокод действует только на категорию «{rule.category}».")
+    else:
+        eligible = subtotal
+
+    if rule.kind == "percent":
+        discount = round(eligible * min(rule.value, 100) / 100, 2)
+    else:
+        discount = min(rule.value, eligible)
+    return PromoQuote(rule.code, subtotal, discount, round(subtotal - discount, 2))
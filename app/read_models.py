@@ -0,0 +1,65 @@
+# app/read_models.py
+"""
+Лёгкие read-модели для бота: кортежи только с нужными представлению колонками.
+
+В отличие от ORM-объектов Tea, они не тянут description туда, где он не нужен,
+не держат ссылку на сессию/identity map и безопасно живут после закрытия сессии.
+Цены приводятся к float один раз — при выборке.
+"""
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+
+class TeaListItem(NamedTuple):
+    """Кнопка в списке товаров (категория, результаты поиска)."""
+    id: int
+    name: str
+    price_per_gram: Optional[float] = None
+
+
+class TeaCard(NamedTuple):
+    """Карточка товара."""
+    id: int
+    name: str
+    category: str
+    origin: Optional[str]
+    description: Optional[str]
+    price: float
+    weight: Optional[float]
+    photo_url: Optional[str]
+
+
+class TeaCartItem(NamedTuple):
+    """Строка корзины и калькулятора: название, цена, вес и категория (для промокодов)."""
+    id: int
+    name: str
+    price: float
+    weight: Optional[float]
+    category: Optional[str] = None
+
+
+class PromoRule(NamedTuple):
+    """Правила промокода для расчёта скидки в памяти (app/promo.py)."""
+    code: str
+    kind: str                  # "percent" | "fixed"
+    value: float
+    category: Optional[str]
+    min_total: Optional[float]
+    max_uses: Optional[int]
+    used_count: int
+    expires_at: Optional[datetime]
+
+
+class CheckoutContacts(NamedTuple):
+    """Сохранённые контакты для оформления в один экран."""
+    fio: str
+    address: str
+    phone: str
+
+
+class OrderSummary(NamedTuple):
+    """Прошлый заказ в списке «Мои заказы»."""
+    order_number: str
+    total: float
+    created_at: datetime
+    items_count: int
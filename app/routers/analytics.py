@@ -0,0 +1,51 @@
+# app/routers/analytics.py
+
+from datetime import date, datetime, timedelta, timezone
+from typing import List
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud, schemas
+from app.analytics import FUNNEL_EVENTS_KEEP_DAYS, FUNNEL_STEPS
+from app.routers.teas import get_db
+
+# Подключается в app/main.py за require_admin_token (заголовок X-Admin-Token)
+router = APIRouter(prefix="/api/analytics", tags=["analytics"])
+
+MAX_DAYS = 366
+
+
+def _since(days: int) -> date:
+    """Начало периода: сегодня (UTC) и days - 1 предыдущих дней."""
+    return datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+
+
+@router.get("/funnel", response_model=schemas.FunnelReport)
+async def read_funnel(days: int = Query(7, ge=1, le=FUNNEL_EVENTS_KEEP_DAYS), db: AsyncSession = Depends(get_db)):
+    """
+    Воронка каталог → карточка → корзина → оформление → заказ. Период — не длиннее
+    FUNNEL_EVENTS_KEEP_DAYS: за ним нет отметок, по которым считаются уникальные.
+    """
+    since = _since(days)
+    totals = await crud.get_funnel(db, since)
+    steps = []
+    previous = None
+    for event in FUNNEL_STEPS:
+        events, users = totals.get(event, (0, 0))
+        conversion = None
+        if previous is not None:
+            conversion = round(users / previous, 4) if previous else 0.0
+        steps.append(schemas.FunnelStep(event=event, events=events, users=users, conversion=conversion))
+        previous = users
+    return schemas.FunnelReport(since=since, steps=steps)
+
+
+@router.get("/top-viewed", response_model=List[schemas.TeaViews])
+async def read_top_viewed(
+    days: int = Query(7, ge=1, le=MAX_DAYS),
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+):
+    """Самые просматриваемые карточки за период (по дневным сводкам просмотров)."""
+    rows = await crud.get_top_viewed(db, _since(days), limit)
+    return [schemas.TeaViews(tea_id=tea_id, name=name, views=views) for tea_id, name, views in rows]
@@ -0,0 +1,51 @@
+# app/routers/promocodes.py
+
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud, schemas
+from app.routers.teas import get_db
+
+router = APIRouter(prefix="/api/promocodes", tags=["promocodes"])
+
+
+@router.post("/", response_model=schemas.PromocodeRead, status_code=201)
+async def create_promocode(promo: schemas.PromocodeCreate, db: AsyncSession = Depends(get_db)):
+    if await crud.get_promocode(db, promo.code):
+        raise HTTPException(status_code=400, detail="Promocode already exists")
+    return await crud.create_promocode(db, promo)
+
+
+@router.get("/", response_model=List[schemas.PromocodeRead])
+async def read_promocodes(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    db: AsyncSession = Depends(get_db),
+):
+    return await crud.get_promocodes(db, skip=skip, limit=limit)
+
+
+@router.get("/{code}", response_model=schemas.PromocodeRead)
+async def read_promocode(code: str, db: AsyncSession = Depends(get_db)):
+    db_item = await crud.get_promocode(db, code)
+    if not db_item:
+        raise HTTPException(status_code=404, detail="Promocode not found")
+    return db_item
+
+
+@router.patch("/{code}", response_model=schemas.PromocodeRead)
+async def update_promocode(code: str, promo_upd: schemas.PromocodeUpdate, db: AsyncSession = Depends(get_db)):
+    updated = await crud.update_promocode(db, code, promo_upd)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Promocode not found")
+    return updated
+
+
+@router.delete("/{code}", status_code=204)
+async def delete_promocode(code: str, db: AsyncSession = Depends(get_db)):
+    # Как и у товаров — мягкое удаление: счётчик использований остаётся для истории
+    updated = await crud.update_promocode(db, code, schemas.PromocodeUpdate(is_active=False))
+    if not updated:
+        raise HTTPException(status_code=404, detail="Promocode not found")
+    return
@@ -1,60 +1,94 @@
 # app/routers/teas.py
 
+from decimal import Decimal
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import SessionLocal
+from app.database import AsyncSessionLocal, PoolTimeout, acquire_connection
 from app import crud, schemas
 
 router = APIRouter(prefix="/api/teas", tags=["teas"])
 
-def get_db():
-    db = SessionLocal()
-    try:
+FACETS_MAX_AGE = 30  # сек, Cache-Control для /api/teas/facets
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        try:
+            await acquire_connection(db)
+        except PoolTimeout:
+            # Пул исчерпан дольше DB_POOL_TIMEOUT — честно отдаём 503, а не висим
+            raise HTTPException(status_code=503, detail="Database is busy, try again later")
         yield db
-    finally:
-        db.close()
 
 
 @router.post("/", response_model=schemas.TeaRead, status_code=201)
-def create_tea(tea: schemas.TeaCreate, db: Session = Depends(get_db)):
-    db_item = crud.get_tea_by_name(db, tea.name)
+async def create_tea(tea: schemas.TeaCreate, db: AsyncSession = Depends(get_db)):
+    db_item = await crud.get_tea_by_name(db, tea.name)
     if db_item:
         raise HTTPException(status_code=400, detail="Tea with this name already exists")
-    return crud.create_tea(db, tea)
+    return await crud.create_tea(db, tea)
 
 
 @router.get("/", response_model=List[schemas.TeaRead])
-def read_teas(
+async def read_teas(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1),
     category: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    origin: Optional[str] = Query(None),
+    min_price: Optional[Decimal] = Query(None, ge=0),
+    max_price: Optional[Decimal] = Query(None, ge=0),
+    min_price_per_gram: Optional[Decimal] = Query(None, ge=0),
+    max_price_per_gram: Optional[Decimal] = Query(None, ge=0),
+    min_weight: Optional[Decimal] = Query(None, ge=0),
+    max_weight: Optional[Decimal] = Query(None, ge=0),
+    sort: schemas.TeaSort = Query("id", description="Поле сортировки; «-» в начале — по убыванию"),
+    db: AsyncSession = Depends(get_db),
 ):
-    teas = crud.get_teas(db, skip=skip, limit=limit, category=category)
+    teas = await crud.get_teas(
+        db,
+        skip=skip,
+        limit=limit,
+        category=category,
+        origin=origin,
+        min_price=min_price,
+        max_price=max_price,
+        min_price_per_gram=min_price_per_gram,
+        max_price_per_gram=max_price_per_gram,
+        min_weight=min_weight,
+        max_weight=max_weight,
+        sort=sort,
+    )
     return teas
 
 
+@router.get("/facets", response_model=schemas.TeaFacets)
+async def read_facets(response: Response, db: AsyncSession = Depends(get_db)):
+    # Счётчики уже посчитаны в tea_facets — это чтение пары десятков строк;
+    # короткий max-age позволяет прокси и клиентам не спрашивать их на каждый экран.
+    response.headers["Cache-Control"] = f"public, max-age={FACETS_MAX_AGE}"
+    return await crud.get_facets(db)
+
+
 @router.get("/{tea_id}", response_model=schemas.TeaRead)
-def read_tea(tea_id: int, db: Session = Depends(get_db)):
-    db_item = crud.get_tea(db, tea_id)
+async def read_tea(tea_id: int, db: AsyncSession = Depends(get_db)):
+    db_item = await crud.get_tea(db, tea_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="Tea not found")
     return db_item
 
 
 @router.patch("/{tea_id}", response_model=schemas.TeaRead)
-def update_tea(tea_id: int, tea_upd: schemas.TeaUpdate, db: Session = Depends(get_db)):
-    updated = crud.update_tea(db, tea_id, tea_upd)
+async def update_tea(tea_id: int, tea_upd: schemas.TeaUpdate, db: AsyncSession = Depends(get_db)):
+    updated = await crud.update_tea(db, tea_id, tea_upd)
     if not updated:
         raise HTTPException(status_code=404, detail="Tea not found")
     return updated
 
 
 @router.delete("/{tea_id}", status_code=204)
-def delete_tea(tea_id: int, db: Session = Depends(get_db)):
-    success = crud.delete_tea(db, tea_id)
+async def delete_tea(tea_id: int, db: AsyncSession = Depends(get_db)):
+    success = await crud.delete_tea(db, tea_id)
     if not success:
         raise HTTPException(status_code=404, detail="Tea not found")
     return
@@ -0,0 +1,240 @@
+# app/scheduler.py
+"""
+Планировщик фоновых задач внутри процесса (бот, API): задачи по интервалу
+и по расписанию в стиле cron.
+
+  * jitter — случайный сдвиг каждого запуска, чтобы процессы (воркеры uvicorn,
+    шарды бота), стартовавшие одновременно, не ходили в БД синхронно;
+  * single-flight — если прошлый запуск задачи ещё идёт, очередной пропускается
+    (и считается в skipped), а не копится параллельно;
+  * метрики на задачу: запуски, ошибки, пропуски, длительность последнего,
+    среднего и самого долгого запуска, время следующего.
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+CRON_JITTER = 30.0     # сек: разброс запуска cron-задач по умолчанию
+INTERVAL_JITTER = 0.1  # доля интервала: разброс интервальных задач по умолчанию
+
+
+# ========== cron ==========
+
+_CRON_FIELDS = (  # (минимум, максимум) для: минута, час, день месяца, месяц, день недели
+    (0, 59), (0, 23), (1, 31), (1, 12), (0, 7),
+)
+
+
+def _parse_cron_field(field: str, low: int, high: int) -> Set[int]:
+    values = set()
+    for part in field.split(","):
+        body, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if body == "*":
+            start, end = low, high
+        elif "-" in body:
+            start, end = (int(x) for x in body.split("-", 1))
+        else:
+            start = end = int(body)
+            if step != 1:
+                end = high
+        if step < 1 or start < low or end > high or start > end:
+            raise ValueError(f"Поле cron вне диапазона {low}–{high}: {part!r}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """
+    Расписание «минута час день месяц день_недели» (как в crontab, по локальному
+    времени процесса): *, числа, списки через запятую, диапазоны a-b, шаг /n.
+    День недели 0–6 (0 — воскресенье, 7 тоже воскресенье). Если заданы и день
+    месяца, и день недели, подходит любой из них — как в cron.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Ожидалось 5 полей cron, получено {len(fields)}: {expression!r}")
+        self.expression = expression
+        parsed = [_parse_cron_field(field, low, high) for field, (low, high) in zip(fields, _CRON_FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {day % 7 for day in weekdays}
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays   # Python: пн=0, cron: вс=0
+        if self._any_day:
+            return weekday_ok
+        if self._any_weekday:
+            return day_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Ближайший момент строго после moment (с точностью до минуты)."""
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                month = moment.month % 12 + 1
+                moment = moment.replace(year=moment.year + (month == 1), month=month, day=1, hour=0, minute=0)
+            elif not self._day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Расписание {self.expression!r} не срабатывает никогда")
+
+
+# ========== задачи ==========
+
+class Job:
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], Awaitable],
+        interval: Optional[float] = None,
+        cron: Optional[CronSchedule] = None,
+        jitter: Optional[float] = None,
+        timeout: Optional[float] = None,
+        run_at_start: bool = False,
+    ):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.cron = cron
+        self.jitter = jitter if jitter is not None else (
+            interval * INTERVAL_JITTER if interval is not None else CRON_JITTER
+        )
+        self.timeout = timeout
+        self.run_at_start = run_at_start
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_duration = None
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+        self.last_started_at = None
+        self.last_error = None
+        self.next_run_at = None
+
+    def next_delay(self, first: bool = False) -> float:
+        if self.cron is not None:
+            now = datetime.now()
+            delay = (self.cron.next_after(now) - now).total_seconds() + random.uniform(0, self.jitter)
+        elif first and self.run_at_start:
+            delay = random.uniform(0, self.jitter)
+        else:
+            delay = max(0.0, self.interval + random.uniform(-self.jitter, self.jitter))
+        self.next_run_at = time.time() + delay
+        return delay
+
+    def stats(self) -> dict:
+        return {
+            "schedule": self.cron.expression if self.cron else f"every {self.interval:g}s",
+            "running": self.running,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_duration": self.last_duration,
+            "avg_duration": self.total_duration / self.runs if self.runs else None,
+            "max_duration": self.max_duration,
+            "last_started_at": self.last_started_at,
+            "next_run_at": self.next_run_at,
+            "last_error": self.last_error,
+        }
+
+
+class Scheduler:
+    """
+    Задачи — корутинные функции без аргументов; исключение задачи логируется
+    и считается в failures, расписание при этом не сбивается.
+    """
+
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self._loops: List[asyncio.Task] = []
+        self._runs: Set[asyncio.Task] = set()
+
+    def add_interval(self, name: str, func: Callable[[], Awaitable], seconds: float, **options) -> Job:
+        return self._add(Job(name, func, interval=seconds, **options))
+
+    def add_cron(self, name: str, func: Callable[[], Awaitable], expression: str, **options) -> Job:
+        return self._add(Job(name, func, cron=CronSchedule(expression), **options))
+
+    def _add(self, job: Job) -> Job:
+        if job.name in self.jobs:
+            raise ValueError(f"Задача {job.name!r} уже добавлена")
+        self.jobs[job.name] = job
+        if self._loops:   # планировщик уже запущен
+            self._loops.append(asyncio.create_task(self._loop(job)))
+        return job
+
+    def start(self) -> None:
+        if not self._loops:
+            self._loops = [asyncio.create_task(self._loop(job)) for job in self.jobs.values()]
+
+    async def stop(self, timeout: float = 10) -> None:
+        """Новые запуски прекращаются; идущие получают timeout секунд на завершение."""
+        for task in self._loops:
+            task.cancel()
+        await asyncio.gather(*self._loops, return_exceptions=True)
+        self._loops = []
+        if self._runs:
+            _, pending = await asyncio.wait(self._runs, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> Dict[str, dict]:
+        return {name: job.stats() for name, job in self.jobs.items()}
+
+    async def _loop(self, job: Job) -> None:
+        delay = job.next_delay(first=True)
+        while True:
+            await asyncio.sleep(delay)
+            if job.running:
+                job.skipped += 1
+                logger.warning("Задача %s ещё выполняется — запуск пропущен.", job.name)
+            else:
+                task = asyncio.create_task(self._run(job))
+                self._runs.add(task)
+                task.add_done_callback(self._runs.discard)
+            delay = job.next_delay()
+
+    async def _run(self, job: Job) -> None:
+        job.running = True
+        job.last_started_at = time.time()
+        started = time.perf_counter()
+        try:
+            if job.timeout:
+                await asyncio.wait_for(job.func(), job.timeout)
+            else:
+                await job.func()
+            job.last_error = None
+        except asyncio.TimeoutError:
+            job.failures += 1
+            job.last_error = f"timeout {job.timeout:g}s"
+            logger.error("Задача %s не уложилась в %s с.", job.name, job.timeout)
+        except Exception as e:
+            job.failures += 1
+            job.last_error = repr(e)
+            logger.exception("Ошибка задачи %s: %s", job.name, e)
+        finally:
+            duration = time.perf_counter() - started
+            job.running = False
+            job.runs += 1
+            job.last_duration = duration
+            job.total_duration += duration
+            job.max_duration = max(job.max_duration, duration)
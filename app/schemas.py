@@ -1,8 +1,9 @@
 # app/schemas.py
 
-from datetime import datetime
-from typing import Optional
-from pydantic import BaseModel, ConfigDict, constr, condecimal
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, List, Literal, Optional
+from pydantic import BaseModel, ConfigDict, conint, constr, condecimal
 
 
 class TeaBase(BaseModel):
@@ -13,13 +14,15 @@ class TeaBase(BaseModel):
     price: condecimal(max_digits=10, decimal_places=2)
     weight: Optional[condecimal(max_digits=10, decimal_places=2)] = None
     photo_url: Optional[str] = None
+    stock: Optional[conint(ge=0)] = None
     is_active: Optional[bool] = True
 
 
 class TeaCreate(TeaBase):
     """
     Схема для создания нового чая. Поля: name, category, origin, description,
-    price, weight, photo_url. Поле is_active можно не указывать (по умолчанию True).
+    price, weight, photo_url, stock (None — остаток не ведётся).
+    Поле is_active можно не указывать (по умолчанию True).
     """
     pass
 
@@ -35,15 +38,97 @@ class TeaUpdate(BaseModel):
     price: Optional[condecimal(max_digits=10, decimal_places=2)] = None
     weight: Optional[condecimal(max_digits=10, decimal_places=2)] = None
     photo_url: Optional[str] = None
+    stock: Optional[conint(ge=0)] = None
     is_active: Optional[bool] = None
 
 
+TeaSort = Literal[
+    "id", "name", "price", "-price", "price_per_gram", "-price_per_gram", "weight", "-weight",
+]
+
+
 class TeaRead(TeaBase):
     """
-    Схема для выдачи клиенту (при GET): к базовым полям добавляем id, created_at, updated_at.
+    Схема для выдачи клиенту (при GET): к базовым полям добавляем id,
+    вычисляемую БД цену за грамм, created_at, updated_at.
     """
     id: int
+    price_per_gram: Optional[Decimal] = None
     created_at: datetime
     updated_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class TeaFacets(BaseModel):
+    """
+    Число активных товаров по значениям фасетов: {"category": {"Улуны": 42}, "origin": {...}}.
+    """
+    category: Dict[str, int]
+    origin: Dict[str, int]
+
+
+class PromocodeBase(BaseModel):
+    kind: Literal["percent", "fixed"]
+    value: condecimal(gt=0, max_digits=10, decimal_places=2)
+    category: Optional[constr(max_length=100)] = None
+    min_total: Optional[condecimal(ge=0, max_digits=10, decimal_places=2)] = None
+    max_uses: Optional[conint(ge=1)] = None
+    expires_at: Optional[datetime] = None
+    is_active: Optional[bool] = True
+
+
+class PromocodeCreate(PromocodeBase):
+    """
+    Схема для создания промокода. Код приводится к верхнему регистру без пробелов.
+    kind="percent" — value в процентах, kind="fixed" — value в рублях.
+    """
+    code: constr(min_length=1, max_length=50)
+
+
+class PromocodeUpdate(BaseModel):
+    """
+    Схема для изменения промокода. Все поля опциональные; код не меняется.
+    """
+    kind: Optional[Literal["percent", "fixed"]] = None
+    value: Optional[condecimal(gt=0, max_digits=10, decimal_places=2)] = None
+    category: Optional[constr(max_length=100)] = None
+    min_total: Optional[condecimal(ge=0, max_digits=10, decimal_places=2)] = None
+    max_uses: Optional[conint(ge=1)] = None
+    expires_at: Optional[datetime] = None
+    is_active: Optional[bool] = None
+
+
+class PromocodeRead(PromocodeBase):
+    """
+    Схема для выдачи промокода вместе со счётчиком использований.
+    """
+    id: int
+    code: str
+    used_count: int
+    created_at: datetime
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class FunnelStep(BaseModel):
+    """
+    Шаг воронки за период. users — уникальные пользователи за весь период;
+    conversion — доля users от предыдущего шага (у первого шага — None).
+    """
+    event: str
+    events: int
+    users: int
+    conversion: Optional[float] = None
+
+
+class FunnelReport(BaseModel):
+    since: date
+    steps: List[FunnelStep]
+
+
+class TeaViews(BaseModel):
+    tea_id: int
+    name: Optional[str] = None   # None — товар удалён
+    views: int
@@ -0,0 +1,193 @@
+# app/tracing.py
+"""
+Трассировка запросов: трасса на апдейт бота (или любую единицу работы) и спаны
+внутри неё — обработчик, каждый SQL-запрос, каждый вызов внешнего API.
+
+Текущая трасса лежит в contextvar, поэтому спаны находят её сами: SQL — через
+события движка (install_sql_tracing), вызовы Telegram — через сессию бота.
+Вне трассы span() ничего не делает, так что при выключенной выборке накладные
+расходы — одно чтение contextvar.
+
+Какие трассы пишутся (в JSONL-файл, по строке на трассу):
+  * TRACE_SAMPLE_RATE — доля случайных трасс (0 — выключено, 1 — все);
+  * TRACE_SLOW_MS — если задан, трассируется каждый апдейт, а в файл попадают
+    все медленнее порога (плюс случайная выборка).
+
+Разбор файла: python scripts/trace_report.py
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "0"))
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+MAX_SPANS = 200          # спанов на трассу; лишние только считаются
+MAX_BUFFERED = 10_000    # трасс в памяти до записи; при переполнении старые выбрасываются
+SQL_NAME_LEN = 120       # сколько символов запроса оставлять в имени спана
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+
+
+class Trace:
+    def __init__(self, name: str, sampled: bool, **attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.sampled = sampled
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.spans: List[dict] = []
+        self.dropped_spans = 0
+
+    def add_span(self, kind: str, name: str, started: float, finished: float, error: Optional[str] = None) -> None:
+        if self.duration is not None:
+            return   # задача, запущенная из обработчика, пережила трассу
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped_spans += 1
+            return
+        span = {
+            "kind": kind,
+            "name": name,
+            "start_ms": round((started - self.started) * 1000, 3),
+            "duration_ms": round((finished - started) * 1000, 3),
+        }
+        if error:
+            span["error"] = error
+        self.spans.append(span)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 3),
+            **self.attrs,
+            "spans": self.spans,
+            "dropped_spans": self.dropped_spans,
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(kind: str, name: str):
+    """Спан текущей трассы; вне трассы — пустой контекст."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        trace.add_span(kind, name, started, time.perf_counter(), error)
+
+
+class TraceSink:
+    """
+    Буфер готовых трасс и дозапись в JSONL. Запись — flush() в потоке, по таймеру
+    и при остановке: обработчик апдейта в файл не пишет.
+    """
+
+    def __init__(self, path: str = TRACE_FILE, max_buffered: int = MAX_BUFFERED):
+        self.path = path
+        self.written = 0
+        self.dropped = 0
+        self._buffer = deque(maxlen=max_buffered)
+
+    def add(self, record: dict) -> None:
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append(record)
+
+    def _write(self, records: List[dict]) -> None:
+        data = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+        # Одним write без буфера: строки процессов-шардов в общем файле не перемешиваются
+        with open(self.path, "ab", buffering=0) as f:
+            f.write(data.encode())
+
+    async def flush(self) -> int:
+        if not self._buffer:
+            return 0
+        records = list(self._buffer)
+        self._buffer.clear()
+        await asyncio.to_thread(self._write, records)
+        self.written += len(records)
+        return len(records)
+
+
+class Tracer:
+    def __init__(self, sink: TraceSink, sample_rate: float = TRACE_SAMPLE_RATE, slow_ms: float = TRACE_SLOW_MS):
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.traced = 0
+        self.kept = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.slow_ms > 0
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        """Трасса на время блока (None, если не выбрана) — текущая для спанов внутри."""
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled and self.slow_ms <= 0:
+            yield None
+            return
+        trace = Trace(name, sampled, **attrs)
+        token = _current.set(trace)
+        try:
+            yield trace
+        finally:
+            _current.reset(token)
+            trace.duration = time.perf_counter() - trace.started
+            self.traced += 1
+            if trace.sampled or (self.slow_ms > 0 and trace.duration * 1000 >= self.slow_ms):
+                self.kept += 1
+                self.sink.add(trace.to_dict())
+
+
+def install_sql_tracing(sync_engine) -> None:
+    """Спан kind="sql" на каждый запрос движка (для async-движка — его sync_engine)."""
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("trace_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        trace = _current.get()
+        stack = conn.info.get("trace_started")
+        if trace is None or not stack:
+            return
+        trace.add_span("sql", " ".join(statement.split())[:SQL_NAME_LEN], stack.pop(), time.perf_counter())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        stack = context.connection.info.get("trace_started") if context.connection is not None else None
+        trace = _current.get()
+        if trace is None or not stack:
+            return
+        statement = " ".join((context.statement or "").split())[:SQL_NAME_LEN]
+        trace.add_span("sql", statement, stack.pop(), time.perf_counter(), type(context.original_exception).__name__)
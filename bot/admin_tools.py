@@ -1,13 +1,54 @@
+import asyncio
 import html
 import logging
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from typing import List, Optional
 
-from aiogram.types import Message
+from aiogram.types import BufferedInputFile, Message
 from aiogram import Bot
+from app.profiler import MAX_SECONDS as MAX_PROFILE_SECONDS, ProfilerBusy, profile
 from config import ADMIN
 
 logger = logging.getLogger(__name__)
 
 MAX_MESSAGE_LENGTH = 4096
+MAX_FAILED_NOTIFICATIONS = 1000   # сколько неудавшихся пересылок держать для повтора
+MAX_NOTIFY_ATTEMPTS = 5
+# Сообщения пользователя в поддержку копятся столько секунд и уходят админам одним сообщением
+SUPPORT_COALESCE_SECONDS = float(os.getenv("SUPPORT_COALESCE_SECONDS", "5"))
+TICKET_IDLE_SECONDS = 30 * 60   # тишина дольше — следующее сообщение открывает новое обращение
+MAX_TICKETS = 10_000            # обращений в памяти; вытесняются самые давние без ожидающих сообщений
+MAX_REPLY_LINKS = 20_000        # (админ, сообщение) → пользователь для ответов реплаем
+TICKET_HEADER_RESERVE = 300     # место под заголовок и подсказку в первой/последней части
+
+# Пересылки администраторам, которые не прошли: (admin_id, текст, попыток, user_id); повторяет retry_failed_notifications
+_failed_notifications = deque(maxlen=MAX_FAILED_NOTIFICATIONS)
+# Реплай админа на пересланное обращение → кому отвечать. Если связи нет (другой шард,
+# перезапуск, вытеснена) — id пользователя берётся из первой строки пересланного сообщения
+_reply_links: "OrderedDict[tuple, int]" = OrderedDict()
+# Обе формы заголовка: «📩 От @u (ID: 42) — …» и «(Продолжение, ID: 42):»
+_USER_ID_IN_HEADER = re.compile(r"\bID: (\d+)")
+
+
+class Ticket:
+    """Обращение пользователя в поддержку: идёт, пока он пишет чаще раза в TICKET_IDLE_SECONDS."""
+
+    __slots__ = ("user_id", "username", "last_at", "total", "pending", "timer")
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.username: Optional[str] = None
+        self.last_at = 0.0
+        self.total = 0                        # сообщений за обращение
+        self.pending: List[str] = []          # ещё не отправленные админам (уже экранированы)
+        self.timer: Optional[asyncio.Task] = None
+
+
+_tickets: "OrderedDict[int, Ticket]" = OrderedDict()
+_timers = set()   # задачи отложенной отправки: спят окно склейки или уже отправляют
 
 def split_message(text, limit=MAX_MESSAGE_LENGTH):
     parts = []
@@ -24,6 +65,17 @@ async def handle_admin_command(message: Message, bot: Bot):
     if message.from_user.id not in ADMIN:
         return
 
+    # Ответ реплаем на пересланное обращение — вместо !message <user_id>
+    if not message.text.startswith("!"):
+        user_id = reply_target(message)
+        if user_id is not None:
+            await send_to_user(message, bot, user_id, message.text)
+        return
+
+    if message.text.startswith("!profile"):
+        await profile_command(message)
+        return
+
     if not message.text.startswith("!message"):
         return
 
@@ -31,30 +83,173 @@ async def handle_admin_command(message: Message, bot: Bot):
     if len(args) < 3:
         await message.reply("❗️Использование: !message <user_id> <сообщение>")
         return
-
     try:
         target_user_id = int(args[1])
-        text = args[2]
+    except ValueError:
+        await message.reply("⚠️ Ошибка: user_id должен быть числом.")
+        return
+    await send_to_user(message, bot, target_user_id, args[2])
+
+
+async def send_to_user(message: Message, bot: Bot, user_id: int, text: str):
+    """Пишет пользователю от имени поддержки и подтверждает админу."""
+    try:
         for part in split_message(text):
-            await bot.send_message(chat_id=target_user_id, text=part)
+            await bot.send_message(chat_id=user_id, text=part)
         await message.reply("✅ Сообщение отправлено.")
     except Exception as e:
         await message.reply(f"⚠️ Ошибка: {e}")
 
+async def profile_command(message: Message):
+    """
+    !profile <секунды> — профиль цикла событий бота за окно: сводка в подписи,
+    collapsed stacks файлом (flamegraph.pl / speedscope.app).
+    """
+    args = message.text.split()
+    try:
+        seconds = float(args[1]) if len(args) > 1 else 10.0
+    except ValueError:
+        seconds = 0
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        await message.reply(f"❗️Использование: !profile <секунды, до {MAX_PROFILE_SECONDS}>")
+        return
+
+    await message.reply(f"⏱ Профилирую {seconds:g} с…")
+    try:
+        result = await profile(seconds)
+    except ProfilerBusy:
+        await message.reply("⚠️ Профилирование уже идёт.")
+        return
+    if not result.samples:
+        await message.reply("⚠️ Не снято ни одного снимка стека.")
+        return
+    for limit in (8, 5, 3, 0):   # подпись документа — не длиннее 1024 символов
+        caption = f"<pre>{html.escape(result.summary(limit))}</pre>"
+        if len(caption) <= 1024:
+            break
+    name = time.strftime("profile-%Y%m%d-%H%M%S.collapsed")
+    await message.reply_document(BufferedInputFile(result.collapsed().encode(), filename=name), caption=caption)
+
+
 async def handle_user_message(message: Message, bot: Bot):
+    """
+    Сообщение пользователя в поддержку. Не уходит админам сразу: сообщения копятся
+    в обращении SUPPORT_COALESCE_SECONDS секунд и пересылаются одним сообщением
+    всем админам параллельно — серия из десяти сообщений стоит админам одного.
+    """
     if message.from_user.id in ADMIN:
         return  # не пересылать сообщения от админов
 
     # Экранируем пользовательский текст — у бота включён parse_mode=HTML по умолчанию
     text = html.escape(message.text) if message.text else "&lt;не текстовое сообщение&gt;"
     user = message.from_user
-    username = html.escape(user.username) if user.username else "без username"
-    header = f"📩 Ответ от @{username} (ID: {user.id}):\n"
+    ticket = _open_ticket(user.id)
+    ticket.username = user.username
+    ticket.pending.append(text)
+    ticket.total += 1
+    if SUPPORT_COALESCE_SECONDS <= 0:
+        await deliver_ticket(ticket, bot)
+    elif ticket.timer is None:
+        ticket.timer = asyncio.create_task(_deliver_later(ticket, bot))
+        _timers.add(ticket.timer)
+        ticket.timer.add_done_callback(_timers.discard)
+
+
+def _open_ticket(user_id: int) -> Ticket:
+    now = time.monotonic()
+    ticket = _tickets.get(user_id)
+    if ticket is None or (now - ticket.last_at > TICKET_IDLE_SECONDS and not ticket.pending):
+        ticket = _tickets[user_id] = Ticket(user_id)
+        if len(_tickets) > MAX_TICKETS:
+            stale = next((uid for uid, t in _tickets.items() if not t.pending), None)
+            if stale is not None:
+                del _tickets[stale]
+    _tickets.move_to_end(user_id)
+    ticket.last_at = now
+    return ticket
+
+
+async def _deliver_later(ticket: Ticket, bot: Bot) -> None:
+    await asyncio.sleep(SUPPORT_COALESCE_SECONDS)
+    ticket.timer = None
+    await deliver_ticket(ticket, bot)
+
+
+def _ticket_parts(ticket: Ticket, messages: List[str]) -> List[str]:
+    username = html.escape(ticket.username) if ticket.username else "без username"
+    status = ("новое обращение" if ticket.total == len(messages)
+              else f"продолжение, всего сообщений: {ticket.total}")
+    header = f"📩 От @{username} (ID: {ticket.user_id}) — {status}:\n\n"
+    parts = split_message("\n\n".join(messages), MAX_MESSAGE_LENGTH - TICKET_HEADER_RESERVE)
+    parts = [header + part if i == 0 else f"(Продолжение, ID: {ticket.user_id}):\n" + part
+             for i, part in enumerate(parts)]
+    parts[-1] += "\n\n<i>Ответьте на это сообщение, чтобы написать пользователю.</i>"
+    return parts
+
+
+async def deliver_ticket(ticket: Ticket, bot: Bot) -> None:
+    """Отправляет накопленное в обращении всем админам: админы — параллельно, части одному — по порядку."""
+    messages, ticket.pending = ticket.pending, []
+    if not messages:
+        return
+    parts = _ticket_parts(ticket, messages)
+    await asyncio.gather(*(_send_to_admin(bot, admin_id, parts, ticket.user_id) for admin_id in ADMIN))
+
+
+async def _send_to_admin(bot: Bot, admin_id: int, parts: List[str], user_id: int) -> None:
+    for part in parts:
+        try:
+            sent = await bot.send_message(chat_id=admin_id, text=part)
+            _link_reply(admin_id, sent.message_id, user_id)
+        except Exception as e:
+            logger.exception("Ошибка пересылки админу %s: %s", admin_id, e)
+            _failed_notifications.append((admin_id, part, 1, user_id))
+
+
+def _link_reply(admin_id: int, message_id: int, user_id: int) -> None:
+    _reply_links[(admin_id, message_id)] = user_id
+    if len(_reply_links) > MAX_REPLY_LINKS:
+        _reply_links.popitem(last=False)
+
+
+def reply_target(message: Message) -> Optional[int]:
+    """Кому ответ админа: реплай на пересланное обращение → id пользователя, иначе None."""
+    original = message.reply_to_message
+    if original is None:
+        return None
+    user_id = _reply_links.get((message.chat.id, original.message_id))
+    if user_id is None and original.from_user and original.from_user.is_bot:
+        match = _USER_ID_IN_HEADER.search((original.text or "").split("\n", 1)[0])
+        user_id = int(match.group(1)) if match else None
+    return user_id
+
+
+async def flush_support_tickets(bot: Bot) -> int:
+    """Отправляет админам всё, что ещё ждёт окна склейки (при остановке). Возвращает число обращений."""
+    waiting = [ticket for ticket in _tickets.values() if ticket.pending]
+    sleeping = set()
+    for ticket in waiting:
+        if ticket.timer is not None:   # ещё в окне склейки — отправим сами
+            ticket.timer.cancel()
+            sleeping.add(ticket.timer)
+            ticket.timer = None
+    await asyncio.gather(*(deliver_ticket(ticket, bot) for ticket in waiting),
+                         *(_timers - sleeping), return_exceptions=True)
+    return len(waiting)
+
 
-    for admin_id in ADMIN:
+async def retry_failed_notifications(bot: Bot) -> int:
+    """Повторяет неудавшиеся пересылки (не больше MAX_NOTIFY_ATTEMPTS попыток). Возвращает число доставленных."""
+    sent = 0
+    for _ in range(len(_failed_notifications)):
+        admin_id, text, attempts, user_id = _failed_notifications.popleft()
         try:
-            for i, part in enumerate(split_message(text)):
-                prefix = header if i == 0 else f"(Продолжение от {user.id}):\n"
-                await bot.send_message(chat_id=admin_id, text=prefix + part)
+            result = await bot.send_message(chat_id=admin_id, text=text)
+            _link_reply(admin_id, result.message_id, user_id)
+            sent += 1
         except Exception as e:
-            logger.exception("Ошибка пересылки админу %s: %s", admin_id, e)
\ No newline at end of file
+            if attempts + 1 < MAX_NOTIFY_ATTEMPTS:
+                _failed_notifications.append((admin_id, text, attempts + 1, user_id))
+            else:
+                logger.error("Пересылка админу %s не доставлена за %s попыток: %s", admin_id, attempts + 1, e)
+    return sent
\ No newline at end of file
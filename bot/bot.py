@@ -1,12 +1,16 @@
 import os
 import sys
-import time
 import html
 import asyncio
+import importlib
 import logging
+import time
 import uuid
-import math
-from contextlib import contextmanager
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Optional
+
+_IMPORT_STARTED = time.perf_counter()
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
@@ -14,18 +18,55 @@ from aiogram import Bot, Dispatcher, types
 from aiogram.client.bot import DefaultBotProperties
 from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.enums import ParseMode
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-
-from app.database import SessionLocal
-from app.models import Tea
-from app.crud import get_all_categories, get_teas_by_category, get_tea, search_teas
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app.analytics import CARD, CART_ADD, CATALOG, CHECKOUT, ORDER, EventBuffer
+from app.database import AsyncSessionLocal, async_engine, warm_pool
+from app.logging_setup import setup_logging
+from app.crud import (
+    confirm_reservation,
+    create_order,
+    get_checkout_contacts,
+    get_order_quantities,
+    get_recent_orders,
+    redeem_promocode,
+    unredeem_promocode,
+    get_all_tea_cards,
+    get_cart_items,
+    get_facets,
+    get_tea_card,
+    get_tea_list_items,
+    release_expired_reservations,
+    release_reservation,
+    reserve_stock,
+    save_funnel_events,
+)
+from app.promo import PromoError, quote
+from app.scheduler import Scheduler
+from app.tracing import TraceSink, Tracer, install_sql_tracing
+from app.read_models import TeaListItem
 from config import TOKEN, ADMIN, ADMIN_USER
 
-from admin_tools import handle_admin_command, handle_user_message
-
-logging.basicConfig(level=logging.INFO)
+from admin_tools import flush_support_tickets, handle_admin_command, handle_user_message, retry_failed_notifications
+from calculator import CalcInputError, parse_quantities, price_lines, snapshot_item
+from cards import CardView, render_card
+from catalog import RenderCache
+from inline_search import INLINE_CACHE_TIME, CatalogIndex, inline_result
+from lifecycle import InFlightTracker, run, write_stop_mark
+from navigation import Navigator
+from ordering import UserOrderingMiddleware
+from promos import PromoCache
+from update_tracing import install as install_tracing
+from user_lists import UserLists
+
+# Время импорта модуля с зависимостями (aiogram, SQLAlchemy, обработчики) — в отчёт warm_up().
+# recommendations (numpy) здесь не импортируется: он не нужен для первого апдейта, см. load_recommender()
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Прокси
@@ -44,14 +85,44 @@ bot = Bot(
 
 dp = Dispatcher()
 
+# Трассировка апдейтов (TRACE_SAMPLE_RATE / TRACE_SLOW_MS, см. app/tracing.py) — самой внешней,
+# чтобы в трассу попало и ожидание очереди пользователя
+tracer = Tracer(TraceSink())
+install_tracing(dp, session, tracer)
+if tracer.enabled:
+    install_sql_tracing(async_engine.sync_engine)
+
+# Учёт апдейтов в обработке (для остановки без потерь) — снаружи очереди пользователя,
+# чтобы ждущие своей очереди апдейты тоже считались
+in_flight = InFlightTracker()
+dp.update.outer_middleware(in_flight)
+
+# Апдейты одного пользователя — строго по очереди, разных пользователей — параллельно
+update_ordering = UserOrderingMiddleware()
+dp.update.outer_middleware(update_ordering)
+
 # Корзины пользователей в памяти: {user_id: [{"tea_id": int, "quantity": int}, ...]}
 # ВНИМАНИЕ: хранилище не персистентно — теряется при рестарте. Для продакшена
 # рекомендуется вынести корзины/заказы в БД (см. README, раздел «Дальнейшее развитие»).
 CARTS = {}
 
 CART_CLEAR_INTERVAL = 10 * 3600  # как часто полностью очищать кеш корзин, сек
-CATEGORIES_TTL = 60              # сколько секунд кешировать список категорий, сек
+CATALOG_CHECK_INTERVAL = 60      # как часто сверять версию каталога с БД (сброс кеша представлений), сек
 MAX_FIELD_LEN = 500             # максимальная длина текстовых полей заказа
+MAX_SEARCH_RESULTS = 30         # сколько результатов поиска показывать кнопками
+PROMO_CHECK_INTERVAL = 60        # как часто сверять набор промокодов с БД, сек
+RESERVATION_TTL = 15 * 60        # сколько держать резерв товара под неоформленный заказ, сек
+USER_LISTS_FLUSH_INTERVAL = 30   # как часто сохранять избранное/просмотренные в БД, сек
+RESERVATION_SWEEP_INTERVAL = 60  # как часто возвращать на склад истёкшие резервы, сек
+CHECKOUT_TIMEOUT = 2 * 3600      # через сколько брошенное оформление сбрасывается, сек
+CHECKOUT_SWEEP_INTERVAL = 300    # как часто искать брошенные оформления, сек
+NOTIFY_RETRY_INTERVAL = 30       # как часто повторять неудавшиеся пересылки администраторам, сек
+TRACE_FLUSH_INTERVAL = 5         # как часто дописывать собранные трассы в файл, сек
+FUNNEL_FLUSH_INTERVAL = 10       # как часто писать события воронки в БД, сек
+RECENT_ORDERS_SHOWN = 5          # сколько прошлых заказов показывать в «Мои заказы»
+SHUTDOWN_TIMEOUT = float(os.getenv("BOT_SHUTDOWN_TIMEOUT", "20"))  # сколько ждать обработчики при остановке, сек
+SIMILAR_SHOWN = 3               # сколько «похожих» товаров показывать под карточкой
+MAX_ORIGINS_SHOWN = 8           # сколько стран/регионов перечислять над списком категорий
 
 # Порядок категорий в меню каталога (категории не из списка добавляются в конец)
 CATEGORY_ORDER = [
@@ -68,51 +139,90 @@ CATEGORY_ORDER = [
     "Чайные духи",
 ]
 
-# Кеш категорий, чтобы не дёргать БД на каждое текстовое сообщение
-_categories_cache = {"value": [], "ts": 0.0}
-
-
-@contextmanager
-def db_session():
-    """Контекст-менеджер сессии БД: гарантирует close() и убирает дублирование boilerplate."""
-    db = SessionLocal()
-    try:
+# Сортировки списка товаров категории: код в callback_data → ключ crud.TEA_SORTS
+LIST_SORTS = {
+    "ppg": "price_per_gram",
+    "-ppg": "-price_per_gram",
+}
+
+# Кеш категорий, меню, списков и карточек — живёт до смены версии каталога в БД
+render_cache = RenderCache(CATALOG_CHECK_INTERVAL)
+
+# Индекс каталога в памяти: inline-режим и поиск без запросов к БД
+catalog_index = CatalogIndex()
+
+# Текущие «экраны» чатов: навигация правит их на месте, а не удаляет и шлёт заново
+nav = Navigator()
+promo_cache = PromoCache(PROMO_CHECK_INTERVAL)
+recommender = None   # Recommender, когда load_recommender() загрузит его после старта
+recommender_task: Optional[asyncio.Task] = None
+user_lists = UserLists()
+# События воронки продаж: обработчики только кладут их в буфер, в БД пишет flush_funnel
+funnel = EventBuffer()
+_funnel_dropped_reported = 0
+
+
+@asynccontextmanager
+async def db_session():
+    """Асинхронная сессия БД: не блокирует event loop и гарантирует возврат соединения в пул."""
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def get_categories(force: bool = False) -> list:
-    """Список активных категорий с кешированием на CATEGORIES_TTL секунд."""
-    now = time.monotonic()
-    if not force and _categories_cache["value"] and (now - _categories_cache["ts"] < CATEGORIES_TTL):
-        return _categories_cache["value"]
+async def _load_facets():
     try:
-        with db_session() as db:
-            categories = get_all_categories(db)
-        _categories_cache["value"] = categories
-        _categories_cache["ts"] = now
+        async with db_session() as db:
+            return await get_facets(db)
     except Exception as e:
-        logger.exception("Ошибка получения категорий: %s", e)
-        categories = _categories_cache["value"]  # отдаём последнее известное значение
-    return categories
+        logger.exception("Ошибка получения счётчиков каталога: %s", e)
+        return None  # не кешируем — попробуем снова при следующем обращении
+
+
+async def get_facet_counts() -> dict:
+    """
+    Число активных товаров по категориям и происхождению ({"category": {...}, "origin": {...}}).
+    Счётчики ведёт сама БД (tea_facets); здесь кешируются до смены версии каталога.
+    """
+    return await render_cache.get_or_build("facets", _load_facets) or {}
+
 
+async def get_categories() -> list:
+    """Список активных категорий; кешируется до смены версии каталога."""
+    return list((await get_facet_counts()).get("category", {}))
 
-def fetch_teas_map(tea_ids):
-    """Один запрос вместо N: возвращает {tea_id: Tea} для переданных id (порядок не гарантирован)."""
-    ids = list({tid for tid in tea_ids})
+
+async def fetch_teas_map(tea_ids):
+    """
+    Возвращает {tea_id: TeaCartItem} для переданных id (порядок не гарантирован).
+    Позиции берутся из кеша каталога, недостающие — одним запросом к БД.
+    """
+    ids = {tid for tid in tea_ids}
     if not ids:
         return {}
-    try:
-        with db_session() as db:
-            teas = db.query(Tea).filter(Tea.id.in_(ids)).all()
-        return {t.id: t for t in teas}
-    except Exception as e:
-        logger.exception("Ошибка пакетной выборки товаров: %s", e)
-        return {}
+    await render_cache.ensure_fresh()
+    teas = {}
+    missing = []
+    for tid in ids:
+        tea = render_cache.get(("cart_item", tid))
+        if tea is None:
+            missing.append(tid)
+        else:
+            teas[tid] = tea
+    if missing:
+        version = render_cache.version
+        try:
+            async with db_session() as db:
+                loaded = await get_cart_items(db, missing)
+        except Exception as e:
+            logger.exception("Ошибка пакетной выборки товаров: %s", e)
+            loaded = []
+        for tea in loaded:
+            render_cache.put(("cart_item", tea.id), tea, version)
+            teas[tea.id] = tea
+    return teas
 
 
-def cart_lines(user_id: int):
+async def cart_lines(user_id: int):
     """
     Возвращает (lines, total) для корзины пользователя одним пакетным запросом к БД.
     lines: список (tea, quantity, subtotal). Битые/удалённые позиции пропускаются.
@@ -120,25 +230,109 @@ def cart_lines(user_id: int):
     items = CARTS.get(user_id, [])
     if not items:
         return [], 0.0
-    teas = fetch_teas_map(item["tea_id"] for item in items)
+    teas = await fetch_teas_map(item["tea_id"] for item in items)
     lines = []
     total = 0.0
     for item in items:
         tea = teas.get(item["tea_id"])
         if not tea:
             continue
-        subtotal = float(tea.price) * item["quantity"]
+        subtotal = tea.price * item["quantity"]
         total += subtotal
         lines.append((tea, item["quantity"], subtotal))
     return lines, total
 
 
-# Фоновая задача: периодическая очистка CARTS
-async def clear_cache_periodically():
-    while True:
-        await asyncio.sleep(CART_CLEAR_INTERVAL)
-        CARTS.clear()
-        logger.info("Кеш (CARTS) очищен.")
+# Фоновые задачи (запускает scheduler, см. start_background_tasks; ошибки логирует он же)
+
+async def clear_carts():
+    """Периодическая очистка CARTS."""
+    CARTS.clear()
+    logger.info("Кеш (CARTS) очищен.")
+
+
+async def release_expired():
+    """Возвращает на склад резервы брошенных оформлений (SKIP LOCKED — не мешает заказам)."""
+    async with db_session() as db:
+        released = await release_expired_reservations(db)
+    if released:
+        logger.info("Возвращено на склад истёкших резервов: %s", released)
+
+
+async def flush_user_lists():
+    """Пачкой сохраняет в БД избранное и просмотренные, изменившиеся с прошлого раза."""
+    saved = await user_lists.flush()
+    if saved:
+        logger.info("Сохранены списки пользователей: %s", saved)
+
+
+async def refresh_caches():
+    """
+    Сверяет версии каталога и промокодов заранее, в фоне: при изменении индекс,
+    рекомендации и счётчики категорий перестраиваются здесь, а не на апдейте
+    первого пользователя после изменения.
+    """
+    if await render_cache.ensure_fresh(force=True) or catalog_index.version != render_cache.version:
+        await ensure_catalog_index()
+        await get_facet_counts()
+    await promo_cache.ensure_fresh(force=True)
+
+
+async def expire_checkouts():
+    """
+    Сбрасывает брошенные оформления (FSM старше CHECKOUT_TIMEOUT): иначе следующий
+    текст пользователя, отправленный через сутки, ушёл бы в «ФИО» или «адрес».
+    Резерв снимается, корзина остаётся. Работает с MemoryStorage (хранилище по умолчанию).
+    """
+    storage = dp.storage
+    if not isinstance(storage, MemoryStorage):
+        return
+    deadline = time.time() - CHECKOUT_TIMEOUT
+    for key, record in list(storage.storage.items()):
+        if record.state not in _ORDER_STATES or record.data.get("checkout_started", 0) > deadline:
+            continue
+        order_number = record.data.get("order_number")
+        await storage.set_state(key, None)
+        await storage.set_data(key, {})
+        if order_number:
+            async with db_session() as db:
+                await release_reservation(db, order_number)
+        try:
+            await bot.send_message(
+                key.chat_id,
+                "Оформление заказа прервано по времени. Корзина сохранена — оформите заказ заново, когда будете готовы.",
+            )
+        except Exception as e:
+            logger.warning("Не удалось уведомить %s о сброшенном оформлении: %s", key.chat_id, e)
+        logger.info("Сброшено брошенное оформление пользователя %s", key.user_id)
+
+
+async def _save_funnel_batch(batch):
+    async with db_session() as db:
+        await save_funnel_events(db, batch)
+
+
+async def flush_funnel():
+    """Пачками пишет события воронки в БД; о вытесненных из переполненного буфера предупреждает."""
+    global _funnel_dropped_reported
+    try:
+        await funnel.flush(_save_funnel_batch)
+    finally:
+        if funnel.dropped > _funnel_dropped_reported:
+            logger.warning("Буфер воронки переполнен: потеряно событий %s (всего %s).",
+                           funnel.dropped - _funnel_dropped_reported, funnel.dropped)
+            _funnel_dropped_reported = funnel.dropped
+
+
+async def flush_traces():
+    await tracer.sink.flush()
+
+
+async def retry_notifications():
+    """Повторяет пересылки администраторам, которые не прошли с первого раза."""
+    sent = await retry_failed_notifications(bot)
+    if sent:
+        logger.info("Повторно доставлено уведомлений администраторам: %s", sent)
 
 
 # FSM-Состояния
@@ -148,6 +342,10 @@ class OrderForm(StatesGroup):
     waiting_for_phone = State()
     waiting_for_comment = State()
     waiting_for_promo = State()
+    waiting_for_confirm = State()
+
+
+_ORDER_STATES = set(OrderForm.__all_states_names__)
 
 
 class SearchForm(StatesGroup):
@@ -159,76 +357,263 @@ class TeaCalcForm(StatesGroup):
 
 
 # Формирование клавиатур
-def main_menu_reply() -> types.ReplyKeyboardMarkup:
-    buttons = [
+_MAIN_MENU = types.ReplyKeyboardMarkup(
+    keyboard=[
         [types.KeyboardButton(text="Каталог"), types.KeyboardButton(text="Поиск")],
-        [types.KeyboardButton(text="Корзина"), types.KeyboardButton(text="Поддержка")]
-    ]
-    return types.ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
+        [types.KeyboardButton(text="Корзина"), types.KeyboardButton(text="Поддержка")],
+        [types.KeyboardButton(text="Избранное"), types.KeyboardButton(text="Недавно смотрели")],
+        [types.KeyboardButton(text="Мои заказы")],
+    ],
+    resize_keyboard=True,
+)
 
+_CART_KEYBOARD = types.InlineKeyboardMarkup(inline_keyboard=[
+    [types.InlineKeyboardButton(text="Оформить заказ", callback_data="checkout")],
+    [types.InlineKeyboardButton(text="Очистить корзину", callback_data="clear_cart")],
+    [types.InlineKeyboardButton(text="Редактировать корзину", callback_data="edit_cart")],
+    [types.InlineKeyboardButton(text="Калькулятор корзины", callback_data="calc_cart")],
+    [types.InlineKeyboardButton(text="Назад", callback_data="back_to_main")]
+])
 
-def catalog_menu_reply() -> types.ReplyKeyboardMarkup:
-    """
-    Формирование клавиатуры из категорий в порядке CATEGORY_ORDER.
-    Категории, которых нет в списке, добавляются в конец. Последняя строка — "Назад".
-    """
-    categories = get_categories()
+
+# Главный экран для inline-навигации («В меню» правит текущее сообщение в него)
+_MAIN_INLINE = types.InlineKeyboardMarkup(inline_keyboard=[
+    [types.InlineKeyboardButton(text="Каталог", callback_data="nav:catalog"),
+     types.InlineKeyboardButton(text="Поиск", callback_data="nav:search")],
+    [types.InlineKeyboardButton(text="Корзина", callback_data="open_cart"),
+     types.InlineKeyboardButton(text="Поддержка", url=f"https://t.me/{ADMIN_USER}")],
+    [types.InlineKeyboardButton(text="♥ Избранное", callback_data="nav:favorites"),
+     types.InlineKeyboardButton(text="Недавно смотрели", callback_data="nav:recent")],
+    [types.InlineKeyboardButton(text="Мои заказы", callback_data="nav:orders")],
+])
+
+_MENU_BUTTON = types.InlineKeyboardButton(text="В меню", callback_data="back_to_main")
+
+
+def main_menu_reply() -> types.ReplyKeyboardMarkup:
+    """Главное меню не зависит от каталога — собирается один раз при импорте."""
+    return _MAIN_MENU
+
+
+def _category_callback(category: str, sort: Optional[str] = None) -> str:
+    if sort:
+        return f"sort:{sort}:{category}"
+    return f"cat:{category}"
+
+
+async def _build_catalog_menu():
+    counts = (await get_facet_counts()).get("category", {})
+    if not counts:
+        return None  # БД недоступна — не кешируем пустое меню
 
     # Сначала — категории из CATEGORY_ORDER, затем все прочие из БД
-    ordered = [cat for cat in CATEGORY_ORDER if cat in categories]
-    ordered += [cat for cat in categories if cat not in ordered]
+    ordered = [cat for cat in CATEGORY_ORDER if cat in counts]
+    ordered += [cat for cat in counts if cat not in ordered]
 
-    buttons = [[types.KeyboardButton(text=cat)] for cat in ordered]
-    buttons.append([types.KeyboardButton(text="Назад")])
-    return types.ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
+    buttons = []
+    for cat in ordered:
+        callback_data = _category_callback(cat)
+        if len(callback_data.encode()) > 64:  # лимит Telegram на callback_data
+            logger.warning("Категория %r слишком длинная для inline-кнопки, пропущена.", cat)
+            continue
+        buttons.append([types.InlineKeyboardButton(text=f"{cat} ({counts[cat]})", callback_data=callback_data)])
+    buttons.append([_MENU_BUTTON])
+    return types.InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def product_list_inline(category: str) -> types.InlineKeyboardMarkup:
+async def catalog_menu_inline() -> types.InlineKeyboardMarkup:
     """
-    Формирование inline-клавиатуры со списком товаров выбранной категории из БД.
+    Inline-клавиатура категорий в порядке CATEGORY_ORDER (прочие — в конце),
+    последняя строка — «В меню». Кешируется до смены версии каталога.
+    Inline, а не reply — чтобы переходы каталог ⇄ категория правили одно сообщение.
     """
-    try:
-        with db_session() as db:
-            teas = get_teas_by_category(db, category)  # возвращает List[Tea]
-    except Exception as e:
-        logger.exception("Ошибка получения чаёв по категории: %s", e)
-        teas = []
+    markup = await render_cache.get_or_build("menu:catalog", _build_catalog_menu)
+    if markup is None:
+        markup = types.InlineKeyboardMarkup(inline_keyboard=[[_MENU_BUTTON]])
+    return markup
+
+
+async def catalog_screen_text() -> str:
+    """Заголовок каталога; если у товаров заполнено происхождение — самые частые со счётчиками."""
+    origins = (await get_facet_counts()).get("origin", {})
+    text = "Выберите категорию:"
+    if origins:
+        top = list(origins.items())[:MAX_ORIGINS_SHOWN]
+        text = (
+            "<b>Происхождение:</b> "
+            + ", ".join(f"{html.escape(origin)} ({count})" for origin, count in top)
+            + "\n\n" + text
+        )
+    return text
+
 
+def category_screen_text(category: str) -> str:
+    return f"<b>Категория:</b> {html.escape(category)}\nВыберите товар:"
+
+
+def _sort_buttons(category: str, sort: Optional[str]) -> list:
+    """Ряд «₽/г ↑ / ₽/г ↓ / По порядку»; текущая сортировка отмечена точкой."""
+    options = [("ppg", "₽/г ↑"), ("-ppg", "₽/г ↓"), (None, "По порядку")]
+    row = []
+    for code, title in options:
+        if code is None and sort is None:
+            continue  # «по порядку» нужна, только когда список уже отсортирован
+        callback_data = _category_callback(category, code)
+        if len(callback_data.encode()) > 64:  # лимит Telegram на callback_data
+            continue
+        row.append(types.InlineKeyboardButton(
+            text=f"• {title}" if code == sort else title, callback_data=callback_data,
+        ))
+    return row
+
+
+def _product_list_markup(teas, category: str = "", sort: Optional[str] = None) -> types.InlineKeyboardMarkup:
     buttons = []
     for tea in teas:
+        text = tea.name
+        if sort and tea.price_per_gram is not None:
+            text = f"{tea.name} · {tea.price_per_gram:.2f}₽/г"
         buttons.append([types.InlineKeyboardButton(
-            text=tea.name,
+            text=text,
             callback_data=f"item:{tea.id}"
         )])
 
-    main_btn = types.InlineKeyboardButton(text="В меню", callback_data="back_to_main")
+    if teas and category:
+        sort_row = _sort_buttons(category, sort)
+        if sort_row:
+            buttons.append(sort_row)
     back_btn = types.InlineKeyboardButton(text="Назад", callback_data="back_to_catalog")
-    buttons.append([main_btn, back_btn])
+    buttons.append([_MENU_BUTTON, back_btn])
     return types.InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+async def product_list_inline(category: str, sort: Optional[str] = None) -> types.InlineKeyboardMarkup:
+    """
+    Формирование inline-клавиатуры со списком товаров выбранной категории из БД.
+    sort — код из LIST_SORTS (None — порядок по умолчанию); сортирует БД по индексу.
+    Готовая клавиатура кешируется до смены версии каталога.
+    """
+    async def build():
+        try:
+            async with db_session() as db:
+                # только id, name и цена за грамм
+                teas = await get_tea_list_items(db, category, LIST_SORTS.get(sort, "id"))
+        except Exception as e:
+            logger.exception("Ошибка получения чаёв по категории: %s", e)
+            return None
+        return _product_list_markup(teas, category, sort)
+
+    markup = await render_cache.get_or_build(("list", category, sort), build)
+    return markup if markup is not None else _product_list_markup([])
+
+
 def product_detail_inline(tea_id: int) -> types.InlineKeyboardMarkup:
     """
-    Для конкретного товара: "Добавить в корзину", быстрый переход в корзину,
-    "Назад" (скрыть карточку, вернуться к списку) и "В меню".
+    Для конкретного товара: "Добавить в корзину", "В избранное" (переключатель —
+    клавиатура общая для всех, поэтому состояние показываем ответом на нажатие),
+    быстрый переход в корзину, «Похожие» (соседи из recommender, без БД), "Назад" (скрыть карточку,
+    вернуться к списку) и "В меню".
     """
     buttons = [
         [types.InlineKeyboardButton(text="🛒 Добавить в корзину", callback_data=f"add:{tea_id}")],
-        [types.InlineKeyboardButton(text="🧺 Перейти в корзину", callback_data="open_cart")],
-        [
-            types.InlineKeyboardButton(text="Назад", callback_data="back_to_details"),
-            types.InlineKeyboardButton(text="В меню", callback_data="back_to_main"),
-        ],
+        [types.InlineKeyboardButton(text="♥ В избранное", callback_data=f"fav:{tea_id}"),
+         types.InlineKeyboardButton(text="🧺 Перейти в корзину", callback_data="open_cart")],
     ]
+    similar = recommender.similar_items(tea_id, SIMILAR_SHOWN) if recommender is not None else []
+    for other_id, name in similar:
+        title = name if len(name) <= 40 else name[:39] + "…"
+        buttons.append([types.InlineKeyboardButton(text=f"🍃 Похожий: {title}", callback_data=f"item:{other_id}")])
+    buttons.append([
+        types.InlineKeyboardButton(text="Назад", callback_data="back_to_details"),
+        types.InlineKeyboardButton(text="В меню", callback_data="back_to_main"),
+    ])
     return types.InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def build_cart_message(user_id: int):
+async def get_card_view(tea_id: int) -> Optional[CardView]:
+    """Готовая карточка из кеша или из БД (None — товар не найден/недоступен)."""
+    # Индекс и рекомендации собираются вместе со всеми карточками одним запросом
+    # на версию каталога — после этого карточка почти всегда уже в кеше
+    await ensure_catalog_index()
+    async def build():
+        try:
+            async with db_session() as db:
+                tea_obj = await get_tea_card(db, tea_id)
+        except Exception as e:
+            logger.exception("Ошибка получения товара: %s", e)
+            return None
+        return render_card(tea_obj, product_detail_inline(tea_obj.id)) if tea_obj else None
+
+    return await render_cache.get_or_build(("card", tea_id), build)
+
+
+async def _load_index_cards():
+    """Все активные карточки одним запросом; заодно кладём готовые карточки в render_cache."""
+    version = render_cache.version
+    try:
+        async with db_session() as db:
+            teas = await get_all_tea_cards(db)
+    except Exception as e:
+        logger.exception("Ошибка загрузки каталога для индекса: %s", e)
+        return None
+    # Сначала соседи — их кнопки входят в клавиатуру карточек
+    if recommender is not None:
+        recommender.update(teas, version)
+    cards = []
+    for tea_obj in teas:
+        card = render_card(tea_obj, product_detail_inline(tea_obj.id))
+        render_cache.put(("card", tea_obj.id), card, version)
+        cards.append((tea_obj, card))
+    return cards
+
+
+async def ensure_catalog_index() -> None:
+    """Индекс перестраивается только при смене версии каталога."""
+    await render_cache.ensure_fresh()
+    await catalog_index.ensure(render_cache.version, _load_index_cards)
+
+
+async def load_recommender() -> None:
+    """
+    «Похожие» подключаются после старта: numpy импортируется в потоке, не занимая
+    цикл событий, затем индекс пересобирается — карточки получают кнопки «Похожий».
+    До этого карточки показываются без них.
+    """
+    global recommender
+    started = time.perf_counter()
+    try:
+        module = await asyncio.to_thread(importlib.import_module, "recommendations")
+    except Exception as e:
+        logger.exception("Рекомендации недоступны, карточки — без «Похожих»: %s", e)
+        return
+    recommender = module.Recommender()
+    catalog_index.invalidate()
+    await ensure_catalog_index()
+    logger.info("Рекомендации загружены за %.2f с.", time.perf_counter() - started)
+
+
+@lru_cache(maxsize=4096)
+def _cart_edit_row(tea_id: int) -> list:
+    """Кнопки «➖ / ➕ / ❌» одной позиции — зависят только от id, собираются один раз."""
+    return [
+        types.InlineKeyboardButton(text="➖", callback_data=f"cart:minus:{tea_id}"),
+        types.InlineKeyboardButton(text="➕", callback_data=f"cart:plus:{tea_id}"),
+        types.InlineKeyboardButton(text="❌", callback_data=f"cart:delete:{tea_id}"),
+    ]
+
+
+_CART_EDIT_FOOTER = [
+    [types.InlineKeyboardButton(text="Назад", callback_data="back_to_cart")],
+    [types.InlineKeyboardButton(text="В меню", callback_data="back_to_main")],
+]
+
+
+async def build_cart_message(user_id: int):
     """
     Строим текст корзины и выдаем inline-клавиатуру:
     Оформить заказ, Очистить корзину, Редактировать корзину, Калькулятор.
     """
-    lines, total = cart_lines(user_id)
+    lines, total = await cart_lines(user_id)
     if not lines:
         return "Ваша корзина пуста.", None
 
@@ -237,46 +622,29 @@ def build_cart_message(user_id: int):
         text += f"<b>{html.escape(tea_obj.name)}</b> x{qty} — {subtotal:.0f}₽\n"
 
     text += f"\n<b>Итого:</b> {total:.0f}₽"
-    keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
-        [types.InlineKeyboardButton(text="Оформить заказ", callback_data="checkout")],
-        [types.InlineKeyboardButton(text="Очистить корзину", callback_data="clear_cart")],
-        [types.InlineKeyboardButton(text="Редактировать корзину", callback_data="edit_cart")],
-        [types.InlineKeyboardButton(text="Калькулятор корзины", callback_data="calc_cart")],
-        [types.InlineKeyboardButton(text="Назад", callback_data="back_to_main")]
-    ])
-    return text, keyboard
+    return text, _CART_KEYBOARD
 
 
-def build_cart_edit_message(user_id: int):
+async def build_cart_edit_message(user_id: int):
     """
     Формируем текст и inline-клавиатуру для редактирования корзины:
     Кнопки «-», «+», «❌» для каждого товара,
     а внизу — «Назад» и «В меню».
     """
-    lines, _ = cart_lines(user_id)
+    lines, _ = await cart_lines(user_id)
     if not lines:
         return "Ваша корзина пуста.", None
 
     text = "<b>Редактирование корзины:</b>\n"
-    keyboard = types.InlineKeyboardMarkup(inline_keyboard=[])
+    rows = []
 
     # Строки с товарами и кнопками «➖ / ➕ / ❌»
     for tea_obj, qty, subtotal in lines:
         text += f"<b>{html.escape(tea_obj.name)}</b> x{qty} — {subtotal:.0f}₽\n"
-        keyboard.inline_keyboard.append([
-            types.InlineKeyboardButton(text="➖", callback_data=f"cart:minus:{tea_obj.id}"),
-            types.InlineKeyboardButton(text="➕", callback_data=f"cart:plus:{tea_obj.id}"),
-            types.InlineKeyboardButton(text="❌", callback_data=f"cart:delete:{tea_obj.id}"),
-        ])
+        rows.append(_cart_edit_row(tea_obj.id))
 
     text += "\n"
-    keyboard.inline_keyboard.append([
-        types.InlineKeyboardButton(text="Назад", callback_data="back_to_cart")
-    ])
-    keyboard.inline_keyboard.append([
-        types.InlineKeyboardButton(text="В меню", callback_data="back_to_main")
-    ])
-
+    keyboard = types.InlineKeyboardMarkup(inline_keyboard=rows + _CART_EDIT_FOOTER)
     return text, keyboard
 
 
@@ -293,21 +661,49 @@ def support_inline() -> types.InlineKeyboardMarkup:
     return keyboard
 
 
+_USER_LIST_TITLES = {
+    "favorites": ("<b>Избранное:</b>", "В избранном пока ничего нет — добавьте товар кнопкой «♥ В избранное»."),
+    "recent": ("<b>Недавно смотрели:</b>", "Вы ещё не открывали карточки товаров."),
+}
+
+
+async def user_list_screen(kind: str, user_id: int):
+    """Экран избранного или недавно просмотренных: списки и названия — из памяти, без БД."""
+    ids = await (user_lists.favorites(user_id) if kind == "favorites" else user_lists.recent(user_id))
+    await ensure_catalog_index()
+    entries = [entry for entry in (catalog_index.get(tea_id) for tea_id in ids) if entry]
+    title, empty = _USER_LIST_TITLES[kind]
+    buttons = [
+        [types.InlineKeyboardButton(text=entry.title, callback_data=f"item:{entry.card.tea_id}")]
+        for entry in entries
+    ]
+    buttons.append([_MENU_BUTTON])
+    return (title if entries else empty), types.InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
 # Обработчики message
 
 
 @dp.message(Command("start"))
-async def start(message: types.Message):
+async def start(message: types.Message, command: CommandObject):
     await message.answer(
         "Добро пожаловать! Выберите нужное действие:",
         reply_markup=main_menu_reply()
     )
+    # Переход по ссылке «Открыть в боте» из inline-режима: /start tea_<id>
+    payload = command.args or ""
+    if payload.startswith("tea_") and payload[4:].isdigit():
+        card = await get_card_view(int(payload[4:]))
+        if card:
+            await nav.show_card(bot, message.chat.id, card)
+            await user_lists.viewed(message.from_user.id, card.tea_id)
 
 
 @dp.message(Command("cancel"))
 async def cancel(message: types.Message, state: FSMContext):
     current_state = await state.get_state()
     if current_state:
+        await release_order_stock(state)
         await state.clear()
         await message.answer("Операция отменена.", reply_markup=main_menu_reply())
     else:
@@ -316,12 +712,13 @@ async def cancel(message: types.Message, state: FSMContext):
 
 @dp.message(lambda message: message.text == "Каталог")
 async def catalog_menu(message: types.Message):
-    await message.answer("Выберите категорию:", reply_markup=catalog_menu_reply())
+    await nav.show_text(bot, message.chat.id, await catalog_screen_text(), await catalog_menu_inline())
+    funnel.emit(CATALOG, message.from_user.id)
 
 
 @dp.message(lambda message: message.text == "Корзина")
 async def show_cart(message: types.Message):
-    cart_text, cart_keyboard = build_cart_message(message.from_user.id)
+    cart_text, cart_keyboard = await build_cart_message(message.from_user.id)
     await message.answer(
         cart_text,
         reply_markup=cart_keyboard if cart_keyboard else types.ReplyKeyboardRemove()
@@ -336,6 +733,13 @@ async def support(message: types.Message):
     )
 
 
+@dp.message(lambda message: message.text in ("Избранное", "Недавно смотрели"))
+async def user_list_message(message: types.Message):
+    kind = "favorites" if message.text == "Избранное" else "recent"
+    text, markup = await user_list_screen(kind, message.from_user.id)
+    await nav.show_text(bot, message.chat.id, text, markup)
+
+
 @dp.message(lambda message: message.text == "Поиск")
 async def search_start(message: types.Message, state: FSMContext):
     await message.answer("Введите ключевое слово или ID товара (для отмены /cancel):")
@@ -343,45 +747,38 @@ async def search_start(message: types.Message, state: FSMContext):
 
 
 # Проверка, является ли текст сообщением-именем категории (через кеш категорий)
-def is_category_message(text: str) -> bool:
-    if not text:
+async def is_category_message(message: types.Message) -> bool:
+    if not message.text:
         return False
-    return text in get_categories()
+    return message.text in await get_categories()
 
 
-@dp.message(lambda message: is_category_message(message.text))
+@dp.message(is_category_message)
 async def select_category(message: types.Message):
     """
     Когда пользователь отправил название категории, показываем ему список товаров этой категории.
     """
     category = message.text
-    await message.answer(
-        f"<b>Категория:</b> {category}\nВыберите товар:",
-        reply_markup=types.ReplyKeyboardRemove()
+    await nav.show_text(
+        bot, message.chat.id, category_screen_text(category), await product_list_inline(category)
     )
-    # Inline-клавиатура со списком товаров:
-    await message.answer("Список товаров:", reply_markup=product_list_inline(category))
 
 
 @dp.message(SearchForm.waiting_for_query)
 async def process_search(message: types.Message, state: FSMContext):
     query_text = (message.text or "").strip()
-    results = []
     if not query_text:
         await message.answer("Введите непустой запрос.", reply_markup=main_menu_reply())
         await state.clear()
         return
-    try:
-        with db_session() as db:
-            if query_text.isdigit():
-                tea_obj = get_tea(db, int(query_text))
-                if tea_obj:  # get_tea уже фильтрует по is_active
-                    results = [tea_obj]
-            else:
-                results = search_teas(db, query_text)
-    except Exception as e:
-        logger.exception("Ошибка при поиске товаров: %s", e)
-        results = []
+    # Ищем по индексу каталога в памяти — без запроса к БД на каждый поиск
+    await ensure_catalog_index()
+    if query_text.isdigit():
+        entry = catalog_index.get(int(query_text))
+        matches = [entry] if entry else []
+    else:
+        matches = catalog_index.search(query_text)[:MAX_SEARCH_RESULTS]
+    results = [TeaListItem(entry.card.tea_id, entry.title) for entry in matches]
 
     if not results:
         await message.answer("Товар не найден.", reply_markup=main_menu_reply())
@@ -413,21 +810,49 @@ async def go_back(message: types.Message):
 @dp.callback_query(lambda c: c.data == "back_to_main")
 async def back_to_main_callback(query: types.CallbackQuery):
     await query.answer()
-    try:
-        await query.message.delete()
-    except Exception:
-        pass
-    await bot.send_message(query.from_user.id, "Главное меню:", reply_markup=main_menu_reply())
+    await nav.show_text(bot, query.from_user.id, "Главное меню:", _MAIN_INLINE, source=query.message)
 
 
-@dp.callback_query(lambda c: c.data == "back_to_catalog")
+@dp.callback_query(lambda c: c.data in ("back_to_catalog", "nav:catalog"))
 async def back_to_catalog_callback(query: types.CallbackQuery):
     await query.answer()
-    try:
-        await query.message.delete()
-    except Exception:
-        pass
-    await bot.send_message(query.from_user.id, "Выберите категорию:", reply_markup=catalog_menu_reply())
+    await nav.show_text(
+        bot, query.from_user.id, await catalog_screen_text(), await catalog_menu_inline(), source=query.message
+    )
+    funnel.emit(CATALOG, query.from_user.id)
+
+
+@dp.callback_query(lambda c: c.data and c.data.startswith(("cat:", "sort:")))
+async def category_callback(query: types.CallbackQuery):
+    """
+    Выбор категории из inline-каталога (cat:<категория>) или смена сортировки
+    списка (sort:<код>:<категория>): список товаров в том же сообщении.
+    """
+    if query.data.startswith("sort:"):
+        _, sort, category = query.data.split(":", 2)
+        if sort not in LIST_SORTS:
+            await query.answer()
+            return
+    else:
+        sort, category = None, query.data.split(":", 1)[1]
+    if category not in await get_categories():
+        await query.answer("Категория недоступна.", show_alert=True)
+        return
+    await query.answer()
+    await nav.show_text(
+        bot, query.from_user.id, category_screen_text(category),
+        await product_list_inline(category, sort), source=query.message,
+    )
+
+
+@dp.callback_query(lambda c: c.data == "nav:search")
+async def search_callback(query: types.CallbackQuery, state: FSMContext):
+    await query.answer()
+    await nav.show_text(
+        bot, query.from_user.id, "Введите ключевое слово или ID товара (для отмены /cancel):",
+        source=query.message,
+    )
+    await state.set_state(SearchForm.waiting_for_query)
 
 
 @dp.callback_query(lambda c: c.data and c.data.startswith("item:"))
@@ -444,86 +869,39 @@ async def product_item_callback(query: types.CallbackQuery):
         await query.answer("Неверный товар.")
         return
 
-    try:
-        with db_session() as db:
-            tea_obj = get_tea(db, tea_id)
-    except Exception as e:
-        logger.exception("Ошибка получения товара: %s", e)
-        tea_obj = None
-
-    if not tea_obj or not tea_obj.is_active:
+    card = await get_card_view(tea_id)
+    if not card:
         await bot.send_message(query.from_user.id, "Товар не найден или недоступен.")
         return
 
-    # Формируем подпись (caption). Название/описание экранируем — они показываются как HTML.
-    caption = (
-        f"<b>🍵 {html.escape(tea_obj.name)}</b>\n"
-        f"<b>💰 Цена:</b> {float(tea_obj.price):.0f}₽"
-    )
-    if tea_obj.weight:
-        price_per_gram = float(tea_obj.price) / float(tea_obj.weight)
-        caption += f"\n<b>💶 Цена за грамм:</b> {price_per_gram:.2f}₽/г"
-    if tea_obj.description:
-        # Описание в БД содержит доверенную HTML-разметку (<b>, <i>) от админа — не экранируем.
-        caption += f"\n\n<i>{tea_obj.description}</i>"
+    await nav.show_card(bot, query.from_user.id, card)
+    await user_lists.viewed(query.from_user.id, tea_id)
+    funnel.emit(CARD, query.from_user.id, tea_id)
 
-    photo_url = getattr(tea_obj, "photo_url", None)
 
-    if photo_url and photo_url.startswith("http"):
-        try:
-            await bot.send_photo(
-                query.from_user.id,
-                photo=photo_url,
-                caption=caption,
-                reply_markup=product_detail_inline(tea_obj.id)
-            )
-        except Exception as e:
-            logger.exception("Ошибка отправки фото по URL: %s", e)
-            await bot.send_message(
-                query.from_user.id,
-                "Ошибка при отправке фото по URL.\n" + caption,
-                reply_markup=product_detail_inline(tea_obj.id)
-            )
-    else:
-        if photo_url:
-            photo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), photo_url)
-            if os.path.exists(photo_path):
-                try:
-                    with open(photo_path, "rb") as photo_file:
-                        await bot.send_photo(
-                            query.from_user.id,
-                            photo=photo_file,
-                            caption=caption,
-                            reply_markup=product_detail_inline(tea_obj.id)
-                        )
-                except Exception as e:
-                    logger.exception("Ошибка при открытии фото: %s", e)
-                    await bot.send_message(
-                        query.from_user.id,
-                        "Ошибка при открытии фото.\n" + caption,
-                        reply_markup=product_detail_inline(tea_obj.id)
-                    )
-            else:
-                await bot.send_message(
-                    query.from_user.id,
-                    "Фото не найдено.\n" + caption,
-                    reply_markup=product_detail_inline(tea_obj.id)
-                )
-        else:
-            await bot.send_message(
-                query.from_user.id,
-                caption,
-                reply_markup=product_detail_inline(tea_obj.id)
-            )
+@dp.callback_query(lambda c: c.data in ("nav:favorites", "nav:recent"))
+async def user_list_callback(query: types.CallbackQuery):
+    await query.answer()
+    text, markup = await user_list_screen(query.data.split(":", 1)[1], query.from_user.id)
+    await nav.show_text(bot, query.from_user.id, text, markup, source=query.message)
+
+
+@dp.callback_query(lambda c: c.data and c.data.startswith("fav:"))
+async def favorite_callback(query: types.CallbackQuery):
+    """Переключает товар в избранном: fav:<tea_id>. Только память — в БД уйдёт пачкой."""
+    try:
+        tea_id = int(query.data.split(":", 1)[1])
+    except ValueError:
+        await query.answer("Неверный товар.", show_alert=True)
+        return
+    added = await user_lists.toggle_favorite(query.from_user.id, tea_id)
+    await query.answer("Добавлено в избранное ♥" if added else "Убрано из избранного")
 
 
 @dp.callback_query(lambda c: c.data == "back_to_details")
 async def back_to_details_callback(query: types.CallbackQuery):
     await query.answer()
-    try:
-        await query.message.delete()
-    except Exception:
-        pass
+    await nav.close(bot, query.from_user.id, query.message)
 
 
 @dp.callback_query(lambda c: c.data and c.data.startswith("add:"))
@@ -549,6 +927,7 @@ async def add_to_cart_callback(query: types.CallbackQuery):
     else:
         cart.append({"tea_id": tea_id, "quantity": 1})
 
+    funnel.emit(CART_ADD, user_id, tea_id)
     await query.answer("Товар добавлен в корзину.")
 
 
@@ -570,7 +949,7 @@ async def clear_cart_callback(query: types.CallbackQuery):
 @dp.callback_query(lambda c: c.data == "edit_cart")
 async def edit_cart_callback(query: types.CallbackQuery):
     await query.answer()
-    text, keyboard = build_cart_edit_message(query.from_user.id)
+    text, keyboard = await build_cart_edit_message(query.from_user.id)
     await query.message.edit_text(text, reply_markup=keyboard)
 
 
@@ -605,15 +984,30 @@ async def cart_edit_callback(query: types.CallbackQuery):
             break
 
     CARTS[user_id] = items
-    text, keyboard = build_cart_edit_message(user_id)
+    text, keyboard = await build_cart_edit_message(user_id)
     await query.message.edit_text(text, reply_markup=keyboard)
 
 
+def _calc_prompt(items, start: int) -> str:
+    """Подсказка калькулятора: все позиции сразу и варианты ввода одним сообщением."""
+    lines = ["<b>Калькулятор по граммам</b>\n"]
+    for i, item in enumerate(items[start:], start + 1):
+        lines.append(f"{i}. {html.escape(item['name'])} — {item['price_per_gram']:.2f}₽/г")
+    current = items[start]
+    lines.append(
+        "\nВведите граммы одним сообщением:\n"
+        "• по порядку: <code>50 100 25</code>\n"
+        "• по названию: <code>шу 50, улун 100</code>\n"
+        f"• или одно число — для <b>{html.escape(current['name'])}</b>, и дальше по одной позиции"
+    )
+    return "\n".join(lines)
+
+
 @dp.callback_query(lambda c: c.data == "calc_cart")
 async def calc_cart_callback(query: types.CallbackQuery, state: FSMContext):
     """
-    Калькулятор: для каждого товара из корзины, у которого есть поле weight,
-    спрашиваем, сколько грамм нужно, и считаем стоимость.
+    Калькулятор: по товарам корзины с указанным весом считает стоимость нужного
+    количества грамм. Цены за грамм снимаются один раз при открытии калькулятора.
     """
     await query.answer()
     user_id = query.from_user.id
@@ -623,119 +1017,221 @@ async def calc_cart_callback(query: types.CallbackQuery, state: FSMContext):
         return
 
     # Берём из корзины только товары с указанным весом, сохраняя порядок корзины
-    teas = fetch_teas_map(item["tea_id"] for item in items)
-    calc_ids = [item["tea_id"] for item in items
-                if teas.get(item["tea_id"]) and teas[item["tea_id"]].weight]
+    teas = await fetch_teas_map(item["tea_id"] for item in items)
+    calc_items = []
+    for item in items:
+        tea_obj = teas.get(item["tea_id"])
+        if tea_obj and tea_obj.weight and not any(c["id"] == tea_obj.id for c in calc_items):
+            calc_items.append(snapshot_item(tea_obj))
 
-    if not calc_ids:
+    if not calc_items:
         await query.answer("Нет товаров с указанием веса для расчёта.", show_alert=True)
         return
 
-    # В FSM храним только id (а не ORM-объекты) — это безопасно для любого storage
-    await state.update_data(calc_ids=calc_ids, calc_index=0, calc_total=0, calc_results=[])
-    first_tea = teas[calc_ids[0]]
-    price_per_gram = float(first_tea.price) / float(first_tea.weight)
-    await query.message.edit_text(
-        f"Введите количество грамм для <b>{html.escape(first_tea.name)}</b>\n"
-        f"(Цена за грамм: {price_per_gram:.2f}₽):",
-        parse_mode=ParseMode.HTML
-    )
+    # Снимок позиций в FSM (только JSON-совместимые поля) — дальше калькулятор не ходит в БД
+    await state.update_data(calc_items=calc_items, calc_index=0, calc_grams={})
+    await query.message.edit_text(_calc_prompt(calc_items, 0), parse_mode=ParseMode.HTML)
     await state.set_state(TeaCalcForm.waiting_for_grams)
 
 
 @dp.message(TeaCalcForm.waiting_for_grams)
 async def process_grams(message: types.Message, state: FSMContext):
-    user_input = (message.text or "").strip().replace(",", ".")
-    try:
-        grams = float(user_input)
-        if grams <= 0:
-            raise ValueError
-    except ValueError:
-        await message.answer("Пожалуйста, введите положительное число грамм.")
-        return
-
     data = await state.get_data()
-    calc_ids = data.get("calc_ids", [])
+    calc_items = data.get("calc_items", [])
     calc_index = data.get("calc_index", 0)
-    calc_total = data.get("calc_total", 0)
-    calc_results = data.get("calc_results", [])
+    # Ключи — строки: FSM-хранилище может сериализовать данные в JSON
+    calc_grams = {int(k): v for k, v in data.get("calc_grams", {}).items()}
 
-    if not calc_ids or calc_index >= len(calc_ids):
+    if not calc_items or calc_index >= len(calc_items):
         await message.answer("Сессия расчёта устарела. Откройте калькулятор заново.")
         await state.clear()
         return
 
-    teas = fetch_teas_map(calc_ids)
-    current_tea = teas.get(calc_ids[calc_index])
-    if not current_tea or not current_tea.weight:
-        await message.answer("Товар недоступен. Откройте калькулятор заново.")
-        await state.clear()
+    try:
+        parsed = parse_quantities(message.text or "", calc_items, start=calc_index)
+    except CalcInputError as e:
+        await message.answer(str(e), parse_mode=ParseMode.HTML)
         return
+    calc_grams.update(parsed)
 
-    price_per_gram = float(current_tea.price) / float(current_tea.weight)
-    subtotal = math.ceil(grams * price_per_gram)
-    calc_total += subtotal
-    calc_results.append({
-        "name": current_tea.name,
-        "grams": grams,
-        "subtotal": subtotal
-    })
-
+    # Одно число — пошаговый режим: спрашиваем следующую позицию.
+    # Несколько чисел или названия — расчёт сразу по всему введённому.
+    stepwise = list(parsed) == [calc_index]
     calc_index += 1
-    next_tea = teas.get(calc_ids[calc_index]) if calc_index < len(calc_ids) else None
-    if next_tea and next_tea.weight:
-        next_price_per_gram = float(next_tea.price) / float(next_tea.weight)
-        await state.update_data(calc_index=calc_index, calc_total=calc_total, calc_results=calc_results)
+    if stepwise and calc_index < len(calc_items):
+        next_item = calc_items[calc_index]
+        await state.update_data(calc_index=calc_index, calc_grams={str(k): v for k, v in calc_grams.items()})
         await message.answer(
-            f"Введите количество грамм для <b>{html.escape(next_tea.name)}</b>\n"
-            f"(Цена за грамм: {next_price_per_gram:.2f}₽):",
+            f"Введите количество грамм для <b>{html.escape(next_item['name'])}</b>\n"
+            f"(Цена за грамм: {next_item['price_per_gram']:.2f}₽):",
             parse_mode=ParseMode.HTML
         )
-    else:
-        # Выводим финальный результат
-        result_text = "<b>Расчёт стоимости по граммам:</b>\n\n"
-        for item in calc_results:
-            result_text += f"<b>{html.escape(item['name'])}</b>: {item['grams']} г — {item['subtotal']}₽\n"
-        result_text += f"\n<b>Итог:</b> {calc_total}₽"
-        result_keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
-            [types.InlineKeyboardButton(text="Назад", callback_data="back_to_cart")],
-            [types.InlineKeyboardButton(text="В меню", callback_data="back_to_main")]
-        ])
-        await message.answer(result_text, parse_mode=ParseMode.HTML, reply_markup=result_keyboard)
-        await state.clear()
+        return
+
+    lines, calc_total = price_lines(calc_items, calc_grams)
+    result_text = "<b>Расчёт стоимости по граммам:</b>\n\n"
+    result_text += "".join(
+        f"<b>{html.escape(name)}</b>: {grams:g} г — {subtotal}₽\n" for name, grams, subtotal in lines
+    )
+    result_text += f"\n<b>Итог:</b> {calc_total}₽"
+    result_keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
+        [types.InlineKeyboardButton(text="Назад", callback_data="back_to_cart")],
+        [types.InlineKeyboardButton(text="В меню", callback_data="back_to_main")]
+    ])
+    await message.answer(result_text, parse_mode=ParseMode.HTML, reply_markup=result_keyboard)
+    await state.clear()
 
 
 @dp.callback_query(lambda c: c.data == "back_to_cart")
 async def back_to_cart_callback(query: types.CallbackQuery):
     await query.answer()
-    text, keyboard = build_cart_message(query.from_user.id)
+    text, keyboard = await build_cart_message(query.from_user.id)
     await query.message.edit_text(text, reply_markup=keyboard)
 
 
 @dp.callback_query(lambda c: c.data == "open_cart")
 async def open_cart_callback(query: types.CallbackQuery):
-    """Быстрый переход в корзину с карточки товара (карточка может быть фото — шлём новое сообщение)."""
+    """
+    Переход в корзину с главного экрана или карточки: текстовый экран правим на месте,
+    с фото-карточки (её в текст не превратить) — новое сообщение.
+    """
     await query.answer()
-    text, keyboard = build_cart_message(query.from_user.id)
-    await bot.send_message(
+    text, keyboard = await build_cart_message(query.from_user.id)
+    await nav.show_text(
+        bot,
         query.from_user.id,
         text,
-        reply_markup=keyboard if keyboard else None,
+        keyboard or types.InlineKeyboardMarkup(inline_keyboard=[[_MENU_BUTTON]]),
+        source=query.message,
     )
 
 
+def cart_quantities(user_id: int) -> dict:
+    """Корзина как {tea_id: количество} — то, что резервируется на складе."""
+    quantities = {}
+    for item in CARTS.get(user_id, []):
+        quantities[item["tea_id"]] = quantities.get(item["tea_id"], 0) + item["quantity"]
+    return quantities
+
+
+async def shortage_text(shortages: dict) -> str:
+    teas = await fetch_teas_map(shortages)
+    text = "<b>Не хватает товара на складе:</b>\n"
+    for tea_id, available in shortages.items():
+        tea = teas.get(tea_id)
+        name = html.escape(tea.name) if tea else f"Товар #{tea_id}"
+        text += f"{name} — осталось {available} шт.\n" if available else f"{name} — нет в наличии\n"
+    return text + "\nИзмените количество в корзине и оформите заказ снова."
+
+
+async def release_order_stock(state: FSMContext, include_confirmed: bool = False) -> None:
+    """
+    Снимает резервы оформления, если оно было начато (отмена, пустая корзина).
+    include_confirmed — и подтверждённые: заказ не удалось отправить администратору.
+    """
+    order_number = (await state.get_data()).get("order_number")
+    if not order_number:
+        return
+    try:
+        async with db_session() as db:
+            await release_reservation(db, order_number, include_confirmed)
+    except Exception as e:
+        # Не страшно: резерв истечёт сам через RESERVATION_TTL
+        logger.exception("Не удалось снять резерв заказа %s: %s", order_number, e)
+
+
+async def confirm_order_stock(data: dict, quantities: dict) -> dict:
+    """
+    Подтверждает резерв при отправке заказа. Если корзина поменялась после начала
+    оформления или резерв успел истечь — резервирует заново. Возвращает нехватку.
+    """
+    order_number = data["order_number"]
+    reserved = {int(k): v for k, v in data.get("reserved", {}).items()}
+    ordered = {int(k): v for k, v in data.get("ordered", {}).items()}
+    async with db_session() as db:
+        if quantities == ordered and await confirm_reservation(db, order_number, reserved):
+            return {}
+        await release_reservation(db, order_number)
+        reserved, shortages = await reserve_stock(db, order_number, quantities, RESERVATION_TTL)
+        if shortages:
+            return shortages
+        if await confirm_reservation(db, order_number, reserved):
+            return {}
+    return {tea_id: 0 for tea_id in reserved}
+
+
 @dp.callback_query(lambda c: c.data == "checkout")
 async def checkout_callback(query: types.CallbackQuery, state: FSMContext):
+    """
+    Начало оформления: сразу резервируем всю корзину одной транзакцией, чтобы на
+    лимитированных позициях заказ не сорвался после ввода контактов. Резерв
+    держится RESERVATION_TTL и возвращается на склад, если оформление брошено.
+    """
     user_id = query.from_user.id
-    if not CARTS.get(user_id):
+    quantities = cart_quantities(user_id)
+    if not quantities:
         await query.answer("Ваша корзина пуста.", show_alert=True)
         return
 
+    await release_order_stock(state)  # повторное «Оформить» — старый резерв не нужен
+    order_number = uuid.uuid4().hex[:8].upper()
+    try:
+        async with db_session() as db:
+            reserved, shortages = await reserve_stock(db, order_number, quantities, RESERVATION_TTL)
+    except Exception as e:
+        logger.exception("Ошибка резервирования заказа: %s", e)
+        await query.answer("Не удалось начать оформление, попробуйте позже.", show_alert=True)
+        return
+
     await query.answer()
+    if shortages:
+        await query.message.edit_text(
+            await shortage_text(shortages),
+            reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[
+                [types.InlineKeyboardButton(text="Корзина", callback_data="open_cart")],
+            ]),
+        )
+        return
+
+    funnel.emit(CHECKOUT, user_id)
+    # Ключи — строки: FSM-хранилище может сериализовать данные в JSON
+    await state.update_data(
+        order_number=order_number,
+        reserved={str(k): v for k, v in reserved.items()},
+        ordered={str(k): v for k, v in quantities.items()},
+        checkout_started=time.time(),
+    )
+
+    # Есть контакты прошлого заказа — оформление сводится к одному экрану подтверждения
+    contacts = await load_checkout_contacts(user_id)
+    if contacts:
+        await state.update_data(
+            fio=contacts.fio, address=contacts.address, phone=contacts.phone,
+            comment=None, promo_code=None,
+        )
+        lines, total = await cart_lines(user_id)
+        await query.message.edit_text(
+            confirm_screen_text(await state.get_data(), lines, total),
+            reply_markup=_ORDER_CONFIRM_KEYBOARD,
+        )
+        await state.set_state(OrderForm.waiting_for_confirm)
+        return
+
     await query.message.edit_text("Введите ваше ФИО (для отмены введите /cancel):")
     await state.set_state(OrderForm.waiting_for_fio)
 
 
+async def load_checkout_contacts(user_id: int):
+    """Контакты последнего заказа пользователя (CheckoutContacts) или None."""
+    try:
+        async with db_session() as db:
+            return await get_checkout_contacts(db, user_id)
+    except Exception as e:
+        # Без сохранённых контактов оформление просто пойдёт по шагам
+        logger.exception("Ошибка загрузки контактов пользователя %s: %s", user_id, e)
+        return None
+
+
 @dp.message(OrderForm.waiting_for_fio)
 async def process_fio(message: types.Message, state: FSMContext):
     fio = (message.text or "").strip()
@@ -789,50 +1285,206 @@ async def process_comment(message: types.Message, state: FSMContext):
         await message.answer("Слишком длинный комментарий, сократите, пожалуйста.")
         return
     await state.update_data(comment=comment)
-    await message.answer("Введите промокод, если есть (для отмены /cancel):")
+    await message.answer("Введите промокод или «-», если его нет (для отмены /cancel):")
     await state.set_state(OrderForm.waiting_for_promo)
 
 
+PROMO_SKIP = {"-", "—", "нет", "no"}
+
+_ORDER_CONFIRM_KEYBOARD = types.InlineKeyboardMarkup(inline_keyboard=[
+    [types.InlineKeyboardButton(text="✅ Подтвердить заказ", callback_data="order:confirm")],
+    [types.InlineKeyboardButton(text="🏷 Промокод", callback_data="order:promo"),
+     types.InlineKeyboardButton(text="✏️ Изменить данные", callback_data="order:edit")],
+    [types.InlineKeyboardButton(text="Отменить", callback_data="order:cancel")],
+])
+
+
+def quote_promo(rule, lines):
+    """Скидка по правилу для строк корзины (tea, qty, subtotal) — считается в памяти."""
+    return quote(rule, ((tea.category, subtotal) for tea, _, subtotal in lines))
+
+
+def order_lines_text(lines, total: float, promo_quote=None) -> str:
+    text = "<b>Состав заказа:</b>\n"
+    for tea_obj, qty, subtotal in lines:
+        text += f"<b>{html.escape(tea_obj.name)}</b> x{qty} — {subtotal:.0f}₽\n"
+    if promo_quote:
+        text += f"\nСумма: {total:.0f}₽\n"
+        text += f"Скидка по промокоду {html.escape(promo_quote.code)}: −{promo_quote.discount:.0f}₽\n"
+        total = promo_quote.total
+    text += f"\n<b>Итого:</b> {total:.0f}₽\n"
+    return text
+
+
+def confirm_screen_text(data: dict, lines, total: float, promo_quote=None) -> str:
+    """Экран подтверждения: состав заказа, контакты доставки и комментарий."""
+    text = order_lines_text(lines, total, promo_quote)
+    text += "\n<b>Доставка:</b>\n"
+    text += f"{html.escape(data.get('fio') or '—')}\n"
+    text += f"{html.escape(data.get('address') or '—')}\n"
+    text += f"{html.escape(data.get('phone') or '—')}\n"
+    if data.get("comment"):
+        text += f"Комментарий: {html.escape(data['comment'])}\n"
+    return text + "\nПроверьте заказ и подтвердите его:"
+
+
 @dp.message(OrderForm.waiting_for_promo)
 async def process_promo(message: types.Message, state: FSMContext):
-    promo = (message.text or "").strip()
-    if not promo:
-        promo = "—"
+    """
+    Промокод проверяется по правилам в памяти (PromoCache) — без запроса к БД;
+    покупатель видит итог со скидкой и подтверждает заказ кнопкой.
+    """
+    promo_text = (message.text or "").strip()
+    user_id = message.from_user.id
+
+    lines, total = await cart_lines(user_id)
+    if not lines:
+        await release_order_stock(state)
+        await message.answer("Ваша корзина пуста.")
+        await state.clear()
+        return
+
+    promo_code, promo_quote = None, None
+    if promo_text and promo_text.lower() not in PROMO_SKIP:
+        rule = await promo_cache.get(promo_text)
+        if rule is None:
+            await message.answer("Такого промокода нет. Введите другой или «-», чтобы продолжить без него:")
+            return
+        try:
+            promo_quote = quote_promo(rule, lines)
+        except PromoError as e:
+            await message.answer(f"{html.escape(str(e))}\nВведите другой промокод или «-», чтобы продолжить без него:")
+            return
+        promo_code = rule.code
+
+    await state.update_data(promo_code=promo_code)
+    await message.answer(
+        confirm_screen_text(await state.get_data(), lines, total, promo_quote),
+        reply_markup=_ORDER_CONFIRM_KEYBOARD,
+    )
+    await state.set_state(OrderForm.waiting_for_confirm)
+
+
+@dp.callback_query(lambda c: c.data and c.data.startswith("order:"), ~StateFilter(OrderForm.waiting_for_confirm))
+async def order_stale_callback(query: types.CallbackQuery):
+    await query.answer("Оформление уже завершено или отменено.", show_alert=True)
+
+
+@dp.callback_query(OrderForm.waiting_for_confirm, lambda c: c.data == "order:cancel")
+async def order_cancel_callback(query: types.CallbackQuery, state: FSMContext):
+    await query.answer()
+    await release_order_stock(state)
+    await state.clear()
+    await query.message.edit_text("Оформление отменено. Корзина сохранена.")
+    await query.message.answer("Главное меню:", reply_markup=main_menu_reply())
+
+
+@dp.callback_query(OrderForm.waiting_for_confirm, lambda c: c.data == "order:promo")
+async def order_promo_callback(query: types.CallbackQuery, state: FSMContext):
+    await query.answer()
+    await query.message.edit_text("Введите промокод или «-», если его нет (для отмены /cancel):")
+    await state.set_state(OrderForm.waiting_for_promo)
+
 
+@dp.callback_query(OrderForm.waiting_for_confirm, lambda c: c.data == "order:edit")
+async def order_edit_callback(query: types.CallbackQuery, state: FSMContext):
+    """Другие контакты: проходим шаги ФИО → адрес → телефон → комментарий заново, резерв сохраняется."""
+    await query.answer()
+    await query.message.edit_text("Введите ваше ФИО (для отмены введите /cancel):")
+    await state.set_state(OrderForm.waiting_for_fio)
+
+
+@dp.callback_query(OrderForm.waiting_for_confirm, lambda c: c.data == "order:confirm")
+async def order_confirm_callback(query: types.CallbackQuery, state: FSMContext):
+    """
+    Подтверждение: списываем использование промокода (атомарно), подтверждаем резерв
+    склада и отправляем заказ администратору. При сбое на любом шаге откатываем предыдущие.
+    """
+    await query.answer()
+    message = query.message
+    user = query.from_user
+    user_id = user.id
     user_data = await state.get_data()
     # Все поля экранируем — они попадают в HTML-сообщение администратору
     fio = html.escape(user_data.get("fio", "Не указано"))
     address = html.escape(user_data.get("address", "Не указано"))
     phone = html.escape(user_data.get("phone", "Не указан"))
-    comment = html.escape(user_data.get("comment", "Не указан"))
-    promo = html.escape(promo)
-    user_id = message.from_user.id
+    comment = html.escape(user_data.get("comment") or "Не указан")
+    promo_code = user_data.get("promo_code")
 
-    lines, total = cart_lines(user_id)
+    lines, total = await cart_lines(user_id)
     if not lines:
-        await message.answer("Ваша корзина пуста.")
+        await release_order_stock(state)
+        await message.edit_text("Ваша корзина пуста.")
+        await state.clear()
+        return
+
+    # Корзина могла измениться после ввода промокода — пересчитываем скидку (в памяти)
+    promo_quote = None
+    if promo_code:
+        rule = await promo_cache.get(promo_code)
+        try:
+            promo_quote = quote_promo(rule, lines) if rule else None
+        except PromoError:
+            promo_quote = None
+        redeemed = False
+        if promo_quote:
+            try:
+                async with db_session() as db:
+                    redeemed = await redeem_promocode(db, promo_code)
+            except Exception as e:
+                logger.exception("Ошибка списания промокода %s: %s", promo_code, e)
+                await message.answer("Не удалось оформить заказ, попробуйте чуть позже (/cancel — отменить).")
+                return
+        if not redeemed:
+            await promo_cache.ensure_fresh(force=True)
+            await state.update_data(promo_code=None)
+            await message.edit_text(
+                order_lines_text(lines, total)
+                + "\nПромокод больше не действует. Подтвердить заказ без скидки?",
+                reply_markup=_ORDER_CONFIRM_KEYBOARD,
+            )
+            return
+
+    async def rollback_promo():
+        if promo_quote:
+            try:
+                async with db_session() as db:
+                    await unredeem_promocode(db, promo_code)
+            except Exception as e:
+                logger.exception("Не удалось вернуть использование промокода %s: %s", promo_code, e)
+
+    order_number = user_data.get("order_number") or uuid.uuid4().hex[:8].upper()
+    user_data["order_number"] = order_number
+    try:
+        shortages = await confirm_order_stock(user_data, cart_quantities(user_id))
+    except Exception as e:
+        logger.exception("Ошибка подтверждения резерва заказа %s: %s", order_number, e)
+        await rollback_promo()
+        await message.answer("Не удалось оформить заказ, попробуйте чуть позже (/cancel — отменить).")
+        return
+    if shortages:
+        await rollback_promo()
+        await message.edit_text(await shortage_text(shortages))
+        await message.answer("Главное меню:", reply_markup=main_menu_reply())
         await state.clear()
         return
 
     # Формируем текст заказа
-    order_number = uuid.uuid4().hex[:8].upper()
     order_text = f"<b>Номер заказа:</b> {order_number}\n\n"
-    order_text += "<b>Состав заказа:</b>\n"
-    for tea_obj, qty, subtotal in lines:
-        order_text += f"<b>{html.escape(tea_obj.name)}</b> x{qty} — {subtotal:.0f}₽\n"
+    order_text += order_lines_text(lines, total, promo_quote) + "\n"
 
-    username = message.from_user.username
+    username = user.username
     username_str = f"@{html.escape(username)}" if username else "без username"
-    full_name = html.escape(message.from_user.full_name or "—")
+    full_name = html.escape(user.full_name or "—")
 
-    order_text += f"\n<b>Итого:</b> {total:.0f}₽\n\n"
     order_text += "<b>Контактная информация:</b>\n"
     order_text += f"ФИО: {fio}\n"
     order_text += f"Адрес: {address}\n"
     order_text += f"Телефон: {phone}\n\n"
     order_text += f"Комментарий: {comment}\n\n"
-    order_text += f"Промокод: {promo}\n\n\n"
-    order_text += f"<i>Отправил: {full_name} ({username_str}), ID: {message.from_user.id}</i>"
+    order_text += f"Промокод: {html.escape(promo_code) if promo_quote else '—'}\n\n\n"
+    order_text += f"<i>Отправил: {full_name} ({username_str}), ID: {user_id}</i>"
 
     # Отправляем админу(ам)
     try:
@@ -852,11 +1504,19 @@ async def process_promo(message: types.Message, state: FSMContext):
     except Exception as e:
         logger.exception("Ошибка при отправке заказа администратору: %s", e)
         await message.answer("Ошибка при отправке заказа. Проверьте настройки администратора.")
+        await rollback_promo()
+        await state.update_data(order_number=order_number)
+        await release_order_stock(state, include_confirmed=True)
         await state.clear()
         return
 
-    await message.answer(
+    await save_order(user_id, order_number, user_data, lines, total, promo_quote)
+    funnel.emit(ORDER, user_id)
+    await message.edit_text(
         f"Ваш заказ принят. Номер заказа: <b>{order_number}</b>\nОжидайте инструкций по оплате.",
+        reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[
+            [types.InlineKeyboardButton(text="🔁 Повторить заказ", callback_data=f"reorder:{order_number}")],
+        ]),
         disable_web_page_preview=True
     )
     CARTS[user_id] = []  # очищаем корзину
@@ -864,14 +1524,280 @@ async def process_promo(message: types.Message, state: FSMContext):
     await message.answer("Главное меню:", reply_markup=main_menu_reply())
 
 
+async def save_order(user_id: int, order_number: str, data: dict, lines, total: float, promo_quote) -> None:
+    """
+    Сохраняет отправленный заказ, его строки и контакты (для оформления в один экран
+    и «Повторить заказ»). Заказ уже у администратора — сбой записи только логируем.
+    """
+    order = {
+        "order_number": order_number,
+        "user_id": user_id,
+        "fio": data.get("fio") or "",
+        "address": data.get("address") or "",
+        "phone": data.get("phone") or "",
+        "comment": data.get("comment"),
+        "promo_code": promo_quote.code if promo_quote else None,
+        "subtotal": round(total, 2),
+        "discount": promo_quote.discount if promo_quote else 0,
+        "total": promo_quote.total if promo_quote else round(total, 2),
+    }
+    items = [
+        {"tea_id": tea.id, "name": tea.name, "price": tea.price, "quantity": qty}
+        for tea, qty, _ in lines
+    ]
+    try:
+        async with db_session() as db:
+            await create_order(db, order, items)
+    except Exception as e:
+        logger.exception("Не удалось сохранить заказ %s: %s", order_number, e)
+
+
+async def orders_screen(user_id: int):
+    """«Мои заказы»: последние заказы одним запросом, у каждого — кнопка повтора."""
+    try:
+        async with db_session() as db:
+            orders = await get_recent_orders(db, user_id, RECENT_ORDERS_SHOWN)
+    except Exception as e:
+        logger.exception("Ошибка загрузки заказов пользователя %s: %s", user_id, e)
+        orders = None
+    buttons = []
+    if orders is None:
+        text = "Не удалось загрузить заказы, попробуйте позже."
+    elif not orders:
+        text = "Вы ещё ничего не заказывали."
+    else:
+        text = "<b>Ваши последние заказы:</b>\n"
+        for order in orders:
+            text += f"№{order.order_number} от {order.created_at:%d.%m.%Y} — {order.total:.0f}₽, позиций: {order.items_count}\n"
+            buttons.append([types.InlineKeyboardButton(
+                text=f"🔁 Повторить №{order.order_number}", callback_data=f"reorder:{order.order_number}"
+            )])
+    buttons.append([_MENU_BUTTON])
+    return text, types.InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+@dp.message(lambda message: message.text == "Мои заказы")
+async def orders_message(message: types.Message):
+    text, markup = await orders_screen(message.from_user.id)
+    await message.answer(text, reply_markup=markup)
+
+
+@dp.callback_query(lambda c: c.data == "nav:orders")
+async def orders_callback(query: types.CallbackQuery):
+    await query.answer()
+    text, markup = await orders_screen(query.from_user.id)
+    await nav.show_text(bot, query.from_user.id, text, markup, source=query.message)
+
+
+@dp.callback_query(lambda c: c.data and c.data.startswith("reorder:"))
+async def reorder_callback(query: types.CallbackQuery):
+    """
+    «Повторить заказ»: состав прошлого заказа одним запросом, корзина пересобирается
+    из товаров, которые ещё в каталоге (проверка по индексу в памяти), и сразу открывается.
+    """
+    user_id = query.from_user.id
+    order_number = query.data.split(":", 1)[1]
+    try:
+        async with db_session() as db:
+            quantities = await get_order_quantities(db, user_id, order_number)
+    except Exception as e:
+        logger.exception("Ошибка загрузки заказа %s: %s", order_number, e)
+        await query.answer("Не удалось загрузить заказ, попробуйте позже.", show_alert=True)
+        return
+    if not quantities:
+        await query.answer("Заказ не найден.", show_alert=True)
+        return
+
+    await ensure_catalog_index()
+    available = {tea_id: qty for tea_id, qty in quantities.items() if catalog_index.get(tea_id)}
+    if not available:
+        await query.answer("Товаров из этого заказа больше нет в каталоге.", show_alert=True)
+        return
+    CARTS[user_id] = [{"tea_id": tea_id, "quantity": qty} for tea_id, qty in available.items()]
+    missing = len(quantities) - len(available)
+    await query.answer(f"Корзина собрана. Недоступно позиций: {missing}" if missing else "Корзина собрана.")
+
+    text, keyboard = await build_cart_message(user_id)
+    await nav.show_text(
+        bot,
+        user_id,
+        text,
+        keyboard or types.InlineKeyboardMarkup(inline_keyboard=[[_MENU_BUTTON]]),
+        source=query.message,
+    )
+
+
+@dp.inline_query()
+async def inline_search(inline_query: types.InlineQuery):
+    """
+    Inline-режим (@bot запрос): ответ из индекса в памяти, постранично через next_offset.
+    Одинаковые запросы Telegram кеширует сам на INLINE_CACHE_TIME секунд.
+    """
+    await ensure_catalog_index()
+    try:
+        offset = max(0, int(inline_query.offset or 0))
+    except ValueError:
+        offset = 0
+    entries, next_offset = catalog_index.page(inline_query.query, offset)
+    me = await bot.me()  # aiogram кеширует getMe после первого вызова
+    await inline_query.answer(
+        [inline_result(entry, me.username) for entry in entries],
+        cache_time=INLINE_CACHE_TIME,
+        next_offset=next_offset,
+    )
+
+
 # Запуск бота
-async def main():
+scheduler = Scheduler()
+
+
+async def _warm_menus() -> None:
+    await catalog_menu_inline()
+    await catalog_screen_text()
+    await asyncio.gather(*(product_list_inline(category) for category in await get_categories()))
+
+
+async def warm_up() -> dict:
+    """
+    Прогрев до приёма апдейтов: соединения пула, версия каталога, индекс с готовыми
+    карточками, меню каталога и списки категорий, промокоды — первый пользователь
+    после рестарта получает экран из кеша, а не ждёт БД. Неудавшийся этап (например,
+    БД ещё не поднялась) старт не останавливает: кеш достроится на первом апдейте.
+    Возвращает длительность этапов, сек; ready — от начала импорта модуля.
+    """
+    timings = {"import": IMPORT_SECONDS}
+
+    async def stage(name, coro):
+        started = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            logger.warning("Прогрев: этап %s не удался: %s", name, e)
+        timings[name] = time.perf_counter() - started
+
+    await stage("pool", warm_pool())
+    await asyncio.gather(
+        stage("catalog", ensure_catalog_index()),
+        stage("menus", _warm_menus()),
+        stage("promos", promo_cache.ensure_fresh(force=True)),
+    )
+    timings["ready"] = time.perf_counter() - _IMPORT_STARTED
+    logger.info(
+        "Готов к приёму апдейтов за %.2f с: %s", timings["ready"],
+        ", ".join(f"{name} {seconds:.2f}" for name, seconds in timings.items() if name != "ready"),
+    )
+    return timings
+
+
+def start_background_tasks(sweep_reservations: bool = True) -> None:
+    """
+    Фоновые задачи процесса бота. Истёкшие резервы общие для всех процессов —
+    при шардированном запуске (shard.py) их снимает только один воркер.
+    """
+    global recommender_task
+    recommender_task = asyncio.create_task(load_recommender())
+    scheduler.add_interval("clear_carts", clear_carts, CART_CLEAR_INTERVAL)
+    if sweep_reservations:
+        scheduler.add_interval("release_expired", release_expired, RESERVATION_SWEEP_INTERVAL, timeout=30)
+    scheduler.add_interval("flush_user_lists", flush_user_lists, USER_LISTS_FLUSH_INTERVAL, timeout=30)
+    scheduler.add_interval("refresh_caches", refresh_caches, CATALOG_CHECK_INTERVAL, run_at_start=True, timeout=60)
+    scheduler.add_interval("expire_checkouts", expire_checkouts, CHECKOUT_SWEEP_INTERVAL, timeout=60)
+    scheduler.add_interval("retry_notifications", retry_notifications, NOTIFY_RETRY_INTERVAL, timeout=60)
+    scheduler.add_interval("flush_funnel", flush_funnel, FUNNEL_FLUSH_INTERVAL, timeout=60)
+    if tracer.enabled:
+        scheduler.add_interval("flush_traces", flush_traces, TRACE_FLUSH_INTERVAL, timeout=30)
+    scheduler.start()
+
+
+async def shutdown() -> None:
+    """
+    Остановка без потерь: ждём начатые обработчики (не дольше SHUTDOWN_TIMEOUT —
+    их отправки в Telegram идут внутри них же), сохраняем состояние из памяти
+    и закрываем соединения. Вызывается, когда приём апдейтов уже остановлен.
+    """
+    await in_flight.drain(SHUTDOWN_TIMEOUT)
+    if recommender_task is not None and not recommender_task.done():
+        recommender_task.cancel()
+    await scheduler.stop()
+    for name, job in scheduler.stats().items():
+        logger.info("Задача %s: запусков %s, ошибок %s, пропусков %s, макс. %.3f с",
+                    name, job["runs"], job["failures"], job["skipped"], job["max_duration"])
+    forwarded = await flush_support_tickets(bot)
+    if forwarded:
+        logger.info("Остановка: переслано администраторам обращений из окна склейки: %s", forwarded)
     try:
-        await bot.delete_webhook(drop_pending_updates=True)
+        saved = await user_lists.flush()
+        if saved:
+            logger.info("Остановка: сохранены списки пользователей: %s", saved)
     except Exception as e:
-        logger.exception("Ошибка удаления webhook: %s", e)
-    asyncio.create_task(clear_cache_periodically())
-    await dp.start_polling(bot)
+        logger.exception("Остановка: не удалось сохранить избранное: %s", e)
+    try:
+        await flush_funnel()
+    except Exception as e:
+        logger.exception("Остановка: не удалось записать события воронки (%s в буфере): %s", len(funnel), e)
+    if tracer.enabled:
+        try:
+            await tracer.sink.flush()
+            logger.info("Трассы: собрано %s, записано %s (%s).", tracer.traced, tracer.sink.written, tracer.sink.path)
+        except OSError as e:
+            logger.warning("Остановка: не удалось записать трассы: %s", e)
+    write_stop_mark()
+    await bot.session.close()
+    await async_engine.dispose()
+    logger.info("Бот остановлен, обработано апдейтов: %s.", in_flight.processed)
+
+
+# Взведено, пока идёт dp.start_polling: только тогда можно звать dp.stop_polling()
+# (во время warm_up() задачу бота остановить можно лишь отменой, см. run.py)
+polling = asyncio.Event()
+
+
+@dp.startup()
+async def _polling_started():
+    polling.set()
+
+
+@dp.shutdown()
+async def _polling_stopped():
+    polling.clear()
+
+
+async def run_polling() -> None:
+    """
+    Long polling с корректной остановкой. Накопившиеся за рестарт апдейты не
+    сбрасываются — Telegram отдаст их новому процессу. По SIGTERM/SIGINT aiogram
+    перестаёт запрашивать getUpdates, после чего shutdown() дорабатывает начатое.
+    Последнюю полученную пачку aiogram не подтверждает (offset уходит только со
+    следующим getUpdates) — подтверждаем сами, иначе новый процесс обработает её снова.
+    """
+    in_flight.mark_started()
+    try:
+        try:
+            await bot.delete_webhook(drop_pending_updates=False)
+        except Exception as e:
+            logger.exception("Ошибка удаления webhook: %s", e)
+        await warm_up()
+        start_background_tasks()
+        await dp.start_polling(bot, close_bot_session=False)
+    finally:
+        # И при отмене во время прогрева: закрываем сессию и пул
+        await confirm_updates()
+        await shutdown()
+
+
+async def confirm_updates() -> None:
+    """Подтверждает Telegram апдейты до in_flight.last_update_id включительно (как poll() в shard.py)."""
+    if in_flight.last_update_id is None:
+        return
+    offset = in_flight.last_update_id + 1
+    try:
+        await bot.get_updates(offset=offset, timeout=0, limit=1)
+    except Exception as e:
+        logger.warning("Не удалось подтвердить offset %s: %s", offset, e)
+
+
+async def main():
+    await run_polling()
 
 
 @dp.message(lambda message: message.text and not message.text.startswith("/"))
@@ -881,4 +1807,4 @@ async def handle_messages(message: types.Message):
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run(main())
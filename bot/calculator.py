@@ -0,0 +1,105 @@
+import html
+import math
+import re
+from typing import Dict, List
+
+# Число: целое или дробное через точку/запятую без пробелов («2,5», «12.5»)
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+# Разделители пар «название граммы»: «;», перевод строки или запятая перед словом
+_PAIR_SPLIT_RE = re.compile(r"[;\n]+|,(?=\s*[^\d\s,])")
+# Разделители чисел в пакетном вводе: пробелы, «;» и запятая с пробелом/в конце
+_NUMBERS_SPLIT_RE = re.compile(r"[\s;]+|,(?=\s|$)")
+# Единицы после числа, которые можно писать: «50г», «50 гр.»
+_UNIT_RE = re.compile(r"(?:(?<=\d)|\b)(?:гр|г|g)\b\.?")
+
+
+class CalcInputError(ValueError):
+    """Ввод калькулятора не разобран — текст ошибки можно показать пользователю."""
+
+
+def snapshot_item(tea) -> dict:
+    """Строка калькулятора для FSM: только JSON-совместимые поля, без обращений к БД потом."""
+    return {
+        "id": tea.id,
+        "name": tea.name,
+        "price_per_gram": tea.price / tea.weight,
+    }
+
+
+def _grams(token: str) -> float:
+    grams = float(token.replace(",", "."))
+    if grams <= 0:
+        raise CalcInputError("Количество грамм должно быть положительным.")
+    return grams
+
+
+def _normalize(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+
+def _match_item(query: str, items: List[dict]) -> int:
+    words = _normalize(query).split()
+    matches = [
+        i for i, item in enumerate(items)
+        if all(word in _normalize(item["name"]) for word in words)
+    ]
+    if not matches:
+        raise CalcInputError(f"Не нашёл в корзине товар «{html.escape(query)}».")
+    if len(matches) > 1:
+        names = ", ".join(html.escape(items[i]["name"]) for i in matches[:3])
+        raise CalcInputError(f"«{html.escape(query)}» подходит к нескольким товарам: {names}. Уточните название.")
+    return matches[0]
+
+
+def parse_quantities(text: str, items: List[dict], start: int = 0) -> Dict[int, float]:
+    """
+    Разбирает ввод калькулятора и возвращает {индекс позиции: граммы}.
+
+    - «50» — граммы для текущей позиции (пошаговый режим);
+    - «50 100 25» — граммы для всех оставшихся позиций по порядку;
+    - «шу 50, улун 100» — граммы по частям названий, порядок любой.
+    """
+    text = _UNIT_RE.sub(" ", (text or "").strip().lower())
+    if not text:
+        raise CalcInputError("Введите количество грамм.")
+
+    if not re.search(r"[^\d\s.,;]", text):
+        tokens = [t for t in _NUMBERS_SPLIT_RE.split(text) if t]
+        if not all(_NUMBER_RE.fullmatch(t) for t in tokens):
+            raise CalcInputError("Не понял числа. Пример: 50 100 25")
+        remaining = len(items) - start
+        if len(tokens) == 1:
+            return {start: _grams(tokens[0])}
+        if len(tokens) != remaining:
+            raise CalcInputError(
+                f"Чисел {len(tokens)}, а позиций осталось {remaining}. "
+                "Введите по одному числу на каждую позицию."
+            )
+        return {start + i: _grams(token) for i, token in enumerate(tokens)}
+
+    result = {}
+    for pair in _PAIR_SPLIT_RE.split(text):
+        pair = pair.strip(" ,")
+        if not pair:
+            continue
+        numbers = _NUMBER_RE.findall(pair)
+        if len(numbers) != 1:
+            raise CalcInputError(f"В «{html.escape(pair)}» нужно одно число грамм. Пример: шу 50, улун 100")
+        name = _NUMBER_RE.sub(" ", pair).strip()
+        if not name:
+            raise CalcInputError(f"В «{html.escape(pair)}» не указано, к какому товару относятся граммы.")
+        result[_match_item(name, items)] = _grams(numbers[0])
+    return result
+
+
+def price_lines(items: List[dict], grams_by_index: Dict[int, float]):
+    """Все строки расчёта за один проход: [(name, grams, subtotal)], итог."""
+    lines = []
+    total = 0
+    for index in sorted(grams_by_index):
+        item = items[index]
+        grams = grams_by_index[index]
+        subtotal = math.ceil(grams * item["price_per_gram"])
+        total += subtotal
+        lines.append((item["name"], grams, subtotal))
+    return lines, total
@@ -0,0 +1,217 @@
+import html
+import logging
+import os
+import re
+from typing import NamedTuple, Optional, Tuple, Union
+
+from aiogram import Bot, types
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile
+
+logger = logging.getLogger(__name__)
+
+CAPTION_LIMIT = 1024   # лимит Telegram на подпись к фото (видимый текст, без тегов)
+MESSAGE_LIMIT = 4096   # лимит Telegram на текст сообщения
+
+PHOTOS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Тег, HTML-сущность, обычный текст или одиночные «<» / «&» (битая разметка)
+_TOKEN_RE = re.compile(r"<[^<>]*>|&#?\w+;|[^<&]+|[<&]")
+_TAG_NAME_RE = re.compile(r"</?\s*([a-zA-Z][\w-]*)")
+
+# file_id уже загруженных фото: {(tea_id, photo_url): file_id}.
+# Повторная отправка по file_id не заставляет Telegram заново качать URL/файл.
+PHOTO_FILE_IDS = {}
+
+
+def _units(text: str) -> int:
+    """Длина в единицах UTF-16 — так Telegram считает лимиты и смещения сущностей."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _atoms(text: str):
+    """
+    Разбивает HTML на атомы (token, kind, units, tag_name):
+    kind — "open"/"close" для тегов (0 видимых символов) или "char" для символа/сущности.
+    """
+    for match in _TOKEN_RE.finditer(text):
+        token = match.group()
+        if len(token) > 1 and token[0] == "<":
+            name_match = _TAG_NAME_RE.match(token)
+            if name_match:
+                kind = "close" if token.startswith("</") else "open"
+                yield token, kind, 0, name_match.group(1).lower()
+                continue
+        if len(token) > 1 and token[0] == "&":
+            yield token, "char", _units(html.unescape(token)), None
+            continue
+        for ch in token:
+            yield ch, "char", _units(ch), None
+
+
+def visible_length(text: str) -> int:
+    """Видимая длина HTML-текста после разбора разметки (как её считает Telegram)."""
+    return sum(units for _, _, units, _ in _atoms(text))
+
+
+def split_html(text: str, limit: int) -> list:
+    """
+    Режет HTML на части не длиннее limit видимых символов, не разрывая теги:
+    открытые на месте разреза теги закрываются в конце части и заново
+    открываются в начале следующей. Режем по переводу строки, иначе по пробелу.
+    """
+    chunks = []
+    current = []        # [(token, units)]
+    size = 0
+    stack = []          # [(tag_name, open_token)]
+    newline_cut = None  # (позиция в current, снимок stack, видимый размер до разреза)
+    space_cut = None
+
+    def flush(cut_at, cut_stack, _size):
+        nonlocal current, size, newline_cut, space_cut
+        head, tail = current[:cut_at], current[cut_at:]
+        while head and head[-1][0].isspace():
+            head.pop()
+        while tail and tail[0][0].isspace():
+            tail.pop(0)
+        closing = "".join(f"</{name}>" for name, _ in reversed(cut_stack))
+        chunks.append("".join(token for token, _ in head) + closing)
+        current = [(open_token, 0) for _, open_token in cut_stack] + tail
+        size = sum(units for _, units in tail)
+        newline_cut = space_cut = None
+
+    for token, kind, units, name in _atoms(text):
+        if kind == "open":
+            current.append((token, 0))
+            stack.append((name, token))
+            continue
+        if kind == "close":
+            current.append((token, 0))
+            for i in range(len(stack) - 1, -1, -1):
+                if stack[i][0] == name:
+                    del stack[i]
+                    break
+            continue
+
+        if size + units > limit and size > 0:
+            # Не режем по пробелу, если от части останется огрызок — лучше жёсткий разрез
+            cut = next(
+                (c for c in (newline_cut, space_cut) if c and c[2] > limit // 4),
+                (len(current), list(stack), size),
+            )
+            flush(*cut)
+
+        current.append((token, units))
+        size += units
+        if token == "\n":
+            newline_cut = (len(current), list(stack), size)
+        elif token == " ":
+            space_cut = (len(current), list(stack), size)
+
+    if size > 0:
+        chunks.append("".join(token for token, _ in current).rstrip())
+    return chunks
+
+
+class CardView(NamedTuple):
+    """
+    Готовая к отправке карточка товара. Раскладка считается один раз при сборке:
+    если всё помещается в подпись — одно sendPhoto, иначе фото с шапкой
+    и описание следующим сообщением. Клавиатура — на последнем сообщении.
+    """
+    tea_id: int
+    photo: Optional[str]        # URL или абсолютный путь к файлу; None — карточка текстом
+    caption: str                # подпись к фото
+    follow_ups: Tuple[str, ...]  # сообщения после фото
+    text_parts: Tuple[str, ...]  # раскладка без фото (нет фото или оно не отправилось)
+    keyboard: types.InlineKeyboardMarkup
+
+
+def _resolve_photo(tea_id: int, photo_url: Optional[str]) -> Optional[str]:
+    if not photo_url:
+        return None
+    if photo_url.startswith("http"):
+        return photo_url
+    photo_path = os.path.join(PHOTOS_DIR, photo_url)
+    if os.path.exists(photo_path):
+        return photo_path
+    logger.warning("Фото товара %s не найдено: %s", tea_id, photo_path)
+    return None
+
+
+def render_card(tea_obj, keyboard: types.InlineKeyboardMarkup) -> CardView:
+    """Формирует карточку из TeaCard. Название экранируем — оно показывается как HTML."""
+    header = (
+        f"<b>🍵 {html.escape(tea_obj.name)}</b>\n"
+        f"<b>💰 Цена:</b> {tea_obj.price:.0f}₽"
+    )
+    if tea_obj.weight:
+        price_per_gram = tea_obj.price / tea_obj.weight
+        header += f"\n<b>💶 Цена за грамм:</b> {price_per_gram:.2f}₽/г"
+    body = ""
+    if tea_obj.description:
+        # Описание в БД содержит доверенную HTML-разметку (<b>, <i>) от админа — не экранируем.
+        body = f"<i>{tea_obj.description}</i>"
+    full = f"{header}\n\n{body}" if body else header
+
+    text_parts = tuple(split_html(full, MESSAGE_LIMIT))
+    photo = _resolve_photo(tea_obj.id, tea_obj.photo_url)
+    if photo is None:
+        return CardView(tea_obj.id, None, "", (), text_parts, keyboard)
+    if visible_length(full) <= CAPTION_LIMIT:
+        return CardView(tea_obj.id, photo, full, (), text_parts, keyboard)
+    return CardView(
+        tea_obj.id, photo, header, tuple(split_html(body, MESSAGE_LIMIT)), text_parts, keyboard
+    )
+
+
+def photo_input(card: CardView) -> Union[str, FSInputFile]:
+    """Что передать в Telegram как фото карточки: file_id, если он уже известен, иначе URL/файл."""
+    file_id = PHOTO_FILE_IDS.get((card.tea_id, card.photo))
+    if file_id:
+        return file_id
+    if card.photo.startswith("http"):
+        return card.photo
+    return FSInputFile(card.photo)
+
+
+def remember_photo(card: CardView, message) -> None:
+    """Запоминает file_id фото из ответа Telegram для повторных отправок."""
+    if getattr(message, "photo", None):
+        PHOTO_FILE_IDS[(card.tea_id, card.photo)] = message.photo[-1].file_id
+
+
+def forget_photo(card: CardView) -> None:
+    PHOTO_FILE_IDS.pop((card.tea_id, card.photo), None)
+
+
+async def _send_texts(bot: Bot, chat_id: int, parts, keyboard) -> list:
+    messages = []
+    for i, part in enumerate(parts):
+        last = i == len(parts) - 1
+        messages.append(await bot.send_message(chat_id, part, reply_markup=keyboard if last else None))
+    return messages
+
+
+async def send_card(bot: Bot, chat_id: int, card: CardView) -> list:
+    """
+    Отправляет карточку минимальным числом вызовов API. Если Telegram не принял
+    фото (битый URL и т.п.) — карточка уходит текстом. Возвращает отправленные сообщения.
+    """
+    if card.photo is None:
+        return await _send_texts(bot, chat_id, card.text_parts, card.keyboard)
+
+    try:
+        photo_message = await bot.send_photo(
+            chat_id,
+            photo=photo_input(card),
+            caption=card.caption,
+            reply_markup=None if card.follow_ups else card.keyboard,
+        )
+    except TelegramBadRequest as e:
+        logger.warning("Не удалось отправить фото товара %s: %s", card.tea_id, e)
+        forget_photo(card)
+        return await _send_texts(bot, chat_id, card.text_parts, card.keyboard)
+
+    remember_photo(card, photo_message)
+    return [photo_message] + await _send_texts(bot, chat_id, card.follow_ups, card.keyboard)
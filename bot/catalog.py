@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import time
+
+from app.database import AsyncSessionLocal
+from app.crud import get_catalog_version
+
+logger = logging.getLogger(__name__)
+
+_CURRENT = object()  # put() без версии: кладём в текущую
+
+
+class RenderCache:
+    """
+    Кеш готовых представлений каталога: подписи карточек, клавиатуры, меню.
+
+    Все записи живут до смены версии каталога в БД (число строк + max(updated_at)).
+    Версия сверяется не чаще раза в check_interval секунд, поэтому горячие
+    хендлеры почти всегда получают готовый объект без БД и без форматирования.
+    """
+
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._checked_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    async def ensure_fresh(self, force: bool = False) -> bool:
+        """Сверяет версию каталога; при изменении сбрасывает кеш. Возвращает True, если сброс был."""
+        if not force and time.monotonic() - self._checked_at < self.check_interval:
+            return False
+        async with self._lock:
+            # Пока ждали блокировку, версию мог уже проверить параллельный вызов
+            if not force and time.monotonic() - self._checked_at < self.check_interval:
+                return False
+            try:
+                async with AsyncSessionLocal() as db:
+                    version = await get_catalog_version(db)
+            except Exception as e:
+                logger.exception("Ошибка проверки версии каталога: %s", e)
+                # Работаем на старом кеше и не дёргаем упавшую БД на каждом апдейте
+                self._checked_at = time.monotonic()
+                return False
+            self._checked_at = time.monotonic()
+            if version == self.version:
+                return False
+            if self.version is not None:
+                logger.info("Каталог изменился (%s → %s), кеш представлений сброшен.", self.version, version)
+            self.version = version
+            self._entries.clear()
+            return True
+
+    def get(self, key):
+        """Готовое значение или None (без проверки версии — вызывающий делает ensure_fresh)."""
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value, version=_CURRENT) -> None:
+        """Кладёт значение, если с момента начала его сборки версия каталога не сменилась."""
+        if value is None:
+            return
+        if version is not _CURRENT and version != self.version:
+            return
+        self._entries[key] = value
+
+    async def get_or_build(self, key, builder):
+        """
+        Возвращает значение из кеша или строит его через async builder().
+        None не кешируется (например, товар не найден или БД недоступна).
+        """
+        await self.ensure_fresh()
+        value = self.get(key)
+        if value is not None:
+            return value
+        version = self.version
+        value = await builder()
+        self.put(key, value, version)
+        return value
+
+    def invalidate(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,144 @@
+import asyncio
+import html
+import logging
+import re
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+
+from aiogram import types
+
+from cards import PHOTO_FILE_IDS, CardView
+
+logger = logging.getLogger(__name__)
+
+INLINE_PAGE_SIZE = 20          # результатов на страницу (Telegram допускает до 50)
+INLINE_CACHE_TIME = 300        # сколько секунд Telegram может кешировать ответ на одинаковый запрос
+MAX_CACHED_QUERIES = 2048      # LRU готовых страниц результатов
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Нижний регистр, ё → е, без HTML и лишних пробелов — для сравнения запроса с товаром."""
+    text = html.unescape(_TAG_RE.sub(" ", text or ""))
+    return _SPACE_RE.sub(" ", text.lower().replace("ё", "е")).strip()
+
+
+class IndexEntry(NamedTuple):
+    card: CardView
+    title: str       # название как есть — заголовок inline-результата
+    name: str        # нормализованное название
+    haystack: str    # название + категория + происхождение + описание без HTML
+
+
+class CatalogIndex:
+    """
+    In-memory индекс каталога для inline-режима и поиска в боте.
+
+    Строится целиком одним запросом при смене версии каталога; сам поиск — подстроки
+    по нормализованному тексту, без БД. Готовые страницы результатов кешируются по
+    (запрос, offset), поэтому повторные нажатия клавиш почти ничего не стоят.
+    """
+
+    def __init__(self, page_size: int = INLINE_PAGE_SIZE, max_cached_queries: int = MAX_CACHED_QUERIES):
+        self.page_size = page_size
+        self.max_cached_queries = max_cached_queries
+        self.version = None
+        self._entries: List[IndexEntry] = []
+        self._by_id = {}
+        self._pages = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, tea_id: int) -> Optional[IndexEntry]:
+        return self._by_id.get(tea_id)
+
+    def rebuild(self, cards, version) -> None:
+        """cards — пары (TeaCard, CardView) всех активных товаров."""
+        entries = []
+        for tea, card in cards:
+            name = normalize(tea.name)
+            haystack = " ".join(
+                part for part in (name, normalize(tea.category), normalize(tea.origin), normalize(tea.description))
+                if part
+            )
+            entries.append(IndexEntry(card, tea.name, name, haystack))
+        self._entries = entries
+        self._by_id = {entry.card.tea_id: entry for entry in entries}
+        self._pages.clear()
+        self.version = version
+        logger.info("Индекс каталога перестроен: %s товаров (версия %s).", len(entries), version)
+
+    def invalidate(self) -> None:
+        """Следующий ensure() пересоберёт индекс; до этого поиск работает по текущему."""
+        self.version = None
+
+    async def ensure(self, version, loader) -> None:
+        """Перестраивает индекс, если он собран не для этой версии каталога (одновременно — один раз)."""
+        if self.version is not None and self.version == version:
+            return
+        async with self._lock:
+            if self.version is not None and self.version == version:
+                return
+            cards = await loader()
+            if cards is not None:
+                self.rebuild(cards, version)
+
+    def search(self, query: str) -> List[IndexEntry]:
+        """Все слова запроса должны встретиться в товаре; совпадения в названии — выше."""
+        words = normalize(query).split()
+        if not words:
+            return list(self._entries)
+        ranked = []
+        for entry in self._entries:
+            if all(word in entry.haystack for word in words):
+                in_name = sum(word in entry.name for word in words)
+                ranked.append((-in_name, entry.card.tea_id, entry))
+        ranked.sort(key=lambda item: item[:2])
+        return [entry for _, _, entry in ranked]
+
+    def page(self, query: str, offset: int) -> Tuple[List[IndexEntry], str]:
+        """Страница результатов и next_offset ("" — страниц больше нет)."""
+        key = (normalize(query), offset)
+        cached = self._pages.get(key)
+        if cached is not None:
+            self._pages.move_to_end(key)
+            return cached
+        matches = self.search(query)
+        chunk = matches[offset:offset + self.page_size]
+        next_offset = str(offset + self.page_size) if offset + self.page_size < len(matches) else ""
+        result = (chunk, next_offset)
+        self._pages[key] = result
+        while len(self._pages) > self.max_cached_queries:
+            self._pages.popitem(last=False)
+        return result
+
+
+def inline_result(entry: IndexEntry, bot_username: Optional[str]) -> types.InlineQueryResult:
+    """Результат inline-запроса: фото по file_id, если оно уже загружалось, иначе по URL или текстом."""
+    card = entry.card
+    tea_id = card.tea_id
+    markup = None
+    if bot_username:
+        markup = types.InlineKeyboardMarkup(inline_keyboard=[[types.InlineKeyboardButton(
+            text="Открыть в боте", url=f"https://t.me/{bot_username}?start=tea_{tea_id}"
+        )]])
+    file_id = PHOTO_FILE_IDS.get((tea_id, card.photo)) if card.photo else None
+    if file_id:
+        return types.InlineQueryResultCachedPhoto(
+            id=str(tea_id), photo_file_id=file_id, caption=card.caption, reply_markup=markup,
+        )
+    if card.photo and card.photo.startswith("http"):
+        return types.InlineQueryResultPhoto(
+            id=str(tea_id), photo_url=card.photo, thumbnail_url=card.photo,
+            title=entry.title, caption=card.caption, reply_markup=markup,
+        )
+    return types.InlineQueryResultArticle(
+        id=str(tea_id),
+        title=entry.title,
+        input_message_content=types.InputTextMessageContent(message_text=card.text_parts[0]),
+        reply_markup=markup,
+    )
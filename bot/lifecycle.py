@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Coroutine, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+# Метка времени остановки процесса — по ней новый процесс считает длительность рестарта
+STOP_MARK_FILE = os.getenv("BOT_STOP_MARK", os.path.join(tempfile.gettempdir(), "tea_bot.stopped_at"))
+
+
+def run(main: Coroutine) -> Any:
+    """
+    asyncio.run или, при USE_UVLOOP=1 и установленном пакете, uvloop — более быстрый
+    цикл событий и сокеты. Без uvloop (Windows, не установлен) — обычный asyncio.
+    """
+    if os.getenv("USE_UVLOOP", "").lower() in ("1", "true", "yes"):
+        try:
+            import uvloop
+        except ImportError:
+            logger.warning("USE_UVLOOP задан, но uvloop не установлен — работаем на asyncio.")
+        else:
+            return uvloop.run(main)
+    return asyncio.run(main)
+
+
+def write_stop_mark() -> None:
+    try:
+        with open(STOP_MARK_FILE, "w") as f:
+            f.write(str(time.time()))
+    except OSError as e:
+        logger.warning("Не удалось записать метку остановки %s: %s", STOP_MARK_FILE, e)
+
+
+def read_stop_mark() -> Optional[float]:
+    try:
+        with open(STOP_MARK_FILE) as f:
+            return float(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+class InFlightTracker(BaseMiddleware):
+    """
+    Внешний outer-middleware на dp.update: считает апдейты в обработке (включая
+    ждущие своей очереди у пользователя), чтобы при остановке дождаться их,
+    а не обрывать посреди оформления заказа.
+
+    Заодно меряет рестарт: время от старта процесса (и от остановки прошлого,
+    если есть метка) до первого обработанного апдейта.
+    """
+
+    def __init__(self):
+        self.active = 0
+        self.processed = 0
+        self.last_update_id: Optional[int] = None   # старший принятый апдейт — подтвердить при остановке
+        self.started_at = time.time()
+        self.stopped_at = None   # когда остановился прошлый процесс
+        self.first_update_seconds = None
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def mark_started(self) -> None:
+        self.started_at = time.time()
+        self.stopped_at = read_stop_mark()
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        self.active += 1
+        self._idle.clear()
+        if self.last_update_id is None or event.update_id > self.last_update_id:
+            self.last_update_id = event.update_id
+        try:
+            return await handler(event, data)
+        finally:
+            self.active -= 1
+            self.processed += 1
+            if self.first_update_seconds is None:
+                self._report_first_update()
+            if not self.active:
+                self._idle.set()
+
+    def _report_first_update(self) -> None:
+        now = time.time()
+        self.first_update_seconds = now - self.started_at
+        if self.stopped_at and self.stopped_at < self.started_at:
+            logger.info(
+                "Первый апдейт обработан: %.2f с после старта, %.2f с после остановки прошлого процесса.",
+                self.first_update_seconds, now - self.stopped_at,
+            )
+        else:
+            logger.info("Первый апдейт обработан: %.2f с после старта.", self.first_update_seconds)
+
+    async def drain(self, timeout: float) -> bool:
+        """Ждёт, пока не останется апдейтов в обработке. False — не уложились в timeout."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning("Остановка: за %s с не завершились %s апдейтов.", timeout, self.active)
+            return False
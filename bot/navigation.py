@@ -0,0 +1,138 @@
+import logging
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from aiogram import Bot, types
+from aiogram.exceptions import TelegramBadRequest
+
+from cards import CardView, forget_photo, photo_input, remember_photo, send_card
+
+logger = logging.getLogger(__name__)
+
+MAX_TRACKED_CHATS = 50_000  # сколько чатов помнить (самые давние вытесняются)
+
+
+class Screen(NamedTuple):
+    """Текущий «экран» чата: сообщение бота, которое меняется при навигации."""
+    message_id: int
+    kind: str           # "text" — текст с inline-кнопками, "card" — фото-карточка одним сообщением
+    related: tuple = ()  # все сообщения экрана (фото + продолжение описания), если их несколько
+
+
+def _not_modified(error: TelegramBadRequest) -> bool:
+    return "message is not modified" in str(error)
+
+
+class Navigator:
+    """
+    Навигация редактированием сообщений на месте вместо «удалить и отправить заново».
+
+    Текстовый экран меняется через editMessageText, карточка — через editMessageMedia
+    (один вызов API вместо двух и без мигания). Новое сообщение отправляется только
+    когда редактирование невозможно: фото нельзя превратить в текст, reply-клавиатуру
+    нельзя прикрепить правкой, а слишком старое сообщение Telegram править не даст.
+    """
+
+    def __init__(self, max_chats: int = MAX_TRACKED_CHATS):
+        self.max_chats = max_chats
+        self._screens = OrderedDict()
+
+    def current(self, chat_id: int) -> Optional[Screen]:
+        return self._screens.get(chat_id)
+
+    def remember(self, chat_id: int, message_id: int, kind: str, related: tuple = ()) -> None:
+        self._screens[chat_id] = Screen(message_id, kind, related)
+        self._screens.move_to_end(chat_id)
+        while len(self._screens) > self.max_chats:
+            self._screens.popitem(last=False)
+
+    def forget(self, chat_id: int, message_id: Optional[int] = None) -> None:
+        screen = self._screens.get(chat_id)
+        if screen and (message_id is None or screen.message_id == message_id):
+            del self._screens[chat_id]
+
+    async def show_text(
+        self,
+        bot: Bot,
+        chat_id: int,
+        text: str,
+        reply_markup=None,
+        source: Optional[types.Message] = None,
+    ) -> None:
+        """
+        Показывает текстовый экран. source — сообщение, с кнопки которого пришёл callback:
+        если это текст, а разметка inline (или её нет), правим его на месте.
+        """
+        editable = source is not None and not source.photo and (
+            reply_markup is None or isinstance(reply_markup, types.InlineKeyboardMarkup)
+        )
+        if editable:
+            try:
+                await bot.edit_message_text(
+                    text=text,
+                    chat_id=chat_id,
+                    message_id=source.message_id,
+                    reply_markup=reply_markup,
+                )
+                self.remember(chat_id, source.message_id, "text")
+                return
+            except TelegramBadRequest as e:
+                if _not_modified(e):
+                    self.remember(chat_id, source.message_id, "text")
+                    return
+                logger.info("Экран %s не отредактировать (%s), отправляем новый.", source.message_id, e)
+
+        message = await bot.send_message(chat_id, text, reply_markup=reply_markup)
+        if isinstance(reply_markup, types.InlineKeyboardMarkup) or reply_markup is None:
+            self.remember(chat_id, message.message_id, "text")
+        else:
+            # Сообщение с reply-клавиатурой — не экран: его inline-кнопками не навигируют
+            self.forget(chat_id)
+
+    async def show_card(self, bot: Bot, chat_id: int, card: CardView) -> None:
+        """
+        Показывает карточку. Если текущий экран чата — уже открытая карточка, а новая
+        помещается в одно фото, меняем фото, подпись и кнопки одним editMessageMedia.
+        """
+        screen = self.current(chat_id)
+        if screen and screen.kind == "card" and card.photo and not card.follow_ups:
+            try:
+                message = await bot.edit_message_media(
+                    chat_id=chat_id,
+                    message_id=screen.message_id,
+                    media=types.InputMediaPhoto(media=photo_input(card), caption=card.caption),
+                    reply_markup=card.keyboard,
+                )
+                if isinstance(message, types.Message):
+                    remember_photo(card, message)
+                self.remember(chat_id, screen.message_id, "card")
+                return
+            except TelegramBadRequest as e:
+                if _not_modified(e):
+                    return
+                logger.info("Карточку %s не отредактировать (%s), отправляем новую.", screen.message_id, e)
+                forget_photo(card)
+
+        messages = await send_card(bot, chat_id, card)
+        if not messages:
+            return
+        last = messages[-1]
+        if len(messages) == 1:
+            self.remember(chat_id, last.message_id, "card" if last.photo else "text")
+        else:
+            self.remember(chat_id, last.message_id, "text", tuple(m.message_id for m in messages))
+
+    async def close(self, bot: Bot, chat_id: int, message: types.Message) -> None:
+        """Убирает экран (например, карточку): все его сообщения — одним вызовом API."""
+        ids = [message.message_id]
+        screen = self.current(chat_id)
+        if screen and screen.message_id == message.message_id:
+            ids = list(screen.related) or ids
+            self.forget(chat_id)
+        try:
+            if len(ids) == 1:
+                await bot.delete_message(chat_id, ids[0])
+            else:
+                await bot.delete_messages(chat_id, ids)
+        except TelegramBadRequest:
+            pass  # уже удалено или слишком старое — не страшно
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+MAX_PENDING = 20   # сколько апдейтов одного пользователя может ждать своей очереди
+
+
+def pick_victim(waiting, key: Callable[[Any], Any]):
+    """
+    Кого выбросить из переполненной очереди: самый старый callback, у которого есть
+    более новый дубль, иначе самый старый callback; None — в очереди одни сообщения
+    (key(item) is None). Общее правило для очереди middleware и очереди воркера шарда.
+    """
+    seen = set()
+    duplicated = None
+    for item in reversed(waiting):   # от новых к старым: последний найденный дубль — самый старый
+        item_key = key(item)
+        if item_key is None:
+            continue
+        if item_key in seen:
+            duplicated = item
+        seen.add(item_key)
+    if duplicated is not None:
+        return duplicated
+    return next((item for item in waiting if key(item) is not None), None)
+
+
+class _Turn:
+    """Ожидающий апдейт: ключ для поиска дублей и future, которым ему передают очередь."""
+    __slots__ = ("key", "future")
+
+    def __init__(self, key, future: asyncio.Future):
+        self.key = key
+        self.future = future
+
+
+class _UserQueue:
+    __slots__ = ("busy", "waiting")
+
+    def __init__(self):
+        self.busy = False
+        self.waiting = deque()
+
+
+class UserOrderingMiddleware(BaseMiddleware):
+    """
+    Outer-middleware на dp.update: апдейты одного пользователя обрабатываются строго
+    по очереди (в порядке поступления), разных пользователей — параллельно.
+
+    Корзины и FSM меняются обработчиками на месте, поэтому двойной тап одного
+    пользователя не должен обгонять сам себя (иначе, например, экран корзины
+    после «➕➕» показывает устаревшее количество, а два «Оформить» — два резерва).
+    Глобальной блокировки нет: очередь своя у каждого пользователя и удаляется,
+    как только он простаивает.
+
+    Очередь ограничена max_pending. При переполнении выбрасывается самый старый
+    ожидающий callback, у которого есть более новый дубль (та же кнопка того же
+    сообщения), иначе — самый старый ожидающий callback; на выброшенный callback
+    отвечаем пустым answer, чтобы у кнопки не висели «часики». Сообщения
+    (ввод ФИО, граммов и т.п.) не выбрасываются никогда. Inline-запросы и
+    апдейты без пользователя идут мимо очереди — они ничего не меняют.
+    """
+
+    def __init__(self, max_pending: int = MAX_PENDING):
+        self.max_pending = max_pending
+        self._queues: Dict[int, _UserQueue] = {}
+        self.dropped = 0
+        self.max_depth = 0
+
+    def __len__(self) -> int:
+        """Сколько пользователей сейчас в обработке или в очереди."""
+        return len(self._queues)
+
+    @staticmethod
+    def _key(event: Update):
+        """Ключ дубля: только callback-и, одинаковые — та же кнопка того же сообщения."""
+        query = event.callback_query
+        if query is None:
+            return None
+        message_id = query.message.message_id if query.message else query.inline_message_id
+        return message_id, query.data
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or event.inline_query is not None:
+            return await handler(event, data)
+
+        queue = self._queues.get(user.id)
+        if queue is None:
+            queue = self._queues[user.id] = _UserQueue()
+        if queue.busy:
+            turn = _Turn(self._key(event), asyncio.get_running_loop().create_future())
+            queue.waiting.append(turn)
+            self.max_depth = max(self.max_depth, len(queue.waiting))
+            self._trim(queue)
+            try:
+                dropped = await turn.future
+            except asyncio.CancelledError:
+                # Очередь могли передать нам одновременно с отменой — отдаём её дальше
+                if turn.future.done() and not turn.future.cancelled() and not turn.future.result():
+                    self._release(user.id, queue)
+                raise
+            if dropped:
+                await self._answer_dropped(event, data)
+                return UNHANDLED
+        else:
+            queue.busy = True
+
+        try:
+            return await handler(event, data)
+        finally:
+            self._release(user.id, queue)
+
+    def _trim(self, queue: _UserQueue) -> None:
+        while len(queue.waiting) > self.max_pending:
+            victim = self._pick_victim(queue.waiting)
+            if victim is None:
+                return  # в очереди одни сообщения — ждут все
+            queue.waiting.remove(victim)
+            victim.future.set_result(True)
+            self.dropped += 1
+
+    @staticmethod
+    def _pick_victim(waiting) -> Optional[_Turn]:
+        return pick_victim(waiting, lambda turn: turn.key)
+
+    def _release(self, user_id: int, queue: _UserQueue) -> None:
+        """Передаёт очередь следующему ожидающему апдейту или удаляет её."""
+        while queue.waiting:
+            turn = queue.waiting.popleft()
+            if not turn.future.done():   # отменённые (задача снята) пропускаем
+                turn.future.set_result(False)
+                return
+        queue.busy = False
+        if self._queues.get(user_id) is queue:
+            del self._queues[user_id]
+
+    @staticmethod
+    async def _answer_dropped(event: Update, data: Dict[str, Any]) -> None:
+        bot = data.get("bot")
+        if bot is None:
+            return
+        try:
+            await bot.answer_callback_query(event.callback_query.id)
+        except Exception as e:
+            logger.debug("Не удалось ответить на выброшенный callback: %s", e)
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from app.database import AsyncSessionLocal
+from app.crud import get_active_promo_rules, get_promocodes_version
+from app.promo import normalize_code
+from app.read_models import PromoRule
+
+logger = logging.getLogger(__name__)
+
+
+class PromoCache:
+    """
+    Правила всех активных промокодов в памяти: {нормализованный код: PromoRule}.
+
+    Набор перечитывается целиком, только когда меняется его версия в БД
+    (число строк + max(updated_at)), а версия сверяется не чаще раза в
+    check_interval секунд. Проверка кода на шаге оформления — поиск в dict,
+    без запроса к БД; неизвестные коды тоже отвечаются из памяти.
+    Счётчик использований здесь может отставать — окончательно лимит
+    проверяет атомарный crud.redeem_promocode при подтверждении заказа.
+    """
+
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        self.version = None
+        self._rules = {}
+        self._checked_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    async def ensure_fresh(self, force: bool = False) -> None:
+        if not force and time.monotonic() - self._checked_at < self.check_interval:
+            return
+        async with self._lock:
+            if not force and time.monotonic() - self._checked_at < self.check_interval:
+                return
+            try:
+                async with AsyncSessionLocal() as db:
+                    version = await get_promocodes_version(db)
+                    if version != self.version:
+                        rules = await get_active_promo_rules(db)
+                        self._rules = {rule.code: rule for rule in rules}
+                        self.version = version
+                        logger.info("Промокоды перечитаны: %s активных.", len(rules))
+            except Exception as e:
+                # Работаем на прежнем наборе и не дёргаем упавшую БД на каждом вводе
+                logger.exception("Ошибка обновления промокодов: %s", e)
+            self._checked_at = time.monotonic()
+
+    async def get(self, code: str) -> Optional[PromoRule]:
+        await self.ensure_fresh()
+        return self._rules.get(normalize_code(code))
+
+    def __len__(self) -> int:
+        return len(self._rules)
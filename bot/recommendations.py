@@ -0,0 +1,179 @@
+import logging
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from inline_search import normalize
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 6                 # сколько соседей хранить на товар
+FULL_REBUILD_SHARE = 0.2  # если изменилось больше этой доли каталога — пересчёт целиком
+NAME_WEIGHT = 2           # слова названия весят вдвое больше слов описания
+
+_WORD_RE = re.compile(r"[^\W\d_]{2,}|\d+")
+
+
+def tea_terms(tea) -> Counter:
+    """
+    Термы товара: слова названия (с весом NAME_WEIGHT), описания без HTML,
+    а также категория и происхождение целиком — как отдельные признаки.
+    """
+    terms = Counter()
+    for word in _WORD_RE.findall(normalize(tea.name)):
+        terms[word] += NAME_WEIGHT
+    terms.update(_WORD_RE.findall(normalize(tea.description)))
+    if tea.category:
+        terms["cat:" + normalize(tea.category)] += 3
+    if tea.origin:
+        terms["origin:" + normalize(tea.origin)] += 2
+    return terms
+
+
+class Recommender:
+    """
+    «Похожие» товары: TF-IDF по названию, категории, происхождению и описанию,
+    косинусная близость и заранее посчитанные top-k соседей каждого товара.
+
+    Запрос similar() — чтение готового списка из памяти. При смене каталога
+    update() пересчитывает векторы только изменившихся товаров и сравнивает
+    их со всеми остальными (матрица k × n вместо n × n); соседи прочих товаров
+    правятся точечно. IDF при этом не пересчитывается для неизменившихся строк —
+    небольшой дрейф весов снимается полным пересчётом, когда изменений много.
+    """
+
+    def __init__(self, top_k: int = TOP_K):
+        self.top_k = top_k
+        self.version = None
+        self._terms: Dict[int, Counter] = {}   # tea_id → термы (для поиска изменившихся)
+        self._names: Dict[int, str] = {}
+        self._vocab: Dict[str, int] = {}
+        self._df = Counter()                   # в скольких товарах встречается терм
+        self._ids: List[int] = []              # строка матрицы → tea_id
+        self._row: Dict[int, int] = {}         # tea_id → строка матрицы
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._neighbours: Dict[int, List[Tuple[float, int]]] = {}
+
+    def similar(self, tea_id: int, limit: Optional[int] = None) -> List[int]:
+        return [other for _, other in self._neighbours.get(tea_id, [])[:limit or self.top_k]]
+
+    def similar_items(self, tea_id: int, limit: Optional[int] = None) -> List[Tuple[int, str]]:
+        """Соседи товара как (id, название) — готово для кнопок."""
+        return [(other, self._names[other]) for other in self.similar(tea_id, limit)]
+
+    # ---------- векторизация ----------
+
+    def _idf(self, term: str) -> float:
+        return math.log((1 + len(self._ids)) / (1 + self._df[term])) + 1.0
+
+    def _vector(self, terms: Counter) -> np.ndarray:
+        vector = np.zeros(len(self._vocab), dtype=np.float32)
+        for term, tf in terms.items():
+            vector[self._vocab[term]] = (1.0 + math.log(tf)) * self._idf(term)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _grow_vocab(self, terms: Counter) -> None:
+        for term in terms:
+            if term not in self._vocab:
+                self._vocab[term] = len(self._vocab)
+
+    def _top(self, scores: np.ndarray, exclude_row: int) -> List[Tuple[float, int]]:
+        scores = scores.copy()
+        scores[exclude_row] = -1.0
+        k = min(self.top_k, len(scores) - 1)
+        if k <= 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        ranked = sorted(best, key=lambda i: (-scores[i], self._ids[i]))
+        return [(float(scores[i]), self._ids[i]) for i in ranked if scores[i] > 0]
+
+    # ---------- пересчёт ----------
+
+    def rebuild(self, teas, version=None) -> None:
+        """Полный пересчёт: векторы всех товаров и матрица близости n × n."""
+        self._terms = {tea.id: tea_terms(tea) for tea in teas}
+        self._names = {tea.id: tea.name for tea in teas}
+        self._ids = sorted(self._terms)
+        self._row = {tea_id: i for i, tea_id in enumerate(self._ids)}
+        self._vocab = {}
+        self._df = Counter()
+        for terms in self._terms.values():
+            self._grow_vocab(terms)
+            self._df.update(terms.keys())
+        self._matrix = np.zeros((len(self._ids), len(self._vocab)), dtype=np.float32)
+        for i, tea_id in enumerate(self._ids):
+            self._matrix[i] = self._vector(self._terms[tea_id])
+        similarity = self._matrix @ self._matrix.T
+        self._neighbours = {tea_id: self._top(similarity[i], i) for i, tea_id in enumerate(self._ids)}
+        self.version = version
+        logger.info("Рекомендации пересчитаны целиком: %s товаров, %s термов.", len(self._ids), len(self._vocab))
+
+    def update(self, teas, version=None) -> None:
+        """Пересчитывает только изменившиеся, новые и удалённые товары."""
+        teas = list(teas)
+        new_terms = {tea.id: tea_terms(tea) for tea in teas}
+        self._names = {tea.id: tea.name for tea in teas}
+        changed = {tea_id for tea_id, terms in new_terms.items() if self._terms.get(tea_id) != terms}
+        removed = set(self._terms) - set(new_terms)
+        if not changed and not removed:
+            self.version = version
+            return
+        if not self._ids or len(changed) + len(removed) > FULL_REBUILD_SHARE * max(len(new_terms), 1):
+            self.rebuild(teas, version)
+            return
+
+        # Документные частоты: вычитаем старые термы изменившихся/удалённых, добавляем новые
+        for tea_id in changed | removed:
+            if tea_id in self._terms:
+                self._df.subtract(self._terms[tea_id].keys())
+        for tea_id in changed:
+            self._grow_vocab(new_terms[tea_id])
+            self._df.update(new_terms[tea_id].keys())
+        self._df = +self._df  # убираем нулевые счётчики
+        self._terms = new_terms
+
+        # Строки матрицы: удалённые убираем, новые добавляем, словарь мог вырасти
+        keep = [i for i, tea_id in enumerate(self._ids) if tea_id not in removed]
+        matrix = self._matrix[keep]
+        if matrix.shape[1] < len(self._vocab):
+            matrix = np.pad(matrix, ((0, 0), (0, len(self._vocab) - matrix.shape[1])))
+        ids = [self._ids[i] for i in keep]
+        added = sorted(changed - set(ids))
+        if added:
+            matrix = np.vstack([matrix, np.zeros((len(added), len(self._vocab)), dtype=np.float32)])
+            ids += added
+        self._ids = ids
+        self._row = {tea_id: i for i, tea_id in enumerate(ids)}
+        for tea_id in changed:
+            matrix[self._row[tea_id]] = self._vector(new_terms[tea_id])
+        self._matrix = matrix
+
+        # Близость изменившихся товаров ко всем: k × n вместо полной n × n
+        changed_rows = [self._row[tea_id] for tea_id in sorted(changed)]
+        scores = self._matrix[changed_rows] @ self._matrix.T
+        for row_scores, tea_id in zip(scores, sorted(changed)):
+            self._neighbours[tea_id] = self._top(row_scores, self._row[tea_id])
+        for tea_id in removed:
+            self._neighbours.pop(tea_id, None)
+
+        # Соседи остальных товаров: правим точечно, строку целиком — только если
+        # среди её соседей был изменившийся или удалённый товар (его оценка устарела)
+        touched = changed | removed
+        for tea_id in self._ids:
+            if tea_id in changed:
+                continue
+            row = self._row[tea_id]
+            current = self._neighbours.get(tea_id, [])
+            if any(other in touched for _, other in current):
+                self._neighbours[tea_id] = self._top(self._matrix @ self._matrix[row], row)
+                continue
+            candidates = [(float(scores[j][row]), other) for j, other in enumerate(sorted(changed))]
+            merged = sorted(current + [c for c in candidates if c[0] > 0], key=lambda c: (-c[0], c[1]))
+            self._neighbours[tea_id] = merged[:self.top_k]
+
+        self.version = version
+        logger.info("Рекомендации обновлены: изменено %s, удалено %s товаров.", len(changed), len(removed))
@@ -0,0 +1,360 @@
+"""
+Шардированный запуск бота: один приёмник апдейтов и N процессов-обработчиков.
+
+Приёмник (long polling или webhook) не разбирает апдейты в объекты aiogram —
+он берёт из сырого JSON id пользователя и кладёт апдейт в очередь воркера
+shard_for(user_id). Каждый воркер — отдельный процесс со своим диспетчером,
+кешами и пулом соединений с БД (как обычный bot.py, только без getUpdates).
+
+Все апдейты пользователя попадают в один воркер и идут в нём по порядку
+(в очередь — в порядке получения, внутри воркера порядок держит
+UserOrderingMiddleware), поэтому корзины, FSM и экраны в памяти воркера
+остаются согласованными. Разные пользователи обрабатываются на разных ядрах.
+
+    BOT_WORKERS=4 python bot/shard.py                 # long polling
+    BOT_WORKERS=4 WEBHOOK_URL=https://.../tg python bot/shard.py   # webhook
+
+Пул БД на воркер задаётся как обычно (DB_POOL_SIZE / DB_MAX_OVERFLOW):
+суммарно соединений в N раз больше — учтите max_connections в Postgres.
+"""
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import signal
+import sys
+from collections import deque
+from typing import Callable, List, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiohttp import web
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("BOT_WORKERS", "4"))
+QUEUE_SIZE = 1000         # пачек в очереди воркера; полная очередь притормаживает приёмник
+MAX_IN_FLIGHT = 200       # одновременно обрабатываемых апдейтов в воркере
+# Из них у одного пользователя — обрабатываемый + ordering.MAX_PENDING ждущих в его очереди.
+# Остальные его апдейты ждут в воркере, не занимая общих слотов, — флуд одного не стопорит шард.
+# Эта очередь тоже ограничена MAX_PENDING (лишние callback-и выбрасываются по правилу
+# ordering.pick_victim); сообщения не выбрасываются, пока их меньше MAX_USER_BACKLOG
+MAX_USER_BACKLOG = 200
+POLL_TIMEOUT = 30         # long polling getUpdates, сек
+POLL_LIMIT = 100          # апдейтов за один getUpdates
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8081"))
+API_URL = "https://api.telegram.org"
+
+# Поля апдейта, в которых лежит событие с автором (from)
+_EVENT_FIELDS = (
+    "message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+    "pre_checkout_query", "shipping_query", "my_chat_member", "chat_member", "chat_join_request",
+)
+
+
+def shard_for(user_id: Optional[int], workers: int) -> int:
+    """Номер воркера для пользователя; апдейты без пользователя — в воркер 0."""
+    return user_id % workers if user_id is not None else 0
+
+
+def callback_key(raw: dict):
+    """Ключ дубля для сырого апдейта (как UserOrderingMiddleware._key): та же кнопка того же сообщения."""
+    query = raw.get("callback_query")
+    if query is None:
+        return None
+    message = query.get("message")
+    return (message["message_id"] if message else query.get("inline_message_id")), query.get("data")
+
+
+def update_user_id(raw: dict) -> Optional[int]:
+    """id автора апдейта прямо из JSON Bot API — без разбора в объекты aiogram."""
+    for field in _EVENT_FIELDS:
+        event = raw.get(field)
+        if event is not None:
+            user = event.get("from")
+            return user.get("id") if user else None
+    return None
+
+
+# ---------- воркер ----------
+
+def worker_main(index: int, queue, events, setup: Optional[Callable] = None, background: bool = True) -> None:
+    setup_logging(tag=f"worker {index}", force=True)   # bot.py мог уже настроить без метки при распаковке setup
+    # Ctrl+C приходит всей группе процессов — воркеры останавливает приёмник, дав им доработать
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from lifecycle import run
+    run(_worker(index, queue, events, setup, background))
+
+
+async def _worker(index: int, queue, events, setup, background: bool) -> None:
+    import bot as bot_module   # bot/bot.py: свой диспетчер, кеши и пул БД в каждом процессе
+    from aiogram import types
+    from ordering import MAX_PENDING, pick_victim
+
+    if setup is not None:
+        setup()
+    # Воркер сообщает о готовности только с прогретыми кешами — приёмник не шлёт апдейты в холодный процесс
+    await bot_module.warm_up()
+    if background:
+        # Истёкшие резервы общие для всех — их снимает только воркер 0
+        bot_module.start_background_tasks(sweep_reservations=index == 0)
+
+    bot, dp = bot_module.bot, bot_module.dp
+    bot_module.in_flight.mark_started()
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(MAX_IN_FLIGHT)
+    in_flight = set()
+    user_active = {}    # пользователь → его апдейтов в обработке (со слотом)
+    user_backlog = {}   # пользователь → его апдейты сверх per_user, по порядку
+    per_user = MAX_PENDING + 1
+    processed = 0
+    dropped = 0
+
+    def start(raw: dict, user_id: Optional[int]) -> None:
+        # Задачи стартуют в порядке создания — очередь пользователя в middleware тоже
+        task = asyncio.create_task(feed(raw, user_id))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    async def answer_dropped(query_id: str) -> None:
+        # Чтобы у выброшенной кнопки не висели «часики»
+        try:
+            await bot.answer_callback_query(query_id)
+        except Exception as e:
+            logger.debug("Не удалось ответить на выброшенный callback: %s", e)
+
+    def trim(backlog: deque) -> None:
+        nonlocal dropped
+        while len(backlog) > MAX_PENDING:
+            victim = pick_victim(backlog, callback_key)
+            if victim is None:
+                if len(backlog) <= MAX_USER_BACKLOG:
+                    return   # одни сообщения — ждут все, пока их разумное число
+                victim = backlog[0]
+                logger.warning("Очередь пользователя %s переполнена: выброшен апдейт %s.",
+                               update_user_id(victim), victim.get("update_id"))
+            backlog.remove(victim)
+            dropped += 1
+            if victim.get("callback_query"):
+                task = asyncio.create_task(answer_dropped(victim["callback_query"]["id"]))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+
+    async def feed(raw: dict, user_id: Optional[int]) -> None:
+        try:
+            await dp.feed_update(bot, types.Update.model_validate(raw, context={"bot": bot}))
+        except Exception as e:
+            logger.exception("Ошибка обработки апдейта %s: %s", raw.get("update_id"), e)
+        finally:
+            backlog = user_backlog.get(user_id)
+            if backlog:
+                # Слот переходит следующему апдейту того же пользователя
+                start(backlog.popleft(), user_id)
+                if not backlog:
+                    del user_backlog[user_id]
+            else:
+                if user_id is not None:
+                    user_active[user_id] -= 1
+                    if not user_active[user_id]:
+                        del user_active[user_id]
+                slots.release()
+
+    events.put(("ready", index))
+    while True:
+        batch = await loop.run_in_executor(None, queue.get)
+        if batch is None:
+            break
+        for raw in batch:
+            processed += 1
+            user_id = update_user_id(raw)
+            if user_id is not None and user_active.get(user_id, 0) >= per_user:
+                backlog = user_backlog.setdefault(user_id, deque())
+                backlog.append(raw)
+                trim(backlog)
+                continue
+            await slots.acquire()
+            if user_id is not None:
+                user_active[user_id] = user_active.get(user_id, 0) + 1
+            start(raw, user_id)
+
+    # Задачи, ещё не дошедшие до middleware, InFlightTracker не видит — ждём их здесь
+    # (и отложенные апдейты пользователей: они стартуют по мере завершения предыдущих)
+    deadline = loop.time() + bot_module.SHUTDOWN_TIMEOUT
+    while in_flight and loop.time() < deadline:
+        await asyncio.wait(set(in_flight), timeout=deadline - loop.time(), return_when=asyncio.FIRST_COMPLETED)
+    if dropped:
+        logger.info("Выброшено апдейтов из переполненных очередей пользователей: %s", dropped)
+    await bot_module.shutdown()
+    events.put(("done", index, processed))
+
+
+# ---------- пул воркеров ----------
+
+class ShardPool:
+    """
+    N процессов-обработчиков и маршрутизация апдейтов между ними.
+    route() сохраняет порядок: пачки в очереди воркеров кладутся по одной под замком.
+    """
+
+    def __init__(self, workers: int = WORKERS, setup: Optional[Callable] = None, background: bool = True):
+        self.workers = workers
+        self.setup = setup
+        self.background = background
+        self._ctx = mp.get_context("spawn")
+        self._queues = []
+        self._processes = []
+        self._events = None
+        self._lock = asyncio.Lock()
+        self.processed = {}
+
+    async def start(self) -> None:
+        self._events = self._ctx.Queue()
+        for index in range(self.workers):
+            queue = self._ctx.Queue(QUEUE_SIZE)
+            process = self._ctx.Process(
+                target=worker_main,
+                args=(index, queue, self._events, self.setup, self.background),
+                name=f"bot-worker-{index}",
+            )
+            process.start()
+            self._queues.append(queue)
+            self._processes.append(process)
+        await self._wait_events("ready", self.workers)
+        logger.info("Запущено воркеров: %s", self.workers)
+
+    async def route(self, updates: List[dict]) -> None:
+        batches = [[] for _ in range(self.workers)]
+        for raw in updates:
+            batches[shard_for(update_user_id(raw), self.workers)].append(raw)
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            for queue, batch in zip(self._queues, batches):
+                if batch:
+                    # put блокируется на полной очереди — это и есть обратное давление
+                    await loop.run_in_executor(None, queue.put, batch)
+
+    async def stop(self) -> None:
+        """Воркеры дорабатывают уже полученные апдейты, сохраняют состояние и завершаются."""
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            for queue in self._queues:
+                await loop.run_in_executor(None, queue.put, None)
+        for _, index, processed in await self._wait_events("done", len(self._processes)):
+            self.processed[index] = processed
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join)
+
+    async def _wait_events(self, kind: str, count: int) -> list:
+        loop = asyncio.get_running_loop()
+        received = []
+        while len(received) < count:
+            event = await loop.run_in_executor(None, self._events.get)
+            if event[0] == kind:
+                received.append(event)
+        return received
+
+
+# ---------- приёмник ----------
+
+async def api_call(http: aiohttp.ClientSession, token: str, method: str, **params):
+    timeout = aiohttp.ClientTimeout(total=POLL_TIMEOUT + 15)
+    params = {key: value for key, value in params.items() if value is not None}
+    async with http.post(f"{API_URL}/bot{token}/{method}", json=params, timeout=timeout,
+                         proxy=os.getenv("PROXY_URL")) as resp:
+        payload = await resp.json()
+    if not payload.get("ok"):
+        raise RuntimeError(f"{method}: {payload.get('description')}")
+    return payload["result"]
+
+
+async def poll(pool: ShardPool, http, token: str, allowed_updates: list, stopping: asyncio.Event) -> None:
+    await api_call(http, token, "deleteWebhook", drop_pending_updates=False)
+    offset = None
+    backoff = 1
+    try:
+        while not stopping.is_set():
+            try:
+                updates = await api_call(
+                    http, token, "getUpdates",
+                    offset=offset, timeout=POLL_TIMEOUT, limit=POLL_LIMIT, allowed_updates=allowed_updates,
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Ошибка getUpdates: %s", e)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            backoff = 1
+            if updates:
+                # Offset — до маршрутизации: при отмене во время route пачка всё равно уйдёт
+                # воркерам (shield), и finally должен подтвердить именно её
+                offset = updates[-1]["update_id"] + 1
+                # Остановка не должна оборвать пачку посередине: часть уже в очередях
+                await asyncio.shield(pool.route(updates))
+    finally:
+        if offset is not None:
+            # Подтверждаем последнюю пачку, иначе после рестарта Telegram пришлёт её снова
+            try:
+                await api_call(http, token, "getUpdates", offset=offset, timeout=0, limit=1)
+            except Exception as e:
+                logger.warning("Не удалось подтвердить offset %s: %s", offset, e)
+
+
+async def serve_webhook(pool: ShardPool, http, token: str, allowed_updates: list, stopping: asyncio.Event) -> None:
+    async def handle(request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        await pool.route([await request.json()])
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(urlsplit(WEBHOOK_URL).path or "/", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    params = {"url": WEBHOOK_URL, "allowed_updates": allowed_updates}
+    if WEBHOOK_SECRET:
+        params["secret_token"] = WEBHOOK_SECRET
+    await api_call(http, token, "setWebhook", **params)
+    logger.info("Webhook %s, слушаем %s:%s", WEBHOOK_URL, WEBHOOK_HOST, WEBHOOK_PORT)
+    try:
+        await stopping.wait()
+    finally:
+        await runner.cleanup()
+
+
+async def main() -> None:
+    from config import TOKEN
+    import bot as bot_module   # только чтобы узнать типы апдейтов, на которые есть хендлеры
+
+    allowed_updates = bot_module.dp.resolve_used_update_types()
+    pool = ShardPool(WORKERS)
+    await pool.start()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    receive = serve_webhook if WEBHOOK_URL else poll
+    async with aiohttp.ClientSession() as http:
+        receiver = asyncio.create_task(receive(pool, http, TOKEN, allowed_updates, stopping))
+        await stopping.wait()
+        receiver.cancel()
+        await asyncio.gather(receiver, return_exceptions=True)
+    await pool.stop()
+    logger.info("Обработано апдейтов по воркерам: %s", pool.processed)
+
+
+if __name__ == "__main__":
+    from lifecycle import run
+    setup_logging(tag="receiver")
+    run(main())
@@ -0,0 +1,69 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import Update
+
+from app.tracing import Tracer, span
+
+
+class UpdateTracingMiddleware(BaseMiddleware):
+    """
+    Самый внешний outer-middleware на dp.update: трасса на апдейт (если выбрана).
+    Всё, что происходит внутри — ожидание очереди пользователя, фильтры, обработчик,
+    SQL и вызовы Telegram — попадает в неё спанами.
+    """
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        with self.tracer.trace(
+            event.event_type,
+            update_id=event.update_id,
+            user_id=user.id if user else None,
+        ):
+            return await handler(event, data)
+
+
+class HandlerSpanMiddleware(BaseMiddleware):
+    """Inner-middleware на наблюдателях событий: спан kind="handler" с именем функции-обработчика."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(handler_object.callback, "__name__", "handler") if handler_object else "handler"
+        with span("handler", name):
+            return await handler(event, data)
+
+
+class TelegramSpanMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: спан kind="telegram" на каждый вызов Bot API."""
+
+    async def __call__(self, make_request, bot, method):
+        with span("telegram", type(method).__name__):
+            return await make_request(bot, method)
+
+
+def install(dp, session, tracer: Tracer) -> None:
+    """
+    Подключает трассировку к диспетчеру и сессии — до остальных outer-middleware.
+    При выключенной трассировке (нет выборки и порога) не подключает ничего.
+    """
+    if not tracer.enabled:
+        return
+    dp.update.outer_middleware(UpdateTracingMiddleware(tracer))
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(HandlerSpanMiddleware())
+    session.middleware(TelegramSpanMiddleware())
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import List, Optional
+
+from app.database import AsyncSessionLocal
+from app.crud import get_user_lists, save_user_lists
+
+logger = logging.getLogger(__name__)
+
+MAX_USERS = 20_000     # сколько пользователей держать в памяти (давно неактивные вытесняются)
+MAX_FAVORITES = 50     # избранное на пользователя
+MAX_RECENT = 10        # «недавно смотрели» на пользователя
+MAX_EVICTED = 50_000   # вытесненных несохранённых (БД недоступна долго) — сверх этого теряются старейшие
+FLUSH_BATCH = 1000     # пользователей в одном UPSERT (3 параметра на строку, у asyncpg предел 32767)
+
+
+class _Lists:
+    __slots__ = ("favorites", "recent")
+
+    def __init__(self, favorites=(), recent=()):
+        # dict как упорядоченное множество: порядок добавления, проверка за O(1)
+        self.favorites = dict.fromkeys(favorites[-MAX_FAVORITES:])
+        self.recent = deque(recent, maxlen=MAX_RECENT)   # самый свежий — справа
+
+    def snapshot(self) -> dict:
+        return {"favorites": list(self.favorites), "recent": list(self.recent)}
+
+
+class UserLists:
+    """
+    Избранное и «недавно смотрели» в памяти с ограничением и на пользователя
+    (MAX_FAVORITES / MAX_RECENT), и на число пользователей (LRU на max_users).
+
+    Чтение и изменение — без БД. В Postgres изменения уходят пачками из flush()
+    (многострочные UPSERT по FLUSH_BATCH раз в интервал); из БД списки пользователя
+    читаются один раз — при первом обращении после старта или вытеснения из памяти.
+    Если чтение не удалось, пользователь получает пустые списки на этот вызов —
+    они не кешируются и не сохраняются, иначе затёрли бы сохранённые в БД.
+    """
+
+    def __init__(self, max_users: int = MAX_USERS):
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._dirty = set()
+        self._evicted = {}   # вытесненные несохранённые: {user_id: snapshot} до ближайшего flush
+        self._saving = {}    # то, что flush пишет прямо сейчас: в БД его ещё может не быть
+        self._locks = {}
+        self.dropped = 0     # вытесненных, потерянных из-за MAX_EVICTED
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    async def _get(self, user_id: int) -> _Lists:
+        lists = self._users.get(user_id)
+        if lists is not None:
+            self._users.move_to_end(user_id)
+            return lists
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        try:
+            async with lock:
+                lists = self._users.get(user_id)
+                if lists is None:
+                    lists = await self._load(user_id)
+                    if lists is not None:
+                        self._put(user_id, lists)
+                    else:
+                        lists = _Lists()   # только на этот вызов: не в кеше — не попадёт в flush
+        finally:
+            if not lock.locked():
+                self._locks.pop(user_id, None)
+        return lists
+
+    async def _load(self, user_id: int) -> Optional[_Lists]:
+        """Списки из несохранённого или из БД; None — БД не ответила."""
+        pending = self._evicted.get(user_id) or self._saving.get(user_id)
+        if pending is not None:
+            return _Lists(pending["favorites"], pending["recent"])
+        try:
+            async with AsyncSessionLocal() as db:
+                stored = await get_user_lists(db, user_id)
+        except Exception as e:
+            logger.exception("Ошибка загрузки избранного пользователя %s: %s", user_id, e)
+            return None
+        return _Lists(*stored) if stored else _Lists()
+
+    def _put(self, user_id: int, lists: _Lists) -> None:
+        self._users[user_id] = lists
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            old_id, old_lists = self._users.popitem(last=False)
+            if old_id in self._dirty:
+                self._dirty.discard(old_id)
+                self._stash(old_id, old_lists.snapshot())
+
+    def _stash(self, user_id: int, data: dict, replace: bool = True) -> None:
+        """Откладывает несохранённые списки вытесненного пользователя до flush (не больше MAX_EVICTED)."""
+        if replace or user_id not in self._evicted:
+            self._evicted.pop(user_id, None)
+            self._evicted[user_id] = data
+        while len(self._evicted) > MAX_EVICTED:
+            lost = next(iter(self._evicted))
+            del self._evicted[lost]
+            self.dropped += 1
+            logger.error("Избранное пользователя %s не сохранено: очередь вытесненных переполнена.", lost)
+
+    def _touch(self, user_id: int, lists: _Lists) -> None:
+        # Временные списки (БД не ответила при загрузке) не сохраняем
+        if self._users.get(user_id) is lists:
+            self._dirty.add(user_id)
+
+    # ---------- чтение ----------
+
+    async def favorites(self, user_id: int) -> List[int]:
+        """Избранное, последние добавленные — первыми."""
+        return list(reversed((await self._get(user_id)).favorites))
+
+    async def recent(self, user_id: int) -> List[int]:
+        """Недавно просмотренные, самые свежие — первыми."""
+        return list(reversed((await self._get(user_id)).recent))
+
+    async def is_favorite(self, user_id: int, tea_id: int) -> bool:
+        return tea_id in (await self._get(user_id)).favorites
+
+    # ---------- изменение ----------
+
+    async def toggle_favorite(self, user_id: int, tea_id: int) -> bool:
+        """Добавляет товар в избранное или убирает из него. True — теперь в избранном."""
+        lists = await self._get(user_id)
+        if tea_id in lists.favorites:
+            del lists.favorites[tea_id]
+            added = False
+        else:
+            lists.favorites[tea_id] = None
+            while len(lists.favorites) > MAX_FAVORITES:
+                del lists.favorites[next(iter(lists.favorites))]
+            added = True
+        self._touch(user_id, lists)
+        return added
+
+    async def viewed(self, user_id: int, tea_id: int) -> None:
+        lists = await self._get(user_id)
+        if lists.recent and lists.recent[-1] == tea_id:
+            return  # повторный просмотр той же карточки ничего не меняет
+        try:
+            lists.recent.remove(tea_id)
+        except ValueError:
+            pass
+        lists.recent.append(tea_id)
+        self._touch(user_id, lists)
+
+    # ---------- сохранение ----------
+
+    async def flush(self) -> int:
+        """
+        Сохраняет все изменения с прошлого flush пачками по FLUSH_BATCH пользователей.
+        При ошибке или отмене несохранённое возвращается в очередь и исключение пробрасывается.
+        Возвращает число сохранённых пользователей.
+        """
+        rows = dict(self._evicted)
+        for user_id in self._dirty:
+            lists = self._users.get(user_id)
+            if lists is not None:
+                rows[user_id] = lists.snapshot()
+        if not rows:
+            return 0
+        self._dirty, self._evicted, self._saving = set(), {}, rows
+        items = sorted(rows.items())
+        try:
+            for start in range(0, len(items), FLUSH_BATCH):
+                batch = items[start:start + FLUSH_BATCH]
+                try:
+                    async with AsyncSessionLocal() as db:
+                        await save_user_lists(db, [{"user_id": user_id, **data} for user_id, data in batch])
+                except BaseException:
+                    # И при отмене: таймаут задачи планировщика или остановка — иначе изменения потеряются
+                    self._requeue(items[start:])
+                    raise
+        finally:
+            self._saving = {}
+        return len(items)
+
+    def _requeue(self, items: list) -> None:
+        # Изменения, сделанные за время записи, уже в новых _dirty / _evicted — они новее
+        for user_id, data in items:
+            if user_id in self._users:
+                self._dirty.add(user_id)
+            else:
+                self._stash(user_id, data, replace=False)
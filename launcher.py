@@ -0,0 +1,244 @@
+# launcher.py
+"""
+Продакшен-запуск без Docker: API и бот — отдельными процессами под присмотром.
+
+  * API — uvicorn с несколькими воркерами (--api-workers), бот — свой процесс
+    (или шардированный bot/shard.py при --bot-workers), так что нагрузка на API
+    не отнимает цикл событий у бота и наоборот;
+  * упавший процесс перезапускается с экспоненциальной паузой (1 → 2 → 4 … 60 с),
+    пауза сбрасывается, если процесс до падения проработал HEALTHY_AFTER секунд;
+  * --uvloop — uvloop в API (uvicorn --loop uvloop) и в боте (USE_UVLOOP=1), если установлен;
+  * GET /status (по умолчанию 127.0.0.1:8001) — CPU и память каждого процесса
+    и его дочерних (воркеры uvicorn / шарды бота), число перезапусков, аптайм.
+
+По SIGTERM/SIGINT всем процессам отправляется SIGTERM; бот и uvicorn дорабатывают
+начатое, через STOP_TIMEOUT оставшиеся завершаются принудительно.
+
+    python launcher.py --api-workers 4 --uvloop
+    curl http://127.0.0.1:8001/status
+
+Для разработки по-прежнему подходит run.py (API и бот в одном процессе).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from typing import List, Optional
+
+from app.logging_setup import setup_logging
+
+try:
+    import psutil
+except ImportError:   # без psutil /status отдаёт только pid, перезапуски и аптайм
+    psutil = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+BACKOFF_START = 1      # первая пауза перед перезапуском, сек
+BACKOFF_MAX = 60       # максимальная пауза, сек
+HEALTHY_AFTER = 60     # проработал дольше — следующий перезапуск снова с BACKOFF_START
+STOP_TIMEOUT = 35      # сколько ждать процессы после SIGTERM (бот ждёт обработчики до 20 с)
+STATS_INTERVAL = 5     # как часто снимать CPU/память, сек
+
+setup_logging(tag="launcher")
+logger = logging.getLogger(__name__)
+
+
+def uvloop_available() -> bool:
+    if sys.platform == "win32":
+        return False
+    try:
+        import uvloop  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class Child:
+    """Процесс под присмотром: запуск, перезапуск с паузой, остановка, статистика."""
+
+    def __init__(self, name: str, argv: List[str], env: Optional[dict] = None):
+        self.name = name
+        self.argv = argv
+        self.env = {**os.environ, "PYTHONPATH": ROOT, **(env or {})}
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.last_exit = None
+        self.stats = {}
+        self._ps = {}   # pid → psutil.Process: cpu_percent считается от прошлого вызова того же объекта
+
+    async def supervise(self, stopping: asyncio.Event) -> None:
+        backoff = BACKOFF_START
+        while not stopping.is_set():
+            self.process = await asyncio.create_subprocess_exec(*self.argv, cwd=ROOT, env=self.env)
+            self.started_at = time.monotonic()
+            if stopping.is_set():   # остановку запросили, пока процесс запускался
+                await self.stop(STOP_TIMEOUT)
+                return
+            logger.info("%s запущен, pid %s", self.name, self.process.pid)
+            self.last_exit = await self.process.wait()
+            if stopping.is_set():
+                return
+            uptime = time.monotonic() - self.started_at
+            if uptime >= HEALTHY_AFTER:
+                backoff = BACKOFF_START
+            self.restarts += 1
+            logger.error(
+                "%s завершился с кодом %s через %.0f с, перезапуск через %s с",
+                self.name, self.last_exit, uptime, backoff,
+            )
+            try:
+                await asyncio.wait_for(stopping.wait(), backoff)
+                return
+            except asyncio.TimeoutError:
+                pass
+            backoff = min(backoff * 2, BACKOFF_MAX)
+
+    async def stop(self, timeout: float) -> None:
+        process = self.process
+        if process is None or process.returncode is not None:
+            return
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("%s не остановился за %s с — завершаем принудительно", self.name, timeout)
+            process.kill()
+            await process.wait()
+
+    def sample(self) -> dict:
+        running = self.process is not None and self.process.returncode is None
+        info = {
+            "pid": self.process.pid if self.process else None,
+            "running": running,
+            "restarts": self.restarts,
+            "last_exit": self.last_exit,
+            "uptime_seconds": round(time.monotonic() - self.started_at) if running else 0,
+        }
+        if psutil is None or not running:
+            self.stats = info
+            return info
+
+        try:
+            root = psutil.Process(self.process.pid)
+            found = [root] + root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            found = []
+        rows = []
+        alive = {}
+        for proc in found:
+            proc = self._ps.get(proc.pid, proc)
+            try:
+                with proc.oneshot():
+                    rows.append({
+                        "pid": proc.pid,
+                        "cpu_percent": proc.cpu_percent(None),
+                        "rss_mb": round(proc.memory_info().rss / 2 ** 20, 1),
+                    })
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            alive[proc.pid] = proc
+        self._ps = alive
+        info["cpu_percent"] = round(sum(row["cpu_percent"] for row in rows), 1)
+        info["rss_mb"] = round(sum(row["rss_mb"] for row in rows), 1)
+        info["processes"] = rows
+        self.stats = info
+        return info
+
+
+async def sample_periodically(children: List[Child]) -> None:
+    """CPU считается как доля за интервал между замерами — поэтому замеры фоновые, а /status отдаёт последний."""
+    while True:
+        for child in children:
+            child.sample()
+        await asyncio.sleep(STATS_INTERVAL)
+
+
+async def serve_status(children: List[Child], host: str, port: int) -> asyncio.AbstractServer:
+    """Минимальный HTTP: GET /status → JSON; без зависимостей, только для локального мониторинга."""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = (await asyncio.wait_for(reader.readline(), 5)).decode("latin-1")
+            parts = request_line.split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/status":
+                body = json.dumps(
+                    {"psutil": psutil is not None, "children": {c.name: c.stats for c in children}},
+                    ensure_ascii=False,
+                ).encode()
+                status = "200 OK"
+            else:
+                body, status = b'{"detail": "Not Found"}', "404 Not Found"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.debug("Ошибка запроса /status: %s", e)
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+def build_children(args) -> List[Child]:
+    use_uvloop = args.uvloop and uvloop_available()
+    if args.uvloop and not use_uvloop:
+        logger.warning("uvloop недоступен — API и бот работают на asyncio.")
+
+    api_argv = [
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--host", args.host, "--port", str(args.port),
+        "--workers", str(args.api_workers),
+        "--timeout-graceful-shutdown", str(STOP_TIMEOUT - 5),
+    ]
+    if use_uvloop:
+        api_argv += ["--loop", "uvloop"]
+
+    bot_env = {"USE_UVLOOP": "1" if use_uvloop else "0"}
+    if args.bot_workers > 1:
+        bot_argv = [sys.executable, os.path.join(ROOT, "bot", "shard.py")]
+        bot_env["BOT_WORKERS"] = str(args.bot_workers)
+    else:
+        bot_argv = [sys.executable, os.path.join(ROOT, "bot", "bot.py")]
+    return [Child("api", api_argv), Child("bot", bot_argv, bot_env)]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0", help="адрес API")
+    parser.add_argument("--port", type=int, default=8000, help="порт API")
+    parser.add_argument("--api-workers", type=int, default=os.cpu_count() or 2, help="воркеров uvicorn")
+    parser.add_argument("--bot-workers", type=int, default=1, help=">1 — шардированный бот (bot/shard.py)")
+    parser.add_argument("--uvloop", action="store_true", help="uvloop в API и боте, если установлен")
+    parser.add_argument("--status-host", default="127.0.0.1")
+    parser.add_argument("--status-port", type=int, default=8001)
+    args = parser.parse_args()
+
+    children = build_children(args)
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    supervisors = [asyncio.create_task(child.supervise(stopping)) for child in children]
+    sampler = asyncio.create_task(sample_periodically(children))
+    server = await serve_status(children, args.status_host, args.status_port)
+    logger.info("Статус процессов: http://%s:%s/status", args.status_host, args.status_port)
+
+    await stopping.wait()
+    logger.info("Остановка: SIGTERM всем процессам")
+    server.close()
+    sampler.cancel()
+    await asyncio.gather(*(child.stop(STOP_TIMEOUT) for child in children))
+    await asyncio.gather(*supervisors, sampler, return_exceptions=True)
+    logger.info("Все процессы остановлены")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
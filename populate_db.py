@@ -1,5 +1,8 @@
 import json
 import os
+from sqlalchemy import text
+
+from app.crud import REBUILD_FACETS_SQL
 from app.database import engine, SessionLocal, Base
 from app.models import Tea
 
@@ -28,6 +31,10 @@ def main():
                 is_active=True
             )
             db.add(tea)
+    db.flush()
+    # Товары добавлены напрямую, мимо crud — пересчитываем счётчики фасетов целиком
+    for statement in filter(None, (part.strip() for part in REBUILD_FACETS_SQL.split(";"))):
+        db.execute(text(statement))
     db.commit()
     db.close()
 
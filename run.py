@@ -4,31 +4,28 @@ import os
 import asyncio
 import logging
 
+from app.logging_setup import setup_logging
+
+setup_logging()
+
 # 1) Импорт FastAPI-приложения (то, что мы в `app/main.py` назвали переменной `app`)
 from app.main import app as fastapi_app
 
 # 2) Импортируем ваш телеграм-бот (примерно так, как вы ранее делали в bot/bot.py):
 #    там, очевидно, есть `bot = Bot(token=...)` и `dp = Dispatcher()`.
 #    Предположим, что в файле bot/bot.py действительно есть эти объекты.
-from bot.bot import bot, dp
+from bot.bot import dp, polling, run_polling
 
 import uvicorn
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 async def start_bot():
-    """Запускаем Telegram-бота (aiogram) через long polling."""
-    try:
-        # Если ранее был какой-то вебхук, удаляем
-        await bot.delete_webhook(drop_pending_updates=True)
-    except Exception as e:
-        logger.exception("Не смог удалить предыдущий webhook: %s", e)
-
-    # Начинаем приём сообщений
-    await dp.start_polling(bot)
+    """Запускаем Telegram-бота (aiogram) через long polling: без сброса накопившихся апдейтов,
+    с доработкой начатых обработчиков при остановке."""
+    await run_polling()
 
 
 async def main():
@@ -42,6 +39,8 @@ async def main():
         host="0.0.0.0",
         port=8000,
         log_level="info",
+        # Без своих обработчиков uvicorn: его логи уходят в корневой логгер — в ту же очередь и JSON
+        log_config=None,
         reload=reload_enabled,
     )
     server = uvicorn.Server(config)
@@ -52,6 +51,16 @@ async def main():
     # 2) Ждём, пока хотя бы один из них (API или Bot) не завершится
     await asyncio.wait([task_api, task_bot], return_when=asyncio.FIRST_COMPLETED)
 
+    # 3) Останавливаем второй корректно, а не бросаем задачу: бот дорабатывает начатое
+    if not task_bot.done():
+        if polling.is_set():
+            await dp.stop_polling()
+        else:
+            task_bot.cancel()   # ещё прогревается — stop_polling() тут бросает RuntimeError
+    if not task_api.done():
+        server.should_exit = True
+    await asyncio.gather(task_api, task_bot, return_exceptions=True)
+
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,146 @@
+"""
+Стресс-проверка порядка обработки апдейтов: тысячи одновременных нажатий
+«➕/➖» в корзине от многих пользователей.
+
+Апдейты идут через настоящий диспетчер бота (dp.feed_update) параллельно,
+вместо сети — сессия со случайной задержкой ответа (так ответы Telegram
+приходят вперемешку), вместо БД — сид каталога, как в count_api_calls.py.
+Проверяется:
+  * у каждого пользователя количество в корзине равно результату его нажатий
+    по порядку, а последний показанный экран корзины — итоговому количеству;
+  * разные пользователи не ждут друг друга (время близко к одному пользователю);
+  * при шквале одинаковых нажатий очередь пользователя ограничена: лишние дубли
+    выбрасываются (с ответом на callback), учтённые нажатия считаются точно.
+
+    python scripts/cart_race.py --users 200 --taps 20
+    python scripts/cart_race.py --unordered     # то же без middleware — для сравнения
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from count_api_calls import CountingSession, load_seed, patch_storage  # noqa: E402  (настраивает sys.path и env)
+
+from aiogram import types  # noqa: E402
+
+import bot as bot_module  # noqa: E402
+
+
+class JitterSession(CountingSession):
+    """Сессия без сети со случайной задержкой; запоминает последний экран каждого чата."""
+
+    def __init__(self, jitter: float):
+        super().__init__()
+        self.jitter = jitter
+        self.last_text = {}
+
+    async def make_request(self, bot, method, timeout=None):
+        await asyncio.sleep(random.uniform(0, self.jitter))
+        if type(method).__name__ == "EditMessageText":
+            self.last_text[method.chat_id] = method.text
+        return await super().make_request(bot, method, timeout)
+
+
+class Feeder:
+    def __init__(self):
+        self.update_id = 0
+
+    def tap(self, user_id: int, data: str):
+        self.update_id += 1
+        user = types.User(id=user_id, is_bot=False, first_name=f"u{user_id}")
+        message = types.Message(
+            message_id=1, date=datetime.now(), chat=types.Chat(id=user_id, type="private"), text="cart",
+        )
+        update = types.Update(update_id=self.update_id, callback_query=types.CallbackQuery(
+            id=str(self.update_id), from_user=user, chat_instance="ci", data=data, message=message,
+        ))
+        return bot_module.dp.feed_update(bot_module.bot, update)
+
+
+def user_ops(taps: int, rng: random.Random) -> tuple:
+    """Случайная последовательность ➕/➖, при выполнении по порядку количество не падает ниже 1."""
+    ops, qty = [], 1
+    for _ in range(taps):
+        op = "minus" if qty > 1 and rng.random() < 0.4 else "plus"
+        qty += -1 if op == "minus" else 1
+        ops.append(op)
+    return ops, qty
+
+
+def cart_qty(user_id: int, tea_id: int):
+    for item in bot_module.CARTS.get(user_id, []):
+        if item["tea_id"] == tea_id:
+            return item["quantity"]
+    return 0
+
+
+async def run_users(feeder, users: list, tea_id: int, taps: int, seed: int):
+    rng = random.Random(seed)
+    expected = {}
+    coros = []
+    for user_id in users:
+        ops, expected[user_id] = user_ops(taps, rng)
+        coros.append(feeder.tap(user_id, f"add:{tea_id}"))
+        coros.extend(feeder.tap(user_id, f"cart:{op}:{tea_id}") for op in ops)
+    started = time.perf_counter()
+    await asyncio.gather(*coros)
+    return expected, time.perf_counter() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="сколько пользователей жмут одновременно")
+    parser.add_argument("--taps", type=int, default=20, help="нажатий ➕/➖ на пользователя")
+    parser.add_argument("--burst", type=int, default=500, help="одинаковых нажатий одного пользователя в шквале")
+    parser.add_argument("--jitter", type=float, default=0.005, help="макс. задержка ответа Telegram, сек")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--unordered", action="store_true", help="снять middleware порядка (для сравнения)")
+    args = parser.parse_args()
+
+    cards = load_seed()
+    patch_storage(cards)
+    session = JitterSession(args.jitter)
+    bot_module.bot.session = session
+    ordering = bot_module.update_ordering
+    if args.unordered:
+        bot_module.dp.update.outer_middleware.unregister(ordering)
+    tea_id = next(iter(cards))
+    feeder = Feeder()
+    failed = False
+
+    # Базовая линия: один пользователь, те же нажатия
+    _, single_seconds = await run_users(feeder, [1], tea_id, args.taps, args.seed)
+
+    users = list(range(1000, 1000 + args.users))
+    expected, seconds = await run_users(feeder, users, tea_id, args.taps, args.seed)
+    wrong_qty = [u for u in users if cart_qty(u, tea_id) != expected[u]]
+    stale_screen = [u for u in users if f"x{expected[u]} " not in session.last_text.get(u, "")]
+    ok = not wrong_qty and not stale_screen
+    failed |= not ok
+    print(f"[{'OK' if ok else 'FAIL'}] {args.users} пользователей × {args.taps + 1} нажатий "
+          f"({args.users * (args.taps + 1)} апдейтов): неверное количество у {len(wrong_qty)}, "
+          f"устаревший экран у {len(stale_screen)}; {seconds:.2f} с (один пользователь — {single_seconds:.2f} с)")
+
+    # Шквал одинаковых ➕ одного пользователя
+    burst_user = 999
+    await feeder.tap(burst_user, f"add:{tea_id}")
+    dropped_before = ordering.dropped
+    await asyncio.gather(*(feeder.tap(burst_user, f"cart:plus:{tea_id}") for _ in range(args.burst)))
+    dropped = ordering.dropped - dropped_before if not args.unordered else 0
+    qty = cart_qty(burst_user, tea_id)
+    ok = qty == 1 + args.burst - dropped and (args.unordered or args.burst <= ordering.max_pending or dropped > 0)
+    failed |= not ok
+    print(f"[{'OK' if ok else 'FAIL'}] шквал {args.burst} нажатий: учтено {args.burst - dropped}, "
+          f"выброшено дублей {dropped}, в корзине {qty}; "
+          f"макс. очередь {ordering.max_depth}, пользователей в очереди сейчас {len(ordering)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""
+Холодный старт бота: импорт, прогрев (warm_up) и первый апдейт — время до готовности.
+
+Как и count_api_calls.py, работает без Telegram и Postgres: вместо сети сессия-счётчик,
+вместо БД — сид каталога. Поэтому этапы прогрева здесь показывают стоимость
+рендера и сборки индекса, а не сетевые задержки; импорт меряется честно —
+скрипт запускается в свежем интерпретаторе.
+
+    python scripts/cold_start.py
+    python scripts/cold_start.py --budget 3          # код возврата 1, если готовность дольше 3 с
+    python -X importtime scripts/cold_start.py 2> imports.log   # кто именно тормозит импорт
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+_started = time.perf_counter()
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import count_api_calls  # noqa: E402  (импортирует bot/bot.py со всеми зависимостями)
+
+IMPORT_SECONDS = time.perf_counter() - _started
+bot_module = count_api_calls.bot_module
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, help="допустимое время до готовности, сек")
+    args = parser.parse_args()
+
+    deferred = "numpy" not in sys.modules
+    count_api_calls.patch_storage(count_api_calls.load_seed())
+    session = count_api_calls.CountingSession()
+    bot_module.bot.session = session
+    client = count_api_calls.Client(session)
+
+    timings = await bot_module.warm_up()
+    ready = time.perf_counter() - _started
+
+    started = time.perf_counter()
+    await client.text("Каталог")
+    first_update = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await bot_module.load_recommender()
+    recommender = time.perf_counter() - started
+
+    print(f"{'импорт (скрипт + bot)':<28} {IMPORT_SECONDS:.3f} с")
+    for name, seconds in timings.items():
+        if name != "ready":
+            print(f"{'  ' + name:<28} {seconds:.3f} с")
+    print(f"{'готов к приёму апдейтов':<28} {ready:.3f} с")
+    print(f"{'первый апдейт («Каталог»)':<28} {first_update * 1000:.1f} мс")
+    print(f"{'рекомендации (в фоне)':<28} {recommender:.3f} с")
+    print(f"numpy отложен до готовности: {'да' if deferred else 'нет'}")
+    print(f"запросов к Telegram на первом апдейте: {sum(session.calls.values())}")
+
+    if args.budget is not None and ready > args.budget:
+        print(f"ПРЕВЫШЕН бюджет: {ready:.3f} с > {args.budget:g} с")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
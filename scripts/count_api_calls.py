@@ -0,0 +1,223 @@
+"""
+Считает вызовы Telegram Bot API за типичную сессию просмотра каталога.
+
+Апдейты прогоняются через настоящий диспетчер бота (dp.feed_update), но вместо
+сети стоит сессия-счётчик, а вместо БД — сид каталога из migrations/database.json.
+Ни Telegram, ни Postgres не нужны:
+
+    python scripts/count_api_calls.py
+"""
+import asyncio
+import json
+import os
+import sys
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path[:0] = [os.path.join(ROOT, "bot"), ROOT]
+os.environ.setdefault("TOKEN", "123456:TEST-token-for-counting-api-calls")
+os.environ.setdefault("ADMIN", "1")
+os.environ.setdefault("ADMIN_USER", "admin")
+
+from aiogram import types  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+
+import bot as bot_module  # noqa: E402  (bot/bot.py)
+import catalog as catalog_module  # noqa: E402
+import promos as promos_module  # noqa: E402
+import user_lists as user_lists_module  # noqa: E402
+from app.read_models import TeaCard, TeaCartItem, TeaListItem  # noqa: E402
+
+USER_ID = 42
+
+
+class CountingSession(BaseSession):
+    """Сессия без сети: считает методы и возвращает правдоподобные ответы."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = Counter()
+        self._next_message_id = 100
+
+    def _message(self, method, message_id=None, photo=False):
+        if message_id is None:
+            self._next_message_id += 1
+            message_id = self._next_message_id
+        return types.Message(
+            message_id=message_id,
+            date=datetime.now(),
+            chat=types.Chat(id=USER_ID, type="private"),
+            text=None if photo else getattr(method, "text", None),
+            photo=[types.PhotoSize(file_id="photo", file_unique_id="u", width=1, height=1)] if photo else None,
+            reply_markup=getattr(method, "reply_markup", None)
+            if isinstance(getattr(method, "reply_markup", None), types.InlineKeyboardMarkup) else None,
+        )
+
+    async def make_request(self, bot, method, timeout=None):
+        name = type(method).__name__
+        self.calls[name] += 1
+        if name == "SendMessage":
+            return self._message(method)
+        if name == "SendPhoto":
+            return self._message(method, photo=True)
+        if name == "EditMessageText":
+            return self._message(method, message_id=method.message_id)
+        if name == "EditMessageMedia":
+            return self._message(method, message_id=method.message_id, photo=True)
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def load_seed():
+    with open(os.path.join(ROOT, "migrations", "database.json"), encoding="utf-8") as f:
+        data = json.load(f)["categories"]
+    cards = {}
+    for category, items in data.items():
+        for obj in items.values():
+            tea_id = len(cards) + 1
+            cards[tea_id] = TeaCard(
+                tea_id, obj["name"], category, None, obj.get("desc"),
+                float(obj.get("price", 0)), obj.get("weight"), obj.get("photo"),
+            )
+    return cards
+
+
+def patch_storage(cards):
+    """Подменяет запросы к БД выборками из сида — только для этого замера."""
+    @asynccontextmanager
+    async def fake_session():
+        yield None
+
+    async def get_facets(db):
+        return {
+            "category": dict(Counter(c.category for c in cards.values())),
+            "origin": dict(Counter(c.origin for c in cards.values() if c.origin)),
+        }
+
+    async def get_tea_list_items(db, category, sort="id"):
+        return [TeaListItem(c.id, c.name) for c in cards.values() if c.category == category]
+
+    async def get_tea_card(db, tea_id):
+        return cards.get(tea_id)
+
+    async def get_all_tea_cards(db):
+        return list(cards.values())
+
+    async def get_cart_items(db, ids):
+        return [TeaCartItem(c.id, c.name, c.price, c.weight, c.category) for i, c in cards.items() if i in ids]
+
+    async def get_catalog_version(db):
+        return (len(cards), None)
+
+    async def get_user_lists(db, user_id):
+        return None
+
+    async def save_user_lists(db, rows):
+        pass
+
+    async def get_promocodes_version(db):
+        return (0, None)
+
+    async def get_active_promo_rules(db):
+        return []
+
+    async def warm_pool(connections=0):
+        return 0
+
+    async def save_funnel_events(db, events):
+        pass
+
+    bot_module.db_session = fake_session
+    bot_module.get_facets = get_facets
+    bot_module.get_tea_list_items = get_tea_list_items
+    bot_module.get_tea_card = get_tea_card
+    bot_module.get_cart_items = get_cart_items
+    bot_module.get_all_tea_cards = get_all_tea_cards
+    catalog_module.AsyncSessionLocal = fake_session
+    catalog_module.get_catalog_version = get_catalog_version
+    user_lists_module.AsyncSessionLocal = fake_session
+    user_lists_module.get_user_lists = get_user_lists
+    user_lists_module.save_user_lists = save_user_lists
+    promos_module.AsyncSessionLocal = fake_session
+    promos_module.get_promocodes_version = get_promocodes_version
+    promos_module.get_active_promo_rules = get_active_promo_rules
+    bot_module.warm_pool = warm_pool
+    bot_module.save_funnel_events = save_funnel_events
+
+
+class Client:
+    """Пользователь, который пишет текстом и нажимает кнопки последнего экрана."""
+
+    def __init__(self, session):
+        self.session = session
+        self.update_id = 0
+        self.user = types.User(id=USER_ID, is_bot=False, first_name="Load")
+        self.chat = types.Chat(id=USER_ID, type="private")
+
+    async def _feed(self, **payload):
+        self.update_id += 1
+        update = types.Update(update_id=self.update_id, **payload)
+        await bot_module.dp.feed_update(bot_module.bot, update)
+
+    async def text(self, text):
+        await self._feed(message=types.Message(
+            message_id=self.update_id + 1, date=datetime.now(), chat=self.chat, from_user=self.user, text=text,
+        ))
+
+    async def tap(self, data, message_id=1, photo=False):
+        message = self.session._message(None, message_id=message_id, photo=photo)
+        await self._feed(callback_query=types.CallbackQuery(
+            id=str(self.update_id), from_user=self.user, chat_instance="ci", data=data, message=message,
+        ))
+
+
+async def main():
+    cards = load_seed()
+    patch_storage(cards)
+    session = CountingSession()
+    bot_module.bot.session = session
+    client = Client(session)
+
+    category = cards[1].category
+    first, second = [c.id for c in cards.values() if c.category == category][:2]
+
+    def on_screen(data):
+        """Нажатие кнопки на текущем экране чата (список, карточка, корзина)."""
+        screen = bot_module.nav.current(USER_ID)
+        return client.tap(data, message_id=screen.message_id, photo=screen.kind == "card")
+
+    steps = [
+        ("/start", lambda: client.text("/start")),
+        ("Каталог", lambda: client.text("Каталог")),
+        ("категория", lambda: on_screen(f"cat:{category}")),
+        ("карточка A", lambda: client.tap(f"item:{first}")),
+        ("карточка B", lambda: client.tap(f"item:{second}")),
+        ("в корзину", lambda: on_screen(f"add:{second}")),
+        ("закрыть карточку", lambda: on_screen("back_to_details")),
+        ("назад к каталогу", lambda: client.tap("back_to_catalog")),
+        ("категория", lambda: on_screen(f"cat:{category}")),
+        ("в меню", lambda: on_screen("back_to_main")),
+        ("корзина", lambda: on_screen("open_cart")),
+        ("в меню", lambda: on_screen("back_to_main")),
+    ]
+    total = 0
+    for title, step in steps:
+        before = sum(session.calls.values())
+        await step()
+        spent = sum(session.calls.values()) - before
+        total += spent
+        print(f"{title:<20} {spent}")
+    print(f"{'итого вызовов API':<20} {total}")
+    print("по методам:", dict(session.calls))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
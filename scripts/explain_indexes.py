@@ -0,0 +1,123 @@
+"""
+Проверка, что фасетные фильтры и сортировки каталога действительно идут по индексам.
+
+В одной транзакции скрипт добавляет синтетические товары (чтобы у планировщика
+была реалистичная статистика, а не 40 строк, которые дешевле прочитать целиком),
+делает ANALYZE, снимает EXPLAIN (FORMAT JSON) с тех же запросов, что строят
+crud.teas_query / crud.get_tea_list_items, и откатывает транзакцию — база не меняется.
+
+    alembic upgrade head
+    python scripts/explain_indexes.py            # код выхода 1, если какой-то план без индекса
+    python scripts/explain_indexes.py --rows 50000 --verbose
+"""
+import argparse
+import json
+import os
+import sys
+from decimal import Decimal
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import select, text  # noqa: E402
+
+from app.crud import TEA_SORTS, _ACTIVE, teas_query  # noqa: E402
+from app.database import engine  # noqa: E402
+from app.models import Tea  # noqa: E402
+
+SEED_SQL = """
+INSERT INTO teas (name, category, origin, description, price, weight, photo_url, is_active)
+SELECT
+    'explain-check-' || g,
+    'explain-cat-' || (g % 10),
+    'explain-origin-' || (g % 50),
+    NULL,
+    100 + (g % 500),
+    CASE WHEN g % 7 = 0 THEN NULL ELSE 25 * (1 + g % 20) END,
+    NULL,
+    g % 10 <> 0
+FROM generate_series(1, :rows) AS g
+"""
+
+# (описание, запрос, индекс, который должен появиться в плане)
+CASES = [
+    (
+        "категория, сортировка по цене за грамм (список в боте)",
+        select(Tea.id, Tea.name, Tea.price_per_gram)
+        .where(Tea.category == "explain-cat-3", _ACTIVE)
+        .order_by(*TEA_SORTS["price_per_gram"]).limit(50),
+        "ix_teas_active_category_ppg",
+    ),
+    (
+        "категория + диапазон цены",
+        teas_query("price", category="explain-cat-3", min_price=Decimal(150), max_price=Decimal(160)).limit(100),
+        "ix_teas_active_category_price",
+    ),
+    (
+        "диапазон цены за грамм",
+        teas_query("price_per_gram", min_price_per_gram=Decimal("0.5"), max_price_per_gram=Decimal("0.6")).limit(100),
+        "ix_teas_active_ppg",
+    ),
+    (
+        "происхождение, сортировка по цене",
+        teas_query("price", origin="explain-origin-7").limit(100),
+        "ix_teas_active_origin_price",
+    ),
+    (
+        "диапазон веса",
+        teas_query("weight", min_weight=Decimal(25), max_weight=Decimal(25)).limit(100),
+        "ix_teas_active_weight",
+    ),
+    (
+        "самые дорогие (сортировка по убыванию цены)",
+        teas_query("-price").limit(20),
+        "ix_teas_active_price",
+    ),
+]
+
+
+def index_names(plan: dict) -> set:
+    names = set()
+    if "Index Name" in plan:
+        names.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        names |= index_names(child)
+    return names
+
+
+def explain(conn, query) -> dict:
+    sql = str(query.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+    raw = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql).scalar()
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+    return raw[0]["Plan"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000, help="сколько синтетических товаров добавить")
+    parser.add_argument("--verbose", action="store_true", help="печатать планы целиком")
+    args = parser.parse_args()
+
+    failed = 0
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            conn.execute(text(SEED_SQL), {"rows": args.rows})
+            conn.exec_driver_sql("ANALYZE teas")
+            for title, query, expected in CASES:
+                plan = explain(conn, query)
+                used = index_names(plan)
+                ok = expected in used
+                failed += not ok
+                print(f"[{'OK' if ok else 'FAIL'}] {title}: ожидали {expected}, в плане {sorted(used) or 'нет индексов'}")
+                if args.verbose or not ok:
+                    print(json.dumps(plan, ensure_ascii=False, indent=2))
+        finally:
+            trans.rollback()
+
+    print(f"Проверок: {len(CASES)}, провалено: {failed}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Нагрузочный тест API: N параллельных клиентов в течение заданного времени
+дёргают GET-эндпоинты каталога, в конце печатаются requests/sec и перцентили.
+
+Пример (500 клиентов, 30 секунд):
+    python scripts/loadtest_api.py --url http://localhost:8000 --clients 500 --duration 30
+
+Для сравнения «до/после» запустите скрипт против старой и новой версии API
+с одинаковыми параметрами; после прогона полезно посмотреть /stats/pool.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import aiohttp
+
+
+PATHS = [
+    "/api/teas/?limit=50",
+    "/api/teas/?category=Улуны",
+    "/api/teas/{id}",
+]
+
+
+async def client(session, base_url, deadline, tea_ids, latencies, errors):
+    while time.perf_counter() < deadline:
+        path = random.choice(PATHS).format(id=random.choice(tea_ids))
+        started = time.perf_counter()
+        try:
+            async with session.get(base_url + path) as resp:
+                await resp.read()
+                if resp.status >= 500:
+                    errors.append(resp.status)
+                    continue
+        except aiohttp.ClientError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=30.0)
+    args = parser.parse_args()
+
+    connector = aiohttp.TCPConnector(limit=args.clients)
+    timeout = aiohttp.ClientTimeout(total=30)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async with session.get(args.url + "/api/teas/?limit=1000") as resp:
+            tea_ids = [t["id"] for t in await resp.json()] or [1]
+
+        latencies, errors = [], []
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            client(session, args.url, deadline, tea_ids, latencies, errors)
+            for _ in range(args.clients)
+        ))
+        elapsed = time.perf_counter() - started
+
+        async with session.get(args.url + "/stats/pool") as resp:
+            pool = await resp.json() if resp.status == 200 else {}
+
+    latencies.sort()
+    print(f"clients:      {args.clients}")
+    print(f"requests:     {len(latencies)} ok, {len(errors)} errors")
+    print(f"requests/sec: {len(latencies) / elapsed:.1f}")
+    for p in (50, 95, 99):
+        print(f"p{p}:          {percentile(latencies, p) * 1000:.1f} ms")
+    if pool:
+        print(f"pool:         {pool}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
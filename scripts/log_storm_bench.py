@@ -0,0 +1,134 @@
+"""
+Лавина ошибок в логах: задержка обработчиков при синхронном логировании
+(logging.basicConfig, как было) и через app/logging_setup.py (очередь + поток-слушатель
++ ограничение частоты).
+
+Обработчики — корутины, которые «ходят в БД», получают исключение и пишут
+logger.exception с traceback, как обработчики бота при падении Postgres. Вывод —
+нарочно медленный поток (--write-ms на запись: забитый pipe, драйвер логов Docker).
+Каждый режим запускается в свежем интерпретаторе, чтобы настройки логирования
+не смешивались.
+
+    python scripts/log_storm_bench.py
+    python scripts/log_storm_bench.py --handlers 5000 --concurrency 200 --write-ms 2
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = ("baseline", "sync", "queue")
+logger = logging.getLogger("bot.handlers")
+
+
+class SlowStream:
+    """Поток вывода, каждая запись в который занимает write_ms."""
+
+    def __init__(self, write_ms: float):
+        self.delay = write_ms / 1000
+        self.writes = 0
+        self.bytes = 0
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay)
+        self.writes += 1
+        self.bytes += len(text)
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def query_db(order_id: int) -> None:
+    raise ConnectionRefusedError(f"connection to server failed (order {order_id})")
+
+
+async def handler(order_id: int, fail: bool, latencies: list) -> None:
+    started = time.perf_counter()
+    await asyncio.sleep(0)     # «запрос» отдаёт управление циклу
+    try:
+        if fail:
+            query_db(order_id)
+    except ConnectionError:
+        logger.exception("Ошибка БД при обработке заказа %s", order_id)
+    latencies.append(time.perf_counter() - started)
+
+
+async def storm(handlers: int, concurrency: int, fail: bool) -> tuple:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(order_id: int):
+        async with semaphore:
+            await handler(order_id, fail, latencies)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(limited(i) for i in range(handlers)))
+    return latencies, time.perf_counter() - started
+
+
+def percentile(values: list, share: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)] if values else 0.0
+
+
+def run_mode(mode: str, args) -> dict:
+    stream = SlowStream(args.write_ms)
+    stats = {}
+    if mode == "sync":
+        logging.basicConfig(level=logging.INFO, stream=stream)
+    elif mode == "queue":
+        from app import logging_setup
+        logging_setup.setup_logging(stream=stream)
+    latencies, total = asyncio.run(storm(args.handlers, args.concurrency, fail=mode != "baseline"))
+    if mode == "queue":
+        stats = logging_setup.logging_stats()
+        drain_started = time.perf_counter()
+        logging_setup.stop_logging()
+        stats["drain_seconds"] = round(time.perf_counter() - drain_started, 3)
+    return {
+        "mode": mode,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "total_s": total,
+        "written": stream.writes,
+        **stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--handlers", type=int, default=2000, help="обработчиков за прогон")
+    parser.add_argument("--concurrency", type=int, default=100, help="одновременно работающих")
+    parser.add_argument("--write-ms", type=float, default=1.0, help="время одной записи в вывод, мс")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)   # прогон одного режима в подпроцессе
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args)))
+        return
+
+    print(f"обработчиков {args.handlers}, одновременно {args.concurrency}, запись в вывод {args.write_ms:g} мс")
+    print(f"{'режим':<10} {'p50, мс':>9} {'p99, мс':>9} {'макс, мс':>9} {'всего, с':>9} {'записей':>8}  прочее")
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--handlers", str(args.handlers),
+             "--concurrency", str(args.concurrency), "--write-ms", str(args.write_ms)],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        extra = ", ".join(f"{key} {result[key]}" for key in ("suppressed", "dropped_queue_full", "drain_seconds")
+                          if key in result)
+        print(f"{result['mode']:<10} {result['p50_ms']:9.2f} {result['p99_ms']:9.2f} {result['max_ms']:9.2f} "
+              f"{result['total_s']:9.2f} {result['written']:8}  {extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Пропускная способность шардированного бота (bot/shard.py): апдейтов в секунду
+при 1, 2, 4 и 8 процессах-обработчиках.
+
+Апдейты синтетические — типичный просмотр каталога и работа с корзиной от многих
+пользователей — и проходят через ShardPool.route, как из приёмника. В воркерах
+вместо сети сессия-счётчик, вместо БД — сид каталога (как в count_api_calls.py),
+так что меряется именно обработка: хендлеры, рендер экранов, FSM.
+Время — от первой пачки до момента, когда все воркеры всё обработали.
+
+    python scripts/shard_bench.py --updates 20000 --users 2000
+    python scripts/shard_bench.py --workers 1 2 4 8 16
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import count_api_calls  # noqa: E402  (настраивает sys.path и env для bot/)
+
+from shard import ShardPool  # noqa: E402  (bot/shard.py)
+
+
+def fake_environment():
+    """Выполняется в каждом воркере: сид вместо БД, сессия-счётчик вместо Telegram."""
+    import bot as bot_module
+    cards = count_api_calls.load_seed()
+    count_api_calls.patch_storage(cards)
+    bot_module.bot.session = count_api_calls.CountingSession()
+
+
+def synthetic_updates(count: int, users: int, seed: int) -> list:
+    """JSON апдейтов Bot API: тексты меню и нажатия кнопок каталога и корзины."""
+    cards = count_api_calls.load_seed()
+    categories = sorted({card.category for card in cards.values()})
+    tea_ids = list(cards)
+    rng = random.Random(seed)
+    now = int(datetime.now(timezone.utc).timestamp())
+    updates = []
+    for update_id in range(1, count + 1):
+        user_id = 10_000 + rng.randrange(users)
+        user = {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"}
+        chat = {"id": user_id, "type": "private"}
+        kind = rng.random()
+        if kind < 0.2:
+            text = rng.choice(["Каталог", "Корзина", "Избранное", "Недавно смотрели"])
+            updates.append({"update_id": update_id, "message": {
+                "message_id": update_id, "date": now, "chat": chat, "from": user, "text": text,
+            }})
+            continue
+        tea_id = rng.choice(tea_ids)
+        data = rng.choice([
+            f"cat:{rng.choice(categories)}", f"item:{tea_id}", f"add:{tea_id}",
+            f"cart:plus:{tea_id}", "open_cart", "back_to_main",
+        ])
+        updates.append({"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": user, "chat_instance": "ci", "data": data,
+            "message": {"message_id": 1, "date": now, "chat": chat, "text": "screen"},
+        }})
+    return updates
+
+
+async def measure(workers: int, updates: list, batch: int) -> tuple:
+    pool = ShardPool(workers, setup=fake_environment, background=False)
+    await pool.start()
+    started = time.perf_counter()
+    for i in range(0, len(updates), batch):
+        await pool.route(updates[i:i + batch])
+    await pool.stop()
+    seconds = time.perf_counter() - started
+    return seconds, pool.processed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=20000, help="сколько апдейтов прогнать")
+    parser.add_argument("--users", type=int, default=2000, help="сколько разных пользователей")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--batch", type=int, default=100, help="апдейтов в пачке (как limit у getUpdates)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    updates = synthetic_updates(args.updates, args.users, args.seed)
+    print(f"ядер: {os.cpu_count()}, апдейтов: {len(updates)}, пользователей: {args.users}")
+    baseline = None
+    for workers in args.workers:
+        seconds, processed = await measure(workers, updates, args.batch)
+        rate = len(updates) / seconds
+        baseline = baseline or rate
+        spread = f"{min(processed.values())}…{max(processed.values())}" if processed else "—"
+        print(f"воркеров {workers:>2}: {rate:8.0f} апдейтов/с  (×{rate / baseline:.2f}), "
+              f"{seconds:.2f} с, на воркер {spread}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
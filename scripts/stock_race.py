@@ -0,0 +1,118 @@
+"""
+Проверка резервирования под конкуренцией: сотни одновременных оформлений
+одного лимитированного товара не должны продать больше остатка.
+
+Скрипт создаёт временные товары, запускает параллельные crud.reserve_stock
+через отдельный пул соединений и проверяет:
+  * успешных резервов ровно столько, сколько было на складе, остаток = 0, не < 0;
+  * заказы на разные товары не ждут друг друга (нет глобальной блокировки):
+    столько же резервов, разнесённых по многим товарам, проходят не медленнее.
+Временные товары и их резервы в конце удаляются.
+
+    python scripts/stock_race.py --orders 500 --stock 50 --connections 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import delete, insert, select  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from app.crud import reserve_stock  # noqa: E402
+from app.database import ASYNC_DATABASE_URL  # noqa: E402
+from app.models import StockReservation, Tea  # noqa: E402
+
+TEST_CATEGORY = "__stock_race__"
+
+
+async def create_items(Session, count: int, stock: int) -> list:
+    async with Session() as db:
+        result = await db.execute(
+            insert(Tea).returning(Tea.id),
+            [
+                {
+                    "name": f"stock-race-{uuid.uuid4().hex[:8]}-{i}",
+                    "category": TEST_CATEGORY,
+                    "price": 100,
+                    "stock": stock,
+                    "is_active": True,
+                }
+                for i in range(count)
+            ],
+        )
+        ids = list(result.scalars())
+        await db.commit()
+    return ids
+
+
+async def run_orders(Session, tea_ids: list, orders: int):
+    """orders параллельных резервов по 1 шт., товары по кругу. Возвращает (успехи, секунды)."""
+    async def one(n: int) -> bool:
+        async with Session() as db:
+            _, shortages = await reserve_stock(
+                db, f"R{n:07d}", {tea_ids[n % len(tea_ids)]: 1}, ttl_seconds=600
+            )
+            return not shortages
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(n) for n in range(orders)))
+    return sum(results), time.perf_counter() - started
+
+
+async def cleanup(Session, tea_ids: list) -> None:
+    async with Session() as db:
+        await db.execute(delete(StockReservation).where(StockReservation.tea_id.in_(tea_ids)))
+        await db.execute(delete(Tea).where(Tea.id.in_(tea_ids)))
+        await db.commit()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=500, help="сколько одновременных оформлений")
+    parser.add_argument("--stock", type=int, default=50, help="остаток горячего товара")
+    parser.add_argument("--connections", type=int, default=50, help="размер пула соединений")
+    parser.add_argument("--spread", type=int, default=50, help="на сколько товаров разнести второй замер")
+    args = parser.parse_args()
+
+    engine = create_async_engine(
+        ASYNC_DATABASE_URL, pool_size=args.connections, max_overflow=0, pool_timeout=60
+    )
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    tea_ids = []
+    failed = False
+    try:
+        hot = await create_items(Session, 1, args.stock)
+        spread = await create_items(Session, args.spread, args.orders)
+        tea_ids = hot + spread
+
+        sold, hot_seconds = await run_orders(Session, hot, args.orders)
+        async with Session() as db:
+            left = (await db.execute(select(Tea.stock).where(Tea.id == hot[0]))).scalar_one()
+            held = (await db.execute(
+                select(StockReservation.id).where(StockReservation.tea_id == hot[0])
+            )).all()
+        ok = sold == args.stock and left == 0 and len(held) == args.stock
+        failed |= not ok
+        print(f"[{'OK' if ok else 'FAIL'}] один товар: {args.orders} оформлений на остаток {args.stock} — "
+              f"зарезервировано {sold}, резервов {len(held)}, остаток {left}, {hot_seconds:.2f} с")
+
+        done, spread_seconds = await run_orders(Session, spread, args.orders)
+        ok = done == args.orders
+        failed |= not ok
+        print(f"[{'OK' if ok else 'FAIL'}] {args.spread} товаров: {args.orders} оформлений — "
+              f"зарезервировано {done}, {spread_seconds:.2f} с "
+              f"({args.orders / spread_seconds:.0f} резервов/с против {args.orders / hot_seconds:.0f} на одном товаре)")
+    finally:
+        if tea_ids:
+            await cleanup(Session, tea_ids)
+        await engine.dispose()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""
+Разбор трасс бота (JSONL, см. app/tracing.py): самые медленные апдейты и из чего
+сложилось их время — обработчик, SQL, Telegram и «прочее» (ожидание очереди
+пользователя, middleware, фильтры, наш код вне запросов).
+
+    TRACE_SAMPLE_RATE=0.05 TRACE_SLOW_MS=500 python bot/bot.py    # сбор
+    python scripts/trace_report.py traces.jsonl --top 10
+    python scripts/trace_report.py traces.jsonl --user 123456789 --spans
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+
+KINDS = ("sql", "telegram")
+
+
+def load(path: str) -> list:
+    traces = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                traces.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"строка {number}: не JSON, пропущена", file=sys.stderr)
+    return traces
+
+
+def breakdown(trace: dict) -> dict:
+    """
+    Время по видам спанов, мс. SQL и Telegram идут внутри обработчика, поэтому
+    «код» — время обработчика за их вычетом, а «вне обработчика» — остаток трассы.
+    """
+    totals = defaultdict(float)
+    for span in trace["spans"]:
+        totals[span["kind"]] += span["duration_ms"]
+    handler = totals.pop("handler", 0.0)
+    io = sum(totals[kind] for kind in KINDS)
+    return {
+        "sql": totals["sql"],
+        "telegram": totals["telegram"],
+        "код": max(handler - io, 0.0),
+        "вне обработчика": max(trace["duration_ms"] - max(handler, io), 0.0),
+    }
+
+
+def percentile(values: list, share: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", nargs="?", default="traces.jsonl")
+    parser.add_argument("--top", type=int, default=10, help="сколько самых медленных трасс показать")
+    parser.add_argument("--user", type=int, help="только апдейты этого пользователя")
+    parser.add_argument("--spans", action="store_true", help="показать все спаны каждой трассы")
+    args = parser.parse_args()
+
+    traces = load(args.path)
+    if args.user is not None:
+        traces = [trace for trace in traces if trace.get("user_id") == args.user]
+    if not traces:
+        print("трасс нет")
+        return
+
+    durations = [trace["duration_ms"] for trace in traces]
+    print(f"трасс: {len(traces)}, p50 {percentile(durations, 0.5):.1f} мс, "
+          f"p95 {percentile(durations, 0.95):.1f} мс, макс {max(durations):.1f} мс")
+    totals = defaultdict(float)
+    for trace in traces:
+        for kind, ms in breakdown(trace).items():
+            totals[kind] += ms
+    overall = sum(totals.values()) or 1.0
+    print("доля времени: " + ", ".join(f"{kind} {ms / overall:.0%}" for kind, ms in totals.items()))
+
+    for trace in sorted(traces, key=lambda t: -t["duration_ms"])[:args.top]:
+        handlers = [span["name"] for span in trace["spans"] if span["kind"] == "handler"]
+        parts = ", ".join(f"{kind} {ms:.1f}" for kind, ms in breakdown(trace).items() if ms >= 0.05)
+        print(f"\n{trace['duration_ms']:8.1f} мс  {trace['name']}  update {trace.get('update_id')}  "
+              f"user {trace.get('user_id')}  {'/'.join(handlers) or '—'}  [{trace['trace_id']}]")
+        print(f"           {parts}")
+        counts = defaultdict(int)
+        for span in trace["spans"]:
+            counts[span["kind"]] += 1
+        print("           спанов: " + ", ".join(f"{kind} {n}" for kind, n in counts.items())
+              + (f", отброшено {trace['dropped_spans']}" if trace.get("dropped_spans") else ""))
+        spans = trace["spans"] if args.spans else sorted(
+            (span for span in trace["spans"] if span["kind"] != "handler"), key=lambda s: -s["duration_ms"],
+        )[:3]
+        for span in spans:
+            error = f"  ! {span['error']}" if span.get("error") else ""
+            print(f"           +{span['start_ms']:7.1f} {span['duration_ms']:7.1f} мс  {span['kind']:<8} {span['name']}{error}")
+
+
+if __name__ == "__main__":
+    main()